@@ -1,386 +1,272 @@
-from flask import Flask, render_template, request, jsonify, send_file, make_response
+from flask import Flask, Response, g, render_template, request, jsonify, make_response, url_for
 import requests
-from bs4 import BeautifulSoup
 import os
-import io
-import zipfile
-import csv
-from functools import lru_cache
+import re
 import json
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import pdfplumber
-from urllib.parse import urljoin
+import sqlite3
+import threading
+from itertools import islice
+from urllib.parse import urlsplit
+from driver_pool import driver_pool, wait_for_selector
+from render_memory import RenderMemory, STATIC, DYNAMIC
+import http_client
+from host_limiter import asset_limiter, host_limiter
+import metrics
+from page_cache import page_cache
+from parsing import parse
+from extractors import (
+    TABLE_TAGS, IMAGE_TAGS, VIDEO_TAGS, HEADLINE_TAGS, PDF_LINK_TAGS,
+    iter_images, image_selector, iter_videos, iter_headlines, iter_pdf_links,
+    movie_search_url, extract_movie_link, extract_movie_details,
+    book_search_url, extract_book_result, extract_book_description, item_limit, table_filters,
+)
+from tables import iter_tables, parse_indexes
+from image_probe import filter_images, probe_formats
+from headlines import NEWS_AGGREGATE_MAX_URLS, aggregate, score_headlines
+from exports import HAS_PYARROW, TABLE_FORMATS, stream_image_zip, table_export
+from batch import BATCH_MAX_JOBS, positive_int, run_batch, stream_ndjson
+from jobs import JobQueue, QueueFull
+from delivery import Deliverer
+from scheduler import Scheduler
+from result_store import ResultStore, new_result_id
+from crawl import CrawlManager
+from lookups import LOOKUP_MAX_NAMES, LookupCache, is_enabled
+from pdf_extract import download_pdf, read_pdf_info, parse_page_ranges, iter_page_text, remove_pdf, stream_pdf_ndjson
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@app.before_request
+def start_request_trace():
+    start_background_services()
+    g.trace_token = metrics.start_trace()
+
+@app.after_request
+def add_server_timing(response):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        timing = metrics.finish_trace(token)
+        if timing:
+            response.headers['Server-Timing'] = timing
+    return response
+
 # Add configuration for rate limiting and caching ---
 # from flask_limiter import Limiter
 # from flask_limiter.util import get_remote_address
 # limiter = Limiter(get_remote_address, app=app, default_limits=["100 per day", "10 per hour"])
 
 
-# Cached scraping functions
-@lru_cache(maxsize=100)
-def scrape_tables_cached(url):
-    return scrape_tables(url)
-
-def scrape_tables(url):
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        tables = soup.find_all('table')
-        table_data = []
-        for table in tables:
-            rows = table.find_all('tr')
-            table_rows = [[col.text.strip() for col in row.find_all( 'td')] for row in rows if row.find_all( 'td')]
-            if table_rows:
-                table_data.append(table_rows)
-        return table_data
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching {url}: {e}")
-        return None
+render_memory = RenderMemory()
 
-def scrape_images(url, image_format):
+def _fetch_soup(url, only):
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        # Include both <img> and <image> tags
-        images = soup.find_all(['img', 'image'])
-        allowed_formats = {
-            'png': ['.png'],
-            'jpg': ['.jpg', '.jpeg'],
-            'webp': ['.webp'],
-            'gif': ['.gif'],
-            'all': ['.png', '.jpg', '.jpeg', '.webp', '.gif']
-        }
-        image_data = {}  # Use a dict to deduplicate by URL
-        
-        for img in images:
-            # Check multiple attributes for image source
-            img_url = img.get('src') or img.get('data-src') or img.get('data-lazy-src')
-            if img_url and any(img_url.lower().endswith(ext) for ext in allowed_formats[image_format]):
-                full_url = urljoin(url, img_url)
-                # Look for a parent figure tag and extract figcaption
-                caption = None
-                figure = img.find_parent('figure')
-                if figure:
-                    figcaption = figure.find('figcaption')
-                    if figcaption:
-                        caption = figcaption.get_text(strip=True)
-                # Fallback to alt attribute or filename
-                if not caption:
-                    caption = img.get('alt') or os.path.basename(full_url)
-                # Deduplicate by URL
-                image_data[full_url] = caption
-        
-        if not image_data:  # Fallback to Selenium for dynamic content
-            logger.info(f"No images found with BS4 at {url}, trying Selenium")
-            chrome_options = Options()
-            chrome_options.add_argument("--headless")
-            driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-            driver.get(url)
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.TAG_NAME, "img")))
-            soup = BeautifulSoup(driver.page_source, 'html.parser')
-            images = soup.find_all(['img', 'image'])
-            for img in images:
-                img_url = img.get('src') or img.get('data-src') or img.get('data-lazy-src')
-                if img_url and any(img_url.lower().endswith(ext) for ext in allowed_formats[image_format]):
-                    full_url = urljoin(url, img_url)
-                    caption = None
-                    figure = img.find_parent('figure')
-                    if figure:
-                        figcaption = figure.find('figcaption')
-                        if figcaption:
-                            caption = figcaption.get_text(strip=True)
-                    if not caption:
-                        caption = img.get('alt') or os.path.basename(full_url)
-                    image_data[full_url] = caption
-            driver.quit()
-        
-        # Return tuple of (url, caption) pairs
-        return tuple((url, caption) for url, caption in image_data.items()) if image_data else None
+        return page_cache.fetch(url).soup(only=only)
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching {url}: {e}")
         return None
 
+def iter_scraped_tables(url, with_headers=False, selector=None, indexes=None):
+    # A selector may refer to elements around the tables, so the whole page is parsed for it
+    soup = _fetch_soup(url, None if selector else TABLE_TAGS)
+    if soup is not None:
+        yield from metrics.timed_iter('extract', iter_tables(soup, with_headers, selector, indexes))
 
-def scrape_movie_details(movie_name):
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36"
-    }
+def scrape_tables(url, with_headers=False, limit=None, selector=None, indexes=None):
+    soup = _fetch_soup(url, None if selector else TABLE_TAGS)
+    if soup is None:
+        return None
+    return list(islice(metrics.timed_iter('extract', iter_tables(soup, with_headers, selector, indexes)), limit))
+
+def _iter_page_images(url, image_format, include_unknown=False):
+    """Yield (url, caption) pairs, falling back to Selenium only if the static page has no images at all."""
+    soup = _fetch_soup(url, IMAGE_TAGS)
+    if soup is None:
+        return
+    found = False
+    for image in metrics.timed_iter('extract', iter_images(soup, url, image_format, include_unknown)):
+        if not found:
+            found = True
+            render_memory.record(url, 'image', STATIC)
+        yield image
+    if found:
+        return
+
+    # Image tags in the static page mean it is not rendered by JavaScript,
+    # even if none of them match the requested format
+    if soup.find(['img', 'image']):
+        render_memory.record(url, 'image', STATIC)
+    elif render_memory.needs_browser(url, 'image'):  # Fallback to Selenium for dynamic content
+        logger.info(f"No images found with BS4 at {url}, trying Selenium")
+        metrics.record_browser_fallback()
+        with host_limiter.slot(url), driver_pool.driver() as driver:
+            driver.get(url)
+            wait_for_selector(driver, image_selector(image_format))
+            soup = parse(driver.page_source, only=IMAGE_TAGS)
+        for image in iter_images(soup, url, image_format, include_unknown):
+            if not found:
+                found = True
+                render_memory.record(url, 'image', DYNAMIC)
+            yield image
+        if not found:
+            render_memory.record(url, 'image', STATIC)
+
+def iter_scraped_images(url, image_format, probe=None):
+    """Yield (url, caption) pairs; with ``probe`` filters (see _probe_filters) the format and
+    size checks use each image's real content instead of its URL."""
+    if probe is None:
+        yield from _iter_page_images(url, image_format)
+        return
+    images = _iter_page_images(url, image_format, include_unknown=True)
+    yield from metrics.timed_iter('probe', filter_images(images, probe_formats(image_format), **probe))
+
+def scrape_images(url, image_format, limit=None, probe=None):
+    # Return tuple of (url, caption) pairs
+    return tuple(islice(iter_scraped_images(url, image_format, probe), limit)) or None
+
+
+def scrape_movie_details(movie_name, movie_url=None):
     try:
-        # IMDb search URL
-        search_url = f"https://www.imdb.com/find?q={movie_name.replace(' ', '+')}&ref_=nv_sr_sm"
-        search_response = requests.get(search_url, headers=headers, timeout=10)
-        search_response.raise_for_status()
-        
-        search_soup = BeautifulSoup(search_response.content, 'html.parser')
-        first_result = search_soup.select_one('.ipc-metadata-list-summary-item a')
-        if not first_result:
+        # A previously resolved title page lets us skip the search request
+        if not movie_url:
+            search_soup = page_cache.fetch(movie_search_url(movie_name)).soup()
+            movie_url = extract_movie_link(search_soup)
+        if not movie_url:
             return {"error": "No movie found with that name."}
-        
-        movie_url = "https://www.imdb.com" + first_result.get('href', '')
-        movie_response = requests.get(movie_url, headers=headers, timeout=10)
-        movie_response.raise_for_status()
-        
-        soup = BeautifulSoup(movie_response.content, 'html.parser')
-        
-        # Extracting Title
-        title_elem = soup.select_one('h1')
-        title = title_elem.text.strip() if title_elem else "N/A"
-        
-        # Extracting Poster URL
-        poster_elem = soup.select_one('img.ipc-image')
-        poster_url = poster_elem.get('src', "N/A") if poster_elem else "N/A"
-        
-        # Extracting Year
-        year_elem = soup.select_one('a[href*="/releaseinfo"]')
-        year = year_elem.text.strip() if year_elem else "N/A"
-        
-        # Extracting Rating
-        rating_elem = soup.select_one('div[data-testid="hero-rating-bar__aggregate-rating__score"] span')
-        rating = f"{rating_elem.text.strip()}/10" if rating_elem else "N/A"
-        
-        # Extracting Plot (more specific and avoiding duplicates)
-        plot_elem = soup.select_one('span[data-testid="plot-xl"]')
-        plot = plot_elem.text.strip() if plot_elem else "N/A"
-        
-        # Extracting Genresss (Multiple if available)
-        genre_elems = soup.select('.ipc-chip__text')
-        genres = [genre.text.strip() for genre in genre_elems] if genre_elems else ["N/A"]
-        
-        runtime_elem = soup.select_one('li[data-testid="title-techspec_runtime"] div')
-        runtime = runtime_elem.text.strip() if runtime_elem else "N/A"
-
-        return {
-            "name": title,
-            "poster_url": poster_url,
-            "year": year,
-            "rating": rating,
-            "plot": plot,
-            "genre": ', '.join(genres),
-            "movie_link": movie_url
-        }
-        
+        soup = page_cache.fetch(movie_url).soup()
+        return extract_movie_details(soup, movie_url)
     except requests.exceptions.RequestException as e:
         return {"error": f"Network error: {e}"}
     except Exception as e:
         return {"error": f"An unexpected error occurred: {e}"}
 
 def scrape_book_details(book_name):
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/91.0.4472.124"}
     try:
         # Step 1: Search OpenLibrary for the book
-        search_url = f"https://openlibrary.org/search?q={book_name.replace(' ', '+')}&mode=everything"
-        search_response = requests.get(search_url, headers=headers, timeout=10)
-        search_response.raise_for_status()
-        search_soup = BeautifulSoup(search_response.content, 'html.parser')
-        first_result = search_soup.select_one('li.searchResultItem')
-        if not first_result:
+        search_soup = page_cache.fetch(book_search_url(book_name)).soup()
+        book_data, detail_url = extract_book_result(search_soup)
+        if not book_data:
             return {"error": "No book found with that name."}
-        
-        # Extract basic details from search result
-        title_elem = first_result.select_one('h3.booktitle a')
-        title = title_elem.text.strip() if title_elem else "N/A"
-
-        cover_elem = first_result.select_one('span.bookcover img')
-        cover_url = "https:" + cover_elem['src'] if cover_elem else "N/A"
-
-        author_elem = first_result.select_one('span.bookauthor a')
-        author = author_elem.text.strip() if author_elem else "N/A"
-
-        year_elem = first_result.select_one('span.resultDetails span')
-        year = year_elem.text.strip().replace("First published in ", "") if year_elem else "N/A"
-
-        rating_elem = first_result.select_one('span.ratingsByline span[itemprop="ratingValue"]')
-        rating = rating_elem.text.strip() if rating_elem else "N/A"
-
         # Step 2: Follow the link to the detail page for description
-        book_link = first_result.select_one('h3.booktitle a')['href']
-        detail_url = f"https://openlibrary.org{book_link}"
-        detail_response = requests.get(detail_url, headers=headers, timeout=10)
-        detail_response.raise_for_status()
-        detail_soup = BeautifulSoup(detail_response.content, 'html.parser')
-        
-        description_elem = detail_soup.select_one('div.read-more__content')
-        if description_elem:
-            paragraphs = [p.text.strip() for p in description_elem.find_all('p') if not p.find('a')]
-            description = " ".join(paragraphs) if paragraphs else "N/A"
-        else:
-            description = "N/A"
-
-        return {
-            "name": title,
-            "cover_url": cover_url,
-            "author": author,
-            "year": year,
-            "rating": rating,
-            "description": description,
-            "book_link": detail_url # Add the detail URL to the response
-        }
+        detail_soup = page_cache.fetch(detail_url).soup()
+        book_data["description"] = extract_book_description(detail_soup)
+        book_data["book_link"] = detail_url # Add the detail URL to the response
+        return book_data
     except requests.exceptions.RequestException as e:
         return {"error": f"Network error: {e}"}
     except Exception as e:
         return {"error": f"An error occurred: {e}"}
 
-def scrape_videos(url, video_format):
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        videos = soup.find_all('video')
-        video_data = {}  # Use a dict to deduplicate by URL
-        
-        for video in videos:
-            video_sources = video.find_all('source')
-            caption = None
-            # Look for a parent figure tag and extract figcaption
-            figure = video.find_parent('figure')
-            if figure:
-                figcaption = figure.find('figcaption')
-                if figcaption:
-                    caption = figcaption.get_text(strip=True)
-            
-            # Take the first valid source per video tag
-            for source in video_sources:
-                video_url = source.get('src')
-                if video_url:
-                    if video_format != 'all' and not video_url.endswith(video_format):
-                        continue
-                    if not video_url.startswith('http'):
-                        base_url = url.rsplit('/', 1)[0]
-                        video_url = urljoin(base_url, video_url)  # Use urljoin for proper URL construction
-                    
-                    # Use caption if found, else infer from URL or title attribute
-                    if not caption:
-                        caption = source.get('title') or os.path.basename(video_url)
-                    
-                    # Add to dict to deduplicate (URL as key)
-                    video_data[video_url] = caption
-                    break  # Stop after the first valid source for this video
-        
-        # Convert dict to list of tuples
-        return tuple((url, caption) for url, caption in video_data.items())
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching {url}: {e}")
-        return None
+def iter_scraped_videos(url, video_format):
+    soup = _fetch_soup(url, VIDEO_TAGS)
+    if soup is not None:
+        yield from metrics.timed_iter('extract', iter_videos(soup, url, video_format))
 
-def scrape_ebay_product(product_name):
+def scrape_videos(url, video_format, limit=None):
+    soup = _fetch_soup(url, VIDEO_TAGS)
+    if soup is None:
+        return None
+    return tuple(islice(metrics.timed_iter('extract', iter_videos(soup, url, video_format)), limit))
+
+def _iter_ebay_listings(soup):
+    product_listings = soup.select('li.s-item.s-item__pl-on-bottom')
+    if not product_listings:
+        logger.warning("No product listings found with standard selector, trying fallback.")
+        product_listings = soup.select('li[data-viewport]')
+    for product in product_listings[2:]:
+        try:
+            title_elem = product.select_one('.s-item__title')
+            title = title_elem.text.strip() if title_elem else "N/A"
+            link_elem = product.select_one('a.s-item__link')
+            link = link_elem['href'] if link_elem else "N/A"
+            image_elem = product.select_one('img')
+            image_url = image_elem.get('src') if image_elem else "https://via.placeholder.com/150?text=No+Image"
+            price_elem = product.select_one('.s-item__price')
+            price = price_elem.text.strip() if price_elem else "N/A"
+            rating_elem = product.select_one('.s-item__reviews')
+            rating = rating_elem.text.strip() if rating_elem else "N/A"
+            if title != "N/A" and link != "N/A":
+                yield {
+                    "title": title,
+                    "link": link,
+                    "image_url": image_url,
+                    "price": price,
+                    "rating": rating
+                }
+        except AttributeError as e:
+            logger.error(f"Error parsing product: {e}")
+            continue
+
+def iter_ebay_products(product_name):
     search_url = f"https://www.ebay.com/sch/i.html?_nkw={product_name.replace(' ', '+')}&_sop=12"
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
     try:
-        driver.get(search_url)
-        WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.CSS_SELECTOR, 'li.s-item')))
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
-        product_details = []
-        product_listings = soup.select('li.s-item.s-item__pl-on-bottom')
-        if not product_listings:
-            logger.warning("No product listings found with standard selector, trying fallback.")
-            product_listings = soup.select('li[data-viewport]')
-        for product in product_listings[2:]:
-            try:
-                title_elem = product.select_one('.s-item__title')
-                title = title_elem.text.strip() if title_elem else "N/A"
-                link_elem = product.select_one('a.s-item__link')
-                link = link_elem['href'] if link_elem else "N/A"
-                image_elem = product.select_one('img')
-                image_url = image_elem.get('src') if image_elem else "https://via.placeholder.com/150?text=No+Image"
-                price_elem = product.select_one('.s-item__price')
-                price = price_elem.text.strip() if price_elem else "N/A"
-                rating_elem = product.select_one('.s-item__reviews')
-                rating = rating_elem.text.strip() if rating_elem else "N/A"
-                if title != "N/A" and link != "N/A":
-                    product_details.append({
-                        "title": title,
-                        "link": link,
-                        "image_url": image_url,
-                        "price": price,
-                        "rating": rating
-                    })
-            except AttributeError as e:
-                logger.error(f"Error parsing product: {e}")
-                continue
-        if not product_details:
-            logger.error("No valid products parsed from eBay.")
-            return None
-        logger.info(f"Scraped {len(product_details)} products from eBay for '{product_name}'")
-        return product_details
+        with host_limiter.slot(search_url), driver_pool.driver() as driver:
+            driver.get(search_url)
+            wait_for_selector(driver, 'li.s-item')
+            soup = parse(driver.page_source)
     except Exception as e:
         logger.error(f"Error fetching eBay with Selenium: {e}")
+        return
+    yield from _iter_ebay_listings(soup)
+
+def scrape_ebay_product(product_name, limit=None):
+    product_details = list(islice(iter_ebay_products(product_name), limit))
+    if not product_details:
+        logger.error("No valid products parsed from eBay.")
         return None
-    finally:
-        driver.quit()
+    logger.info(f"Scraped {len(product_details)} products from eBay for '{product_name}'")
+    return product_details
 
-def scrape_news_headlines(url):
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/91.0.4472.124"}
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        headlines = soup.find_all(['h1', 'h2', 'h3'])
-        if not headlines:
-            headlines = soup.find_all('a', class_=lambda x: x and ('excerpt' in x.lower() or 'title' in x.lower() or 'headline' in x.lower()))
-        if not headlines:
-            headlines = soup.find_all('a')
-        def is_valid_headline(text):
-            if len(text) < 15 or any(phrase.lower() in text.lower() for phrase in ['home', 'about', 'contact', 'login', 'register']):
-                return False
-            return True
-        headline_texts = []
-        for headline in headlines:
-            text = headline.get_text().strip()
-            if text and is_valid_headline(text) and text not in headline_texts:
-                headline_texts.append(text)
-        return tuple(headline_texts) if headline_texts else None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching {url}: {e}")
+def iter_scraped_headlines(url):
+    soup = _fetch_soup(url, HEADLINE_TAGS)
+    if soup is not None:
+        yield from metrics.timed_iter('extract', iter_headlines(soup))
+
+def scrape_news_headlines(url, limit=None):
+    return tuple(islice(iter_scraped_headlines(url), limit)) or None
+
+def scrape_scored_headlines(url):
+    soup = _fetch_soup(url, HEADLINE_TAGS)
+    if soup is None:
         return None
+    with metrics.span('extract'):
+        return score_headlines(soup)
+
+def _charset(headers):
+    match = re.search(r'charset=["\']?([\w.:-]+)', headers.get('Content-Type', ''), re.I)
+    return match.group(1) if match else None
 
-def scrape_pdf_links(url):
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/91.0.4472.124"}
+def iter_scraped_pdf_links(url):
+    """Yield PDF links from the raw page, which is scanned only as far as the consumer reads;
+    Selenium runs only when the page has none and the host is not known to be static."""
     try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        pdf_links = []
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            if href.lower().endswith('.pdf') and href.startswith(('http://', 'https://')):
-                pdf_name = href.split('/')[-1].split('?')[0]
-                pdf_links.append({'url': href, 'name': pdf_name})
-        if pdf_links:
-            seen_urls = set()
-            unique_pdf_links = [link for link in pdf_links if not (link['url'] in seen_urls or seen_urls.add(link['url']))]
-            return unique_pdf_links
+        page = page_cache.fetch(url)
     except requests.exceptions.RequestException as e:
         logger.error(f"BS4 request failed: {e}")
-
+    else:
+        found = False
+        for link in metrics.timed_iter('extract', iter_pdf_links(page.content, _charset(page.headers))):
+            if not found:
+                found = True
+                render_memory.record(url, 'pdf', STATIC)
+            yield link
+        if found:
+            return
+
+    if not render_memory.needs_browser(url, 'pdf'):
+        logger.info(f"No PDFs found at {url}; the host renders statically, skipping Selenium")
+        return
+    yield from _browser_pdf_links(url)
+
+def _browser_pdf_links(url):
     logger.info("No PDFs found with BS4, falling back to Selenium")
-    options = Options()
-    options.add_argument("--headless")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
+    metrics.record_browser_fallback()
     try:
-        driver.get(url)
-        WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.TAG_NAME, "a")))
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        with host_limiter.slot(url), driver_pool.driver() as driver:
+            driver.get(url)
+            wait_for_selector(driver, 'a[href$=".pdf" i]')
+            soup = parse(driver.page_source, only=PDF_LINK_TAGS)
         pdf_links = []
         for link in soup.find_all('a', href=True):
             href = link['href']
@@ -392,31 +278,184 @@ def scrape_pdf_links(url):
                 pdf_links.append({'url': href, 'name': pdf_name})
         seen_urls = set()
         unique_pdf_links = [link for link in pdf_links if not (link['url'] in seen_urls or seen_urls.add(link['url']))]
-        return unique_pdf_links if unique_pdf_links else None
+        render_memory.record(url, 'pdf', DYNAMIC if unique_pdf_links else STATIC)
+        return unique_pdf_links
     except Exception as e:
         logger.error(f"Error fetching PDFs with Selenium: {e}")
+        return []
+
+def scrape_pdf_links(url, limit=None):
+    return list(islice(iter_scraped_pdf_links(url), limit)) or None
+
+movie_lookups = LookupCache(scrape_movie_details, 'movie_link')
+# OpenLibrary detail pages lack the search result fields, so books always search again
+book_lookups = LookupCache(lambda name, detail_url: scrape_book_details(name), 'book_link')
+
+def _probe_filters(options):
+    """Size filters for image probing, or None unless ``probe`` or one of the filters is set."""
+    filters = {name: positive_int(options, name) for name in ('min_width', 'min_height', 'min_size')}
+    if not is_enabled(options.get('probe')) and not any(filters.values()):
         return None
-    finally:
-        driver.quit()
+    return filters
+
+# Maps each data_type to a callable taking the target and an options mapping
+SCRAPERS = {
+    'table': lambda url, options: scrape_tables(url, limit=item_limit(options), **table_filters(options)),
+    'image': lambda url, options: scrape_images(url, options.get('image_format', 'all'), item_limit(options),
+                                                _probe_filters(options)),
+    'movie': lambda url, options: movie_lookups.get(url, is_enabled(options.get('stale_while_revalidate'))),
+    'pdf': lambda url, options: scrape_pdf_links(url, item_limit(options)),
+    'book': lambda url, options: book_lookups.get(url, is_enabled(options.get('stale_while_revalidate'))),
+    'video': lambda url, options: scrape_videos(url, options.get('video_format', 'all'), item_limit(options)),
+    'ebay': lambda url, options: scrape_ebay_product(url, item_limit(options)),
+    'news': lambda url, options: scrape_news_headlines(url, item_limit(options)),
+}
+
+# Data types whose results can be produced one item at a time
+ITEM_SCRAPERS = {
+    'table': lambda url, options: iter_scraped_tables(url, **table_filters(options)),
+    'image': lambda url, options: iter_scraped_images(url, options.get('image_format', 'all'), _probe_filters(options)),
+    'pdf': lambda url, options: iter_scraped_pdf_links(url),
+    'video': lambda url, options: iter_scraped_videos(url, options.get('video_format', 'all')),
+    'ebay': lambda url, options: iter_ebay_products(url),
+    'news': lambda url, options: iter_scraped_headlines(url),
+}
+
+def run_scrape(data_type, url, options=None):
+    scraper = SCRAPERS.get(data_type)
+    if scraper is None:
+        raise ValueError(f"Invalid data type '{data_type}'")
+    options = options or {}
+    # profile=1 only takes effect when the operator allows it, as every report is written to disk
+    profile = metrics.PROFILE_ON_REQUEST and is_enabled(options.get('profile'))
+    with metrics.scrape_scope(data_type, url), metrics.profiled(profile):
+        return scraper(url, options)
+
+def _lookup_record(data_type, url, options):
+    record = SCRAPERS[data_type](url, options)
+    if "error" in record:
+        raise LookupError(record["error"])
+    yield record
+
+def iter_scrape(data_type, url, options=None):
+    """Yield scraped items as they are found, stopping after ``num_items``; movie and book
+    lookups yield their single record."""
+    options = options or {}
+    item_scraper = ITEM_SCRAPERS.get(data_type)
+    if item_scraper is None:
+        items = _lookup_record(data_type, url, options)
+    else:
+        items = islice(item_scraper(url, options), item_limit(options))
+    return metrics.scoped_iter(data_type, url, items)
+
+def _limit(items, num_items):
+    num_items = num_items or len(items)
+    return items[:min(int(num_items), len(items))]
+
+def scrape_result(data_type, data, num_items=None, options=None):
+    """Shape the output of run_scrape into the /scrape response payload."""
+    options = options or {}
+    if data_type == 'table':
+        if data:
+            return {'success': True, 'tables': data}
+        return {'success': False, 'error': 'No tables found.'}
+
+    elif data_type == 'image':
+        if data:
+            images = _limit(data, num_items)
+            return {'success': True, 'images': list(images), 'image_format': options.get('image_format', 'all'), 'total': len(images)}
+        return {'success': False, 'error': 'No images found or failed to fetch URL'}
+
+    elif data_type == 'movie':
+        if "error" in data:
+            return {'success': False, 'error': data["error"]}
+        return {'success': True, 'movie_data': data}
+
+    elif data_type == 'book':
+        if "error" in data:
+            return {'success': False, 'error': data["error"]}
+        return {'success': True, 'book_data': data}
+
+    elif data_type == 'video':
+        if data:
+            videos = _limit(data, num_items)
+            return {'success': True, 'videos': list(videos), 'video_format': options.get('video_format', 'all'), 'total': len(videos)}
+        return {'success': False, 'error': 'No videos found.'}
+
+    elif data_type == 'ebay':
+        if data:
+            product_details = _limit(data, num_items)
+            return {'success': True, 'product_details': product_details, 'total': len(product_details)}
+        return {'success': False, 'error': 'No products found on eBay.'}
+
+    elif data_type == 'news':
+        if data:
+            headlines = _limit(data, num_items)
+            return {'success': True, 'headlines': list(headlines), 'total': len(headlines)}
+        return {'success': False, 'error': 'No headlines found.'}
+
+    elif data_type == 'pdf':
+        if data:
+            pdf_links = _limit(data, num_items)
+            return {'success': True, 'pdf_links': pdf_links, 'total': len(pdf_links)}
+        return {'success': False, 'error': 'No PDFs found.'}
+
+    return {'success': False, 'error': 'Invalid data type'}
+
+deliveries = Deliverer()
+job_queue = JobQueue(run_scrape, deliver=deliveries.enqueue)
+scheduler = Scheduler(run_scrape, SCRAPERS, deliver=deliveries.enqueue)
+crawl_manager = CrawlManager()
+result_store = ResultStore()
+
+_services_pid = None
+_services_lock = threading.Lock()
+
+def start_background_services():
+    """Start the driver pool, webhook deliveries, job queue, crawl resumption and the
+    scheduler, and purge expired results, once per process.
+
+    Called from gunicorn's post_fork hook, and lazily on the first request otherwise,
+    so a preloading master never starts threads that would not survive the fork.
+    """
+    global _services_pid
+    if _services_pid == os.getpid():
+        return
+    with _services_lock:
+        if _services_pid == os.getpid():
+            return
+        _services_pid = os.getpid()
+    # Only starts Chrome when CHROME_PREWARM is set
+    driver_pool.start()
+    deliveries.start()
+    job_queue.start()
+    crawl_manager.resume()
+    scheduler.start()
+    result_store.purge()
 
 @app.route('/extract_pdf_info', methods=['POST'])
 def extract_pdf_info():
     pdf_url = request.form.get('pdf_url')
+    page_spec = request.form.get('pages')
+    stream = request.form.get('format') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
     try:
-        response = requests.get(pdf_url, timeout=10)
-        response.raise_for_status()
-        with open('temp.pdf', 'wb') as f:
-            f.write(response.content)
-        with pdfplumber.open('temp.pdf') as pdf:
-            text = "".join(page.extract_text() or "" for page in pdf.pages)
-            metadata = pdf.metadata or {}
-            title = metadata.get('Title', 'N/A')
-            author = metadata.get('Author', 'N/A')
-            page_count = len(pdf.pages)
-        os.remove('temp.pdf')
-        return jsonify({'success': True, 'text': text, 'title': title, 'author': author, 'page_count': page_count})
+        path = download_pdf(pdf_url)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
+    if stream:
+        response = Response(stream_pdf_ndjson(path, page_spec), mimetype='application/x-ndjson')
+        response.call_on_close(lambda: remove_pdf(path))
+        return response
+    try:
+        info = read_pdf_info(path)
+        page_indexes = parse_page_ranges(page_spec, info['page_count'])
+        text = "".join(page_text for _, page_text in iter_page_text(path, page_indexes))
+        return jsonify({'success': True, 'text': text, **info})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+    finally:
+        os.remove(path)
+
 @app.route('/send_to_api', methods=['POST'])
 # @limiter.limit("5 per minute")
 def send_to_api():
@@ -427,177 +466,414 @@ def send_to_api():
 
     if not api_link:
         return jsonify({'success': False, 'error': 'API link is required'})
+    # Check the destination before spending a scrape on it
+    parts = urlsplit(api_link)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return jsonify({'success': False, 'error': 'API link must be a http(s) URL'}), 400
 
     scrape_data = None
+    if data_type in SCRAPERS:
+        try:
+            scrape_data = run_scrape(data_type, url, request.form)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)})
 
-    if data_type == 'table':
-        scrape_data = scrape_tables_cached(url)
+    if not scrape_data:
+        return jsonify({'success': False, 'error': 'No data found.'})
 
-    elif data_type == 'image':
-        image_format = request.form.get('image_format', 'all')
-        scrape_data = scrape_images(url, image_format)
+    try:
+        delivery_id = deliveries.enqueue(api_link, scrape_data)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to queue delivery to {api_link}: {e}")
+        return jsonify({'success': False, 'error': 'Could not queue the delivery'})
+    return jsonify({'success': True, 'message': 'Data queued for delivery to the API.', 'delivery_id': delivery_id,
+                    'status_url': url_for('delivery_status', delivery_id=delivery_id)})
+
+@app.route('/deliveries/<delivery_id>')
+def delivery_status(delivery_id):
+    delivery = deliveries.get(delivery_id)
+    if delivery is None:
+        return jsonify({'success': False, 'error': 'Delivery not found'}), 404
+    return jsonify({'success': True, 'delivery': delivery})
+@app.route('/scrape/batch', methods=['POST'])
+def scrape_batch():
+    payload = request.get_json(silent=True)
+    jobs = payload.get('jobs') if isinstance(payload, dict) else payload
+    if not isinstance(jobs, list) or not jobs:
+        return jsonify({'success': False, 'error': 'Expected a JSON list of jobs'}), 400
+    if len(jobs) > BATCH_MAX_JOBS:
+        return jsonify({'success': False, 'error': f'At most {BATCH_MAX_JOBS} jobs per batch'}), 400
+    for job in jobs:
+        if not isinstance(job, dict) or not job.get('url') or job.get('data_type') not in SCRAPERS:
+            return jsonify({'success': False, 'error': f'Invalid job: {job}'}), 400
+        if not isinstance(job.get('options') or {}, dict):
+            return jsonify({'success': False, 'error': f'Invalid job options, expected an object: {job}'}), 400
+    return Response(stream_ndjson(run_batch(jobs, run_scrape)), mimetype='application/x-ndjson')
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        options = payload.get('options') or {}
+    else:
+        payload = request.form
+        options = {key: value for key, value in request.form.items() if key not in ('url', 'data_type', 'webhook')}
+    url = payload.get('url')
+    data_type = payload.get('data_type')
+    if not url or data_type not in SCRAPERS:
+        return jsonify({'success': False, 'error': 'A url and a valid data_type are required'}), 400
+    if not isinstance(options, dict):
+        return jsonify({'success': False, 'error': 'options must be an object'}), 400
+    webhook = payload.get('webhook') or None
+    if webhook is not None:
+        parts = urlsplit(webhook) if isinstance(webhook, str) else None
+        if parts is None or parts.scheme not in ('http', 'https') or not parts.hostname:
+            return jsonify({'success': False, 'error': 'webhook must be a http(s) URL'}), 400
+    try:
+        job_id = job_queue.submit(data_type, url, options, webhook)
+    except QueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 429
+    return jsonify({'success': True, 'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/lookup', methods=['POST'])
+def lookup():
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+    data_type = payload.get('data_type')
+    names = payload.get('names')
+    if data_type not in ('movie', 'book'):
+        return jsonify({'success': False, 'error': "data_type must be 'movie' or 'book'"}), 400
+    if not isinstance(names, list) or not names or not all(isinstance(name, str) and name.strip() for name in names):
+        return jsonify({'success': False, 'error': 'Expected a non-empty list of names'}), 400
+    if len(names) > LOOKUP_MAX_NAMES:
+        return jsonify({'success': False, 'error': f'At most {LOOKUP_MAX_NAMES} names per lookup'}), 400
+    cache = movie_lookups if data_type == 'movie' else book_lookups
+    records = cache.get_many(names, is_enabled(payload.get('stale_while_revalidate')))
+    return jsonify({'success': True, 'results': [{'name': name, 'data': record} for name, record in records]})
+
+def _scored_headlines_job(data_type, url, options):
+    with metrics.scrape_scope(data_type, url):
+        return scrape_scored_headlines(url)
+
+@app.route('/news/aggregate', methods=['POST'])
+def aggregate_news():
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+    urls = payload.get('urls')
+    limit = payload.get('limit')
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url.strip() for url in urls):
+        return jsonify({'success': False, 'error': 'Expected a non-empty list of urls'}), 400
+    if len(urls) > NEWS_AGGREGATE_MAX_URLS:
+        return jsonify({'success': False, 'error': f'At most {NEWS_AGGREGATE_MAX_URLS} urls per aggregation'}), 400
+    if limit is not None and (not isinstance(limit, int) or limit < 1):
+        return jsonify({'success': False, 'error': 'limit must be a positive integer'}), 400
+    jobs = [{'url': url, 'data_type': 'news'} for url in dict.fromkeys(urls)]
+    # Merge in request order so ties rank the same however the fetches finish
+    results = sorted(run_batch(jobs, _scored_headlines_job), key=lambda result: result['index'])
+    feed = aggregate(((result['url'], result['data']) for result in results if result['success']), limit)
+    sources = [{'url': result['url'], 'success': result['success'], 'total': len(result.get('data') or ()),
+                **({'error': result['error']} if 'error' in result else {})} for result in results]
+    return jsonify({'success': bool(feed), 'headlines': feed, 'total': len(feed), 'sources': sources})
+
+@app.route('/crawl', methods=['POST'])
+def start_crawl():
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+    try:
+        crawl_id = crawl_manager.start(payload)
+    except (TypeError, ValueError, re.error) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'crawl_id': crawl_id, 'status_url': url_for('crawl_status', crawl_id=crawl_id)}), 202
+
+@app.route('/crawl/<crawl_id>')
+def crawl_status(crawl_id):
+    crawl = crawl_manager.get(crawl_id)
+    if crawl is None:
+        return jsonify({'success': False, 'error': 'Crawl not found'}), 404
+    return jsonify({'success': True, 'crawl': crawl})
+
+@app.route('/crawl/<crawl_id>/results')
+def crawl_results(crawl_id):
+    if crawl_manager.get(crawl_id) is None:
+        return jsonify({'success': False, 'error': 'Crawl not found'}), 404
+    return Response(stream_ndjson(crawl_manager.iter_results(crawl_id)), mimetype='application/x-ndjson')
+
+@app.route('/crawl/<crawl_id>/cancel', methods=['POST'])
+def cancel_crawl(crawl_id):
+    if crawl_manager.get(crawl_id) is None:
+        return jsonify({'success': False, 'error': 'Crawl not found'}), 404
+    crawl_manager.cancel(crawl_id)
+    return jsonify({'success': True})
+
+def stream_format(req):
+    """The stream format a /scrape request asks for, or None for a single JSON response."""
+    stream = req.form.get('stream') or req.args.get('stream')
+    if stream:
+        return stream
+    # JSON comes first so it wins ties, e.g. the */* most clients send
+    best = req.accept_mimetypes.best_match(['application/json', 'application/x-ndjson', 'text/event-stream'])
+    return {'application/x-ndjson': 'ndjson', 'text/event-stream': 'sse'}.get(best)
+
+def stream_scrape(items, stream):
+    """Serialize scraped items as they arrive: one JSON object per line for ``ndjson``,
+    ``item``/``end`` events for ``sse``; the last message reports the item count."""
+    def message(event, payload):
+        data = json.dumps(payload)
+        if stream == 'sse':
+            return f'event: {event}\ndata: {data}\n\n'
+        return data + '\n'
+
+    total = 0
+    try:
+        for item in items:
+            yield message('item', {'type': 'item', 'index': total, 'data': item})
+            total += 1
+    except Exception as e:
+        logger.error(f"Streamed scrape failed: {e}")
+        yield message('end', {'type': 'end', 'success': False, 'error': str(e), 'total': total})
+        return
+    yield message('end', {'type': 'end', 'success': total > 0, 'total': total})
 
-    elif data_type == 'movie':
-        scrape_data = scrape_movie_details(url)
+STREAM_MIMETYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
 
-    elif data_type == 'pdf':
-        scrape_data = scrape_pdf_links(url)
-    
-    elif data_type == 'book':
-        scrape_data = scrape_book_details(url)
-    
-    elif data_type == 'video':
-        video_format = request.form.get('video_format', 'all')
-        scrape_data = scrape_videos(url, video_format)
-    
-    elif data_type == 'ebay':
-        scrape_data = scrape_ebay_product(url)
-    
-    elif data_type == 'news':
-        scrape_data = scrape_news_headlines(url)
+def _store_result(data_type, url, options, payload, result_id=None):
+    try:
+        return result_store.save(url, data_type, options, payload, result_id)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to store {data_type} result for {url}: {e}")
+        return None
 
-    if not scrape_data:
-        return jsonify({'success': False, 'error': 'No data found.'})
-    
+def _recorded(items, data_type, url, options, result_id):
+    """Pass streamed items through and store the whole result once the stream ends."""
+    collected = []
     try:
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(api_link, json=scrape_data, headers=headers)
-        response.raise_for_status()
-        return jsonify({'success': True, 'message': 'Data sent to API successfully.'})
-    except requests.exceptions.RequestException as e:
-        return jsonify({'success': False, 'error': str(e)})
+        for item in items:
+            collected.append(item)
+            yield item
+    except Exception as e:
+        _store_result(data_type, url, options, {'success': False, 'error': str(e)}, result_id)
+        raise
+    data = collected[0] if data_type in ('movie', 'book') and collected else collected
+    _store_result(data_type, url, options, scrape_result(data_type, data, None, options), result_id)
+
+# The result store is shared by every client, so each client's history stays in its own
+# cookie, as ids of the stored results
+HISTORY_SIZE = 5
+
+def _history(cookies):
+    """Recent scrapes from the history cookie, newest first."""
+    try:
+        history = json.loads(cookies.get('history', '[]'))
+    except ValueError:
+        return []
+    if not isinstance(history, list):
+        return []
+    # Cookies set by older versions hold [url, data_type] pairs
+    return [item for item in history if isinstance(item, dict)][:HISTORY_SIZE]
+
+def _own_results(cookies):
+    """Ids of the stored results in the history cookie, the only ones a client may list or delete."""
+    return {item['result_id'] for item in _history(cookies) if isinstance(item.get('result_id'), str)}
+
+def _remember(response, history, url, data_type, result_id=None):
+    """Put a scrape at the front of ``history`` and save it in the response's cookie."""
+    history = [{'url': url, 'data_type': data_type, 'result_id': result_id}, *history][:HISTORY_SIZE]
+    response.set_cookie('history', json.dumps(history), max_age=3600 * 24 * 30)
+    return response
+
+def scrape_response(data_type, url, data, options, cookies):
+    """Shape and store a scrape's ``data`` and return the /scrape JSON response, with the
+    scrape added to the history cookie; the ASGI fast path answers through it too."""
+    with metrics.span('serialize', url, data_type):
+        payload = scrape_result(data_type, data, options.get('num_items', type=int), options)
+        payload['result_id'] = _store_result(data_type, url, options.to_dict(), payload)
+        return _remember(jsonify(payload), _history(cookies), url, data_type, payload['result_id'])
+
+@app.route('/schedules', methods=['POST'])
+def add_schedule():
+    payload = request.get_json(silent=True) or {}
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object'}), 400
+    try:
+        schedule_id = scheduler.add(payload)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'schedule_id': schedule_id,
+                    'status_url': url_for('schedule_status', schedule_id=schedule_id)}), 201
+
+@app.route('/schedules')
+def list_schedules():
+    return jsonify({'success': True, 'schedules': scheduler.list()})
+
+@app.route('/schedules/<schedule_id>')
+def schedule_status(schedule_id):
+    schedule = scheduler.get(schedule_id)
+    if schedule is None:
+        return jsonify({'success': False, 'error': 'Schedule not found'}), 404
+    return jsonify({'success': True, 'schedule': schedule})
+
+@app.route('/schedules/<schedule_id>/changes')
+def schedule_changes(schedule_id):
+    if scheduler.get(schedule_id) is None:
+        return jsonify({'success': False, 'error': 'Schedule not found'}), 404
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    return jsonify({'success': True, 'changes': scheduler.changes(schedule_id, after, limit)})
+
+@app.route('/schedules/<schedule_id>', methods=['DELETE'])
+def delete_schedule(schedule_id):
+    if not scheduler.delete(schedule_id):
+        return jsonify({'success': False, 'error': 'Schedule not found'}), 404
+    return jsonify({'success': True})
+
 @app.route('/scrape', methods=['POST'])
 # @limiter.limit("10 per minute")
 def scrape():
     url = request.form.get('url')
     data_type = request.form.get('data_type')
-    num_items = request.form.get('num_items', type=int)
-
-    if data_type == 'table':
-        tables = scrape_tables_cached(url)
-        if tables:
-            return jsonify({'success': True, 'tables': tables})
-        return jsonify({'success': False, 'error': 'No tables found.'})
-
-    elif data_type == 'image':
-        image_format = request.form.get('image_format', 'all')
-        images = scrape_images(url, image_format)
-        if images:
-            num_items = num_items or len(images)
-            images = images[:min(int(num_items), len(images))]
-            return jsonify({'success': True, 'images': list(images), 'image_format': image_format, 'total': len(images)})
-        return jsonify({'success': False, 'error': 'No images found or failed to fetch URL'})
-
-    elif data_type == 'movie':
-        movie_data = scrape_movie_details(url)
-        if "error" in movie_data:
-            return jsonify({'success': False, 'error': movie_data["error"]})
-        return jsonify({'success': True, 'movie_data': movie_data})
-    
-    elif data_type == 'book':
-        book_data = scrape_book_details(url) 
-        if "error" in book_data:
-            return jsonify({'success': False, 'error': book_data["error"]})
-        return jsonify({'success': True, 'book_data': book_data})
-
-    elif data_type == 'video':
-        video_format = request.form.get('video_format', 'all')
-        videos = scrape_videos(url, video_format)
-        if videos:
-            num_items = num_items or len(videos)
-            videos = videos[:min(int(num_items), len(videos))]
-            return jsonify({'success': True, 'videos': list(videos), 'video_format': video_format, 'total': len(videos)})
-        return jsonify({'success': False, 'error': 'No videos found.'})
 
-    elif data_type == 'ebay':
-        product_details = scrape_ebay_product(url)
-        if product_details:
-            num_items = num_items or len(product_details)
-            product_details = product_details[:min(int(num_items), len(product_details))]
-            return jsonify({'success': True, 'product_details': product_details, 'total': len(product_details)})
-        return jsonify({'success': False, 'error': 'No products found on eBay.'})
-
-    elif data_type == 'news':
-        headlines = scrape_news_headlines(url)
-        if headlines:
-            num_items = num_items or len(headlines)
-            headlines = headlines[:min(int(num_items), len(headlines))]
-            return jsonify({'success': True, 'headlines': list(headlines), 'total': len(headlines)})
-        return jsonify({'success': False, 'error': 'No headlines found.'})
+    if data_type not in SCRAPERS:
+        return jsonify({'success': False, 'error': 'Invalid data type'})
+    stream = stream_format(request)
+    if stream:
+        if stream not in STREAM_MIMETYPES:
+            return jsonify({'success': False, 'error': 'Invalid stream format'})
+        try:
+            # Options such as table_index are checked here, before the stream starts
+            items = iter_scrape(data_type, url, request.form)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)})
+        result_id = new_result_id()
+        items = _recorded(items, data_type, url, request.form.to_dict(), result_id)
+        response = Response(stream_scrape(items, stream), mimetype=STREAM_MIMETYPES[stream],
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Result-Id': result_id})
+        return _remember(response, _history(request.cookies), url, data_type, result_id)
+    try:
+        data = run_scrape(data_type, url, request.form)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    return scrape_response(data_type, url, data, request.form, request.cookies)
 
-    elif data_type == 'pdf':
-        pdf_links = scrape_pdf_links(url)
-        if pdf_links:
-            num_items = num_items or len(pdf_links)
-            pdf_links = pdf_links[:min(int(num_items), len(pdf_links))]
-            return jsonify({'success': True, 'pdf_links': pdf_links, 'total': len(pdf_links)})
-        return jsonify({'success': False, 'error': 'No PDFs found.'})
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-    return jsonify({'success': False, 'error': 'Invalid data type'})
+@app.route('/http_stats')
+def http_stats():
+    return jsonify({**http_client.stats(), 'page_cache': page_cache.stats(), 'host_limits': host_limiter.stats(),
+                    'asset_limits': asset_limiter.stats()})
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    history = json.loads(request.cookies.get('history', '[]'))
+    history = _history(request.cookies)
 
     if request.method == 'POST':
         url = request.form.get('url')
         data_type = request.form.get('data_type')
         if url and data_type:
-            history.append((url, data_type))
-            history = history[:5]
-            resp = make_response(render_template('index.html', history=history))
-            resp.set_cookie('history', json.dumps(history), max_age=3600 * 24 * 30)
-            return resp
+            entry = {'url': url, 'data_type': data_type, 'result_id': None}
+            resp = make_response(render_template('index.html', history=[entry, *history][:HISTORY_SIZE], parquet=HAS_PYARROW))
+            return _remember(resp, history, url, data_type)
 
-    return render_template('index.html', history=history)
+    return render_template('index.html', history=history, parquet=HAS_PYARROW)
+
+@app.route('/results')
+def list_results():
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    try:
+        results, next_cursor = result_store.query(
+            url=request.args.get('url'), data_type=request.args.get('data_type'),
+            since=request.args.get('since', type=float), until=request.args.get('until', type=float),
+            cursor=request.args.get('cursor'), limit=max(limit, 1), ids=_own_results(request.cookies))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, 'results': results, 'next_cursor': next_cursor})
+
+@app.route('/results/<result_id>')
+def get_result(result_id):
+    entry = result_store.get(result_id)
+    if entry is None:
+        return jsonify({'success': False, 'error': 'Result not found'}), 404
+    return jsonify({'success': True, **entry})
+
+@app.route('/results/<result_id>', methods=['DELETE'])
+def delete_result(result_id):
+    if result_id not in _own_results(request.cookies) or not result_store.delete(result_id):
+        return jsonify({'success': False, 'error': 'Result not found'}), 404
+    return jsonify({'success': True})
+
+def _stored(result_id, data_type, key):
+    """The ``key`` field of a stored ``data_type`` result, or None."""
+    entry = result_store.get(result_id)
+    if entry is None or entry['data_type'] != data_type:
+        return None
+    return entry['result'].get(key)
 
 @app.route('/export_csv', methods=['POST'])
 def export_csv():
     url = request.form.get('url')
     selected_tables = request.form.getlist('table_number')
-    tables = scrape_tables_cached(url)
+    export_format = request.form.get('format', 'csv')
+    if export_format not in TABLE_FORMATS:
+        return jsonify({'success': False, 'error': f"Invalid format '{export_format}'"})
+    result_id = request.form.get('result_id')
+    if result_id:
+        # Stored /scrape results carry no header row, so columns get generic names
+        stored = _stored(result_id, 'table', 'tables') or []
+        tables = [table if isinstance(table, dict) else {'header': None, 'rows': table} for table in stored]
+    else:
+        # Only the selected tables are read; the numbering matches /scrape's table list
+        try:
+            wanted = sorted(parse_indexes(selected_tables) or ())
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid table number'})
+        found = scrape_tables(url, with_headers=True, indexes=wanted) or []
+        if found and len(found) < len(wanted):
+            return jsonify({'success': False, 'error': 'Invalid table number'})
+        tables = dict(zip(wanted, found))
     if not tables or not selected_tables:
         return jsonify({'success': False, 'error': 'No tables to export'})
-    output = io.StringIO()
-    writer = csv.writer(output)
-    for idx in map(int, selected_tables):
-        writer.writerow(['Table ' + str(idx + 1)])
-        for row in tables[idx]:
-            writer.writerow(row)
-        writer.writerow([])
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name='tables.csv'
+    try:
+        selected = [(idx + 1, tables[idx]) for idx in map(int, selected_tables)]
+    except (ValueError, IndexError, KeyError):
+        return jsonify({'success': False, 'error': 'Invalid table number'})
+    try:
+        chunks, mimetype, filename = table_export(export_format, selected)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    return Response(
+        chunks,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
     )
 
 @app.route('/export_images', methods=['POST'])
 def export_images():
     url = request.form.get('url')
     image_format = request.form.get('image_format', 'all')
-    num_items = request.form.get('num_items', type=int)
-    images = scrape_images(url, image_format)
+    result_id = request.form.get('result_id')
+    if result_id:
+        images = [tuple(image) for image in _stored(result_id, 'image', 'images') or ()][:item_limit(request.form)]
+    else:
+        images = scrape_images(url, image_format, item_limit(request.form), _probe_filters(request.form))
     if not images:
         return jsonify({'success': False, 'error': 'No images to export'})
-    images = images[:num_items] if num_items else images
-    zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for i, img_url in enumerate(images):
-            try:
-                img_data = requests.get(img_url, timeout=5).content
-                img_name = f'image_{i + 1}.{img_url.split(".")[-1]}'
-                zip_file.writestr(img_name, img_data)
-            except Exception as e:
-                logger.error(f"Failed to download {img_url}: {e}")
-    zip_buffer.seek(0)
-    return send_file(
-        zip_buffer,
+    return Response(
+        stream_image_zip(images),
         mimetype='application/zip',
-        as_attachment=True,
-        download_name='images.zip'
+        headers={'Content-Disposition': 'attachment; filename=images.zip'}
     )
 
 if __name__ == '__main__':
+    start_background_services()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,114 @@
+"""ASGI entry point: ``uvicorn asgi:application``.
+
+POST /scrape requests for data types that need no browser are served by the
+async engine on the event loop and answered like the Flask route, stored and
+added to the history cookie. Streamed scrapes and every other request go to the
+Flask app.
+"""
+import io
+import json
+import asyncio
+import logging
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.wrappers import Request
+from app import (
+    app as flask_app, start_background_services, SCRAPERS, run_scrape, scrape_pdf_links, scrape_response,
+    stream_format, movie_lookups, book_lookups,
+)
+from async_engine import AsyncEngine, ASYNC_TYPES
+
+logger = logging.getLogger(__name__)
+
+engine = AsyncEngine(run_scrape, sync_fallbacks={'pdf': scrape_pdf_links},
+                     lookup_caches={'movie': movie_lookups, 'book': book_lookups})
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _replay(body):
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {'type': 'http.disconnect'}
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return receive
+
+
+def _parse_request(scope, body):
+    # Reuse werkzeug's request parsing so form bodies, query strings, cookies and Accept
+    # headers are read exactly as the Flask app reads them
+    headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'CONTENT_TYPE': headers.get('content-type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'HTTP_ACCEPT': headers.get('accept', ''),
+        'HTTP_COOKIE': headers.get('cookie', ''),
+        'wsgi.input': io.BytesIO(body),
+        'SERVER_NAME': 'asgi',
+        'SERVER_PORT': '0',
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+    }
+    return Request(environ)
+
+
+async def _send_json(send, payload, status=200):
+    body = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_response(send, response):
+    headers = [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in response.headers.items()]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+def _scrape_response(data_type, url, data, req):
+    # jsonify needs the app context; run off the loop, storing the result touches SQLite
+    with flask_app.app_context():
+        return scrape_response(data_type, url, data, req.form, req.cookies)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            start_background_services()
+            await engine.startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await engine.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] == 'http' and scope['path'] == '/scrape' and scope['method'] == 'POST':
+        body = await _read_body(receive)
+        req = _parse_request(scope, body)
+        data_type = req.form.get('data_type')
+        url = req.form.get('url')
+        if data_type in ASYNC_TYPES and data_type in SCRAPERS and not stream_format(req):
+            try:
+                data = await engine.scrape(data_type, url, req.form)
+            except ValueError as e:
+                return await _send_json(send, {'success': False, 'error': str(e)})
+            return await _send_response(send, await asyncio.to_thread(_scrape_response, data_type, url, data, req))
+        receive = _replay(body)
+    return await wsgi_app(scope, receive, send)
@@ -0,0 +1,159 @@
+import os
+import asyncio
+import contextvars
+import logging
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import httpx
+import requests
+import http_client
+import metrics
+from host_limiter import host_limiter
+from page_cache import page_cache
+from lookups import is_enabled
+from extractors import (
+    STATIC_EXTRACTORS, extract_page, parse_and_call,
+    movie_search_url, book_search_url,
+)
+
+logger = logging.getLogger(__name__)
+# httpx logs every request at INFO
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 200))
+ASYNC_MAX_KEEPALIVE = int(os.environ.get('ASYNC_MAX_KEEPALIVE', 50))
+ASYNC_PARSE_WORKERS = int(os.environ.get('ASYNC_PARSE_WORKERS', (os.cpu_count() or 1) * 2))
+# Set above zero to parse in worker processes instead of threads
+ASYNC_PARSE_PROCESSES = int(os.environ.get('ASYNC_PARSE_PROCESSES', 0))
+ASYNC_SYNC_WORKERS = int(os.environ.get('ASYNC_SYNC_WORKERS', 8))
+
+# Data types served entirely on the event loop
+ASYNC_TYPES = frozenset(STATIC_EXTRACTORS) - {'image'} | {'movie', 'book'}
+
+
+class AsyncEngine:
+    """Fetches pages on an event loop and parses them on a thread or process pool.
+
+    Pages are read from and written to the shared page cache, so the async and
+    sync paths never fetch the same page twice. Data types that may need a
+    browser are handed to ``sync_runner`` on a small thread pool.
+    """
+
+    def __init__(self, sync_runner, sync_fallbacks=None, lookup_caches=None):
+        self.sync_runner = sync_runner
+        self.sync_fallbacks = sync_fallbacks or {}
+        self.lookup_caches = lookup_caches or {}
+        self._client = None
+        if ASYNC_PARSE_PROCESSES > 0:
+            self._parse_executor = ProcessPoolExecutor(max_workers=ASYNC_PARSE_PROCESSES)
+        else:
+            self._parse_executor = ThreadPoolExecutor(max_workers=ASYNC_PARSE_WORKERS, thread_name_prefix='parse')
+        self._sync_executor = ThreadPoolExecutor(max_workers=ASYNC_SYNC_WORKERS, thread_name_prefix='sync-scrape')
+
+    async def startup(self):
+        self._client = httpx.AsyncClient(
+            headers=http_client.DEFAULT_HEADERS,
+            timeout=http_client.HTTP_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                                max_keepalive_connections=ASYNC_MAX_KEEPALIVE),
+            transport=httpx.AsyncHTTPTransport(retries=http_client.HTTP_MAX_RETRIES),
+        )
+
+    async def shutdown(self):
+        if self._client is not None:
+            await self._client.aclose()
+        self._parse_executor.shutdown(wait=False)
+        self._sync_executor.shutdown(wait=False)
+
+    async def fetch(self, url):
+        """Return the page body, going through the shared page cache."""
+        key, entry, fresh = page_cache.lookup(url)
+        if fresh:
+            return entry['content']
+        async with host_limiter.aslot(url, http_client.session_for(url)):
+            with metrics.span('fetch', url):
+                response = await self._client.get(url, headers=page_cache.conditional_headers(entry))
+        host_limiter.observe(url, response)
+        if entry is not None and response.status_code == 304:
+            return page_cache.mark_revalidated(key, entry).content
+        response.raise_for_status()
+        return page_cache.store(key, str(response.url), response.status_code, response.headers,
+                                response.content).content
+
+    async def _offload(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        if ASYNC_PARSE_PROCESSES > 0:
+            # Spans recorded in worker processes never reach this process's metrics
+            return await loop.run_in_executor(self._parse_executor, partial(fn, *args))
+        # Carry the scrape's metric labels into the parse thread
+        return await loop.run_in_executor(self._parse_executor, partial(contextvars.copy_context().run, fn, *args))
+
+    async def _run_sync(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._sync_executor, partial(contextvars.copy_context().run, fn, *args))
+
+    async def scrape(self, data_type, url, options=None):
+        """Async counterpart of ``run_scrape`` returning the same data."""
+        # Kept as given: a form's repeated fields (e.g. table_index) must reach the extractor
+        options = options if options is not None else {}
+        if data_type not in ASYNC_TYPES:
+            # run_scrape records its own metrics
+            return await self._run_sync(self.sync_runner, data_type, url, options)
+        with metrics.scrape_scope(data_type, url):
+            return await self._scrape(data_type, url, options)
+
+    async def _scrape(self, data_type, url, options):
+        if data_type in ('movie', 'book'):
+            return await self.lookup(data_type, url, is_enabled(options.get('stale_while_revalidate')))
+        try:
+            content = await self.fetch(url)
+            data = await self._offload(extract_page, data_type, content, url, options)
+        # HostThrottled and the page cache's errors are requests exceptions
+        except (httpx.HTTPError, requests.exceptions.RequestException) as e:
+            logger.error(f"Error fetching {url}: {e}")
+            data = None
+        if not data and data_type in self.sync_fallbacks:
+            # e.g. scrape_pdf_links retries with Selenium; the page itself is already cached
+            return await self._run_sync(self.sync_fallbacks[data_type], url)
+        return data
+
+    async def lookup(self, data_type, name, stale_while_revalidate=False):
+        cache = self.lookup_caches.get(data_type)
+        record = cache.get_cached(name, stale_while_revalidate) if cache else None
+        if record is None:
+            if data_type == 'movie':
+                record = await self.scrape_movie_details(name)
+            else:
+                record = await self.scrape_book_details(name)
+            if cache:
+                cache.put(name, record)
+        return record
+
+    async def scrape_movie_details(self, movie_name):
+        try:
+            search_content = await self.fetch(movie_search_url(movie_name))
+            movie_url = await self._offload(parse_and_call, 'extract_movie_link', search_content)
+            if not movie_url:
+                return {"error": "No movie found with that name."}
+            content = await self.fetch(movie_url)
+            return await self._offload(parse_and_call, 'extract_movie_details', content, movie_url)
+        except httpx.HTTPError as e:
+            return {"error": f"Network error: {e}"}
+        except Exception as e:
+            return {"error": f"An unexpected error occurred: {e}"}
+
+    async def scrape_book_details(self, book_name):
+        try:
+            search_content = await self.fetch(book_search_url(book_name))
+            book_data, detail_url = await self._offload(parse_and_call, 'extract_book_result', search_content)
+            if not book_data:
+                return {"error": "No book found with that name."}
+            content = await self.fetch(detail_url)
+            book_data["description"] = await self._offload(parse_and_call, 'extract_book_description', content)
+            book_data["book_link"] = detail_url
+            return book_data
+        except httpx.HTTPError as e:
+            return {"error": f"Network error: {e}"}
+        except Exception as e:
+            return {"error": f"An error occurred: {e}"}
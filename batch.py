@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import logging
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 8))
+BATCH_PER_HOST = int(os.environ.get('BATCH_PER_HOST', 2))
+BATCH_MAX_JOBS = int(os.environ.get('BATCH_MAX_JOBS', 500))
+
+# Name-based data types always hit the same site
+SITE_HOSTS = {
+    'movie': 'www.imdb.com',
+    'book': 'openlibrary.org',
+    'ebay': 'www.ebay.com',
+}
+
+
+def job_host(job):
+    if job['data_type'] in SITE_HOSTS:
+        return SITE_HOSTS[job['data_type']]
+    return urlsplit(job['url']).netloc.lower()
+
+
+def positive_int(options, name):
+    """``options[name]`` as a positive int, or None when it is missing or not one."""
+    try:
+        value = int(options.get(name) or 0)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def run_job(job, runner):
+    """Run a single ``{url, data_type, options}`` job and describe its outcome."""
+    options = job.get('options') or {}
+    started = time.perf_counter()
+    result = {'url': job['url'], 'data_type': job['data_type']}
+    try:
+        num_items = positive_int(options, 'num_items')
+        if num_items is None and options.get('num_items') not in (None, ''):
+            raise ValueError(f"num_items must be a positive integer, got {options['num_items']!r}")
+        data = runner(job['data_type'], job['url'], options)
+        if num_items and isinstance(data, (list, tuple)):
+            data = data[:num_items]
+        if not data:
+            result.update(success=False, error='No data found.')
+        elif isinstance(data, dict) and 'error' in data:
+            result.update(success=False, error=data['error'])
+        else:
+            result.update(success=True, data=data)
+    except Exception as e:
+        logger.error(f"Job {job['data_type']} {job['url']} failed: {e}")
+        result.update(success=False, error=str(e))
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def _run_indexed(index, job, runner):
+    return {'index': index, **run_job(job, runner)}
+
+
+def run_batch(jobs, runner, workers=BATCH_WORKERS, per_host=BATCH_PER_HOST):
+    """Run ``runner(data_type, url, options)`` for every job and yield results as they finish.
+
+    Jobs are only handed to the pool when their host is below ``per_host`` running
+    jobs, so a slow host never ties up every worker.
+    """
+    queues = defaultdict(deque)
+    for index, job in enumerate(jobs):
+        queues[job_host(job)].append((index, job))
+    running = defaultdict(int)
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def fill():
+            for host, queue in queues.items():
+                while queue and running[host] < per_host and len(pending) < workers:
+                    index, job = queue.popleft()
+                    running[host] += 1
+                    pending[pool.submit(_run_indexed, index, job, runner)] = host
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                running[pending.pop(future)] -= 1
+                yield future.result()
+            fill()
+
+
+def stream_ndjson(items):
+    for item in items:
+        yield json.dumps(item) + '\n'
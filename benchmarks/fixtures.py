@@ -0,0 +1,210 @@
+"""Synthetic pages and PDFs served from a local HTTP server, so benchmarks run offline.
+
+Every page is built to satisfy its extractor on the static path, which keeps the
+Selenium fallbacks out of the measurements. Saved pages dropped into
+``benchmarks/pages/*.html`` are served under ``/recorded/<name>`` as well.
+"""
+import os
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), 'pages')
+
+WORDS = ('market', 'council', 'report', 'storm', 'election', 'energy', 'league', 'study', 'river',
+         'budget', 'museum', 'festival', 'court', 'transit', 'harvest', 'satellite', 'vaccine',
+         'housing', 'record', 'summit', 'drought', 'startup', 'archive', 'orchestra')
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _html(title, body):
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title>'
+            f'<link rel="stylesheet" href="/style.css"></head><body>{body}</body></html>').encode('utf-8')
+
+
+def _chrome(rng, links=60):
+    # Navigation, scripts and footer text that the tag filters should skip
+    nav = ''.join(f'<li><a href="/section/{i}">{rng.choice(WORDS)}</a></li>' for i in range(links))
+    script = '<script>window.__state = {' + ','.join(f'"k{i}": {i}' for i in range(200)) + '};</script>'
+    footer = ''.join(f'<p>{_sentence(rng, 12)}</p>' for _ in range(20))
+    return f'<nav><ul>{nav}</ul></nav>{script}', f'<footer>{footer}</footer>'
+
+
+def table_page(rng, tables=5, rows=2000, cols=8):
+    head, foot = _chrome(rng)
+    parts = []
+    for t in range(tables):
+        header = ''.join(f'<th>Column {c + 1}</th>' for c in range(cols))
+        body = []
+        for r in range(rows):
+            cells = [f'<td>{rng.choice(WORDS)} {r}</td>', f'<td>{rng.randint(0, 10 ** 6):,}</td>']
+            cells += [f'<td>{rng.random() * 1000:.2f}</td>' for _ in range(cols - 2)]
+            body.append(f'<tr>{"".join(cells)}</tr>')
+        parts.append(f'<h2>Table {t + 1}</h2><table><thead><tr>{header}</tr></thead>'
+                     f'<tbody>{"".join(body)}</tbody></table>')
+    return _html('Tables', head + ''.join(parts) + foot)
+
+
+def gallery_page(rng, images=1000):
+    head, foot = _chrome(rng)
+    items = []
+    for i in range(images):
+        ext = rng.choice(('jpg', 'png', 'webp', 'gif', 'jpeg'))
+        if i % 3 == 0:
+            items.append(f'<figure><img src="/img/photo_{i}.{ext}" alt="{_sentence(rng, 4)}">'
+                         f'<figcaption>{_sentence(rng, 6)}</figcaption></figure>')
+        elif i % 3 == 1:
+            items.append(f'<div class="card"><img data-src="/img/lazy_{i}.{ext}" alt="{_sentence(rng, 3)}"></div>')
+        else:
+            items.append(f'<div class="card"><img src="/img/plain_{i}.{ext}"><p>{_sentence(rng, 10)}</p></div>')
+    return _html('Gallery', head + f'<main>{"".join(items)}</main>' + foot)
+
+
+def video_page(rng, videos=300):
+    head, foot = _chrome(rng)
+    items = []
+    for i in range(videos):
+        sources = ''.join(f'<source src="/media/clip_{i}.{ext}" type="video/{ext}">' for ext in ('webm', 'mp4', 'ogg'))
+        video = f'<video controls poster="/img/poster_{i}.jpg">{sources}</video>'
+        if i % 2:
+            video = f'<figure>{video}<figcaption>{_sentence(rng, 5)}</figcaption></figure>'
+        items.append(f'<article>{video}<p>{_sentence(rng, 20)}</p></article>')
+    return _html('Videos', head + ''.join(items) + foot)
+
+
+def news_page(rng, headlines=3000):
+    head, foot = _chrome(rng)
+    items = []
+    for i in range(headlines):
+        tag = ('h1', 'h2', 'h3')[i % 3] if i < 30 else ('h2', 'h3')[i % 2]
+        # Repeat some headlines so deduplication is exercised
+        text = _sentence(rng, rng.randint(3, 12)) if i % 10 else f'Breaking {WORDS[i % len(WORDS)]} update'
+        items.append(f'<article><{tag}><a href="/story/{i}">{text}</a></{tag}><p>{_sentence(rng, 30)}</p></article>')
+    return _html('News', head + ''.join(items) + foot)
+
+
+def pdf_links_page(rng, base_url, links=2000):
+    head, foot = _chrome(rng)
+    items = []
+    for i in range(links):
+        name = f'report_{i % (links // 2)}.pdf'
+        href = f'{base_url}/docs/{name}' + ('?download=1' if i % 5 == 0 else '')
+        items.append(f'<li><a href="{href}">{_sentence(rng, 5)}</a> <a href="/docs/{i}.html">details</a></li>')
+    return _html('Documents', head + f'<ul>{"".join(items)}</ul>' + foot)
+
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def build_pdf(rng, pages=60, lines_per_page=25, image_side=1000):
+    """Write a text PDF by hand. The first page also draws an uncompressed RGB image,
+    like a scanned cover, which brings the default file to about 3 MB."""
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    image = rng.randbytes(image_side * image_side * 3) if image_side else b''
+    if image:
+        objects.append((f'<< /Type /XObject /Subtype /Image /Width {image_side} /Height {image_side} '
+                        f'/ColorSpace /DeviceRGB /BitsPerComponent 8 /Length {len(image)} >>\nstream\n').encode('latin-1')
+                       + image + b'\nendstream')
+    image_id = len(objects)
+    page_ids = []
+    for p in range(pages):
+        text_lines = [f'({_pdf_escape(f"Page {p + 1} line {n + 1}: " + _sentence(rng, 8))}) Tj T*'
+                      for n in range(lines_per_page)]
+        stream = 'BT /F1 10 Tf 14 TL 40 800 Td ' + ' '.join(text_lines) + ' ET'
+        resources = '/Font << /F1 3 0 R >>'
+        if image and p == 0:
+            stream = f'q 300 0 0 300 150 100 cm /Im1 Do Q {stream}'
+            resources += f' /XObject << /Im1 {image_id} 0 R >>'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream')
+        content_id = len(objects)
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       f'/Resources << {resources} >> /Contents {content_id} 0 R >>')
+        page_ids.append(len(objects))
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(f"{i} 0 R" for i in page_ids)}] /Count {pages} >>'
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        body = body if isinstance(body, bytes) else body.encode('latin-1')
+        out += f'{number} 0 obj\n'.encode('latin-1') + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode('latin-1')
+    out += ''.join(f'{offset:010d} 00000 n \n' for offset in offsets).encode('latin-1')
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode('latin-1')
+    return bytes(out)
+
+
+class FixtureServer:
+    """Serves generated fixtures on 127.0.0.1 from a background thread."""
+
+    def __init__(self, scale=1.0, seed=1234):
+        self.scale = scale
+        self.seed = seed
+        self.routes = {}
+        self._server = None
+
+    def _n(self, value):
+        return max(1, int(value * self.scale))
+
+    def _build(self):
+        rng = random.Random(self.seed)
+        html = 'text/html; charset=utf-8'
+        self.routes.update({
+            '/tables.html': (html, table_page(rng, rows=self._n(2000))),
+            '/gallery.html': (html, gallery_page(rng, images=self._n(1000))),
+            '/videos.html': (html, video_page(rng, videos=self._n(300))),
+            '/news.html': (html, news_page(rng, headlines=self._n(3000))),
+            '/documents.html': (html, pdf_links_page(rng, self.base_url, links=self._n(2000))),
+            '/docs/large.pdf': ('application/pdf', build_pdf(rng, pages=self._n(60))),
+        })
+        if os.path.isdir(PAGES_DIR):
+            for name in sorted(os.listdir(PAGES_DIR)):
+                if name.endswith('.html'):
+                    with open(os.path.join(PAGES_DIR, name), 'rb') as f:
+                        self.routes[f'/recorded/{name}'] = (html, f.read())
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def url(self, path):
+        return self.base_url + path
+
+    def start(self):
+        routes = self.routes
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                content_type, body = routes.get(path, ('text/plain', b'not found'))
+                self.send_response(200 if path in routes else 404)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._build()
+        threading.Thread(target=self._server.serve_forever, daemon=True, name='fixture-server').start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def sizes(self):
+        return {path: len(body) for path, (_, body) in self.routes.items()}
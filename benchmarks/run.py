@@ -0,0 +1,353 @@
+"""Benchmark the extractors, scrapers and routes against local fixtures.
+
+    python -m benchmarks.run                         # writes benchmarks/results/<commit>-<time>.json
+    python -m benchmarks.run --quick                 # smaller fixtures, fewer repeats
+    python -m benchmarks.run --compare old.json      # run, then compare with an earlier result
+    python -m benchmarks.run --compare old.json new.json
+
+Everything is served from 127.0.0.1, so no network access is needed.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import statistics
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# data_type -> (fixture path, scrape options)
+SCRAPE_CASES = {
+    'table': ('/tables.html', {}),
+    'image': ('/gallery.html', {'image_format': 'all'}),
+    'video': ('/videos.html', {'video_format': 'all'}),
+    'news': ('/news.html', {}),
+    'pdf': ('/documents.html', {}),
+}
+
+# Settings pointing at files, all moved into a scratch directory
+SCRATCH_FILES = {
+    'JOBS_DB': 'jobs.sqlite3',
+    'CRAWL_DB': 'crawls.sqlite3',
+    'DELIVERY_DB': 'deliveries.sqlite3',
+    'SCHEDULE_DB': 'schedules.sqlite3',
+    'RESULT_DB': 'results.sqlite3',
+    'RENDER_MEMORY_DB': 'render_memory.sqlite3',
+    'PAGE_CACHE_PATH': 'page_cache.sqlite3',
+    'PROFILE_DIR': 'profiles',
+}
+BENCH_LIMITS = {
+    'HOST_RATE': '100000',
+    'HOST_BURST': '100000',
+    'HOST_CONCURRENCY': '1000',
+    'HOST_ROBOTS': '0',
+    'ASSET_HOST_RATE': '100000',
+    'ASSET_HOST_BURST': '100000',
+    'ASSET_HOST_CONCURRENCY': '1000',
+}
+
+
+def _configure_environment(args):
+    # Must run before the app modules are imported, they read settings at import time
+    scratch = tempfile.mkdtemp(prefix='scrapper-bench-')
+    # Nothing a run writes may land in the working copy's databases
+    for name, filename in SCRATCH_FILES.items():
+        os.environ[name] = os.path.join(scratch, filename)
+    os.environ['PAGE_CACHE_BACKEND'] = 'memory'
+    # The fixtures share one host; at the default per-host limits every route would
+    # measure the limiter instead of the code
+    os.environ.update(BENCH_LIMITS)
+    if not args.warm_cache:
+        # Every call fetches and parses again, which is what the numbers should reflect
+        os.environ['PAGE_CACHE_TTL'] = '0'
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True).stdout.strip()
+        return f'{commit}-dirty' if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _count(data):
+    return len(data) if data else 0
+
+
+def _timings(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, result
+
+
+def _summary(samples):
+    return {
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+    }
+
+
+def _peak_kb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_parse(server, repeat):
+    """Parse and extract time per static extractor and parser backend, without any I/O."""
+    from parsing import parse, HAS_LXML, HAS_SELECTOLAX
+    from extractors import STATIC_EXTRACTORS
+
+    backends = ['html.parser'] + (['lxml'] if HAS_LXML else []) + (['selectolax'] if HAS_SELECTOLAX else [])
+    results = {}
+    for data_type, (only, extract) in STATIC_EXTRACTORS.items():
+        path, options = SCRAPE_CASES[data_type]
+        targets = [path] + [p for p in server.routes if p.startswith('/recorded/')]
+        for target in targets:
+            content = server.routes[target][1]
+            url = server.url(target)
+            name = data_type if target == path else f'{data_type}:{target.rsplit("/", 1)[1]}'
+            results[name] = {'bytes': len(content)}
+            for backend in backends:
+                parse_samples, soup = _timings(lambda: parse(content, only=only, backend=backend), repeat)
+                extract_samples, data = _timings(lambda: extract(soup, url, options), repeat)
+                results[name][backend] = {
+                    'parse': _summary(parse_samples),
+                    'extract': _summary(extract_samples),
+                    'peak_kb': _peak_kb(lambda: extract(parse(content, only=only, backend=backend), url, options)),
+                    'items': _count(data),
+                }
+    return results
+
+
+def bench_scrapers(server, repeat):
+    """In-process ``run_scrape`` calls, including the fetch from the fixture server."""
+    import app
+
+    results = {}
+    for data_type, (path, options) in SCRAPE_CASES.items():
+        url = server.url(path)
+        samples, data = _timings(lambda: app.run_scrape(data_type, url, options), repeat)
+        results[data_type] = {
+            **_summary(samples),
+            'peak_kb': _peak_kb(lambda: app.run_scrape(data_type, url, options)),
+            'items': _count(data),
+        }
+        if not data:
+            print(f'warning: {data_type} scrape returned nothing, the browser fallback may have run', file=sys.stderr)
+    return results
+
+
+def bench_pdf(server):
+    """Download and extract every page of the fixture PDF once."""
+    from pdf_extract import download_pdf, read_pdf_info, iter_page_text
+
+    url = server.url('/docs/large.pdf')
+
+    def extract():
+        path = download_pdf(url)
+        try:
+            info = read_pdf_info(path)
+            text = ''.join(page_text for _, page_text in iter_page_text(path, list(range(info['page_count']))))
+            return info, text
+        finally:
+            os.remove(path)
+
+    samples, (info, text) = _timings(extract, 1)
+    return {
+        **_summary(samples),
+        'bytes': len(server.routes['/docs/large.pdf'][1]),
+        'pages': info['page_count'],
+        'chars': len(text),
+        # Worker processes used for large page selections are not traced
+        'peak_kb': _peak_kb(extract),
+    }
+
+
+def _route_cases(server, pdf_pages):
+    cases = {f'scrape_{data_type}': ('/scrape', {'url': server.url(path), 'data_type': data_type, **options})
+             for data_type, (path, options) in SCRAPE_CASES.items()}
+    cases['export_csv'] = ('/export_csv', {'url': server.url('/tables.html'), 'table_number': ['0', '1', '2']})
+    cases['extract_pdf_info'] = ('/extract_pdf_info', {'pdf_url': server.url('/docs/large.pdf'), 'pages': pdf_pages})
+    return cases
+
+
+def bench_routes(server, levels, requests_per_level, pdf_pages):
+    """End-to-end latency of the Flask routes over real HTTP at several concurrency levels."""
+    import requests
+    from werkzeug.serving import make_server
+    import app
+
+    # werkzeug logs every request at INFO
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    http_server = make_server('127.0.0.1', 0, app.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True, name='bench-app').start()
+    base = f'http://127.0.0.1:{http_server.server_port}'
+    local = threading.local()
+
+    def call(route, data):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.post(base + route, data=data, timeout=300)
+            ok = response.ok
+            if ok and response.headers.get('Content-Type', '').startswith('application/json'):
+                ok = response.json().get('success', False)
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    results = {}
+    try:
+        for name, (route, data) in _route_cases(server, pdf_pages).items():
+            results[name] = {}
+            for level in levels:
+                total = max(requests_per_level, level * 2)
+                with ThreadPoolExecutor(max_workers=level) as pool:
+                    start = time.perf_counter()
+                    outcomes = list(pool.map(lambda _: call(route, data), range(total)))
+                    elapsed = time.perf_counter() - start
+                latencies = sorted(latency for latency, _ in outcomes)
+                results[name][str(level)] = {
+                    'p50_ms': round(statistics.median(latencies), 3),
+                    'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+                    'max_ms': round(latencies[-1], 3),
+                    'rps': round(total / elapsed, 2),
+                    'requests': total,
+                    'errors': sum(1 for _, ok in outcomes if not ok),
+                }
+    finally:
+        http_server.shutdown()
+    return results
+
+
+def _flatten(data, prefix=''):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f'{prefix}{key}.')
+        elif isinstance(value, (int, float)) and key.endswith(('_ms', '_kb', 'rps')):
+            yield f'{prefix}{key}', value
+
+
+def compare(old, new, threshold):
+    """Print metrics that moved by more than ``threshold`` and return the number of regressions."""
+    before = dict(_flatten(old['results']))
+    after = dict(_flatten(new['results']))
+    print(f"comparing {old['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    regressions = 0
+    for key in sorted(after):
+        if key not in before or not before[key]:
+            continue
+        change = (after[key] - before[key]) / before[key]
+        # Throughput should go up, everything else should go down
+        worse = -change if key.endswith('rps') else change
+        if abs(change) < threshold:
+            continue
+        marker = 'REGRESSION' if worse > 0 else 'improved'
+        regressions += worse > 0
+        print(f'{marker:>10}  {key:<60} {before[key]:>12.2f} -> {after[key]:>12.2f}  ({change:+.1%})')
+    print(f'{regressions} regression(s) above {threshold:.0%}')
+    return regressions
+
+
+def run(args):
+    _configure_environment(args)
+    from benchmarks.fixtures import FixtureServer
+
+    scale = 0.2 if args.quick else args.scale
+    repeat = 2 if args.quick else args.repeat
+    server = FixtureServer(scale=scale).start()
+    try:
+        results = {'parse': bench_parse(server, repeat)}
+        results['scrape'] = bench_scrapers(server, repeat)
+        results['pdf'] = bench_pdf(server)
+        if not args.skip_routes:
+            levels = [int(level) for level in args.concurrency.split(',')]
+            results['routes'] = bench_routes(server, levels, 4 if args.quick else args.requests, args.pdf_pages)
+    finally:
+        server.stop()
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'scale': scale,
+            'repeat': repeat,
+            'warm_cache': args.warm_cache,
+            'fixture_bytes': server.sizes(),
+            # ru_maxrss is in KiB on Linux
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help='small fixtures and few repeats, for a smoke run')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply fixture sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per parse/scrape case')
+    parser.add_argument('--concurrency', default='1,4,16', help='comma separated route concurrency levels')
+    parser.add_argument('--requests', type=int, default=20, help='requests per route and concurrency level')
+    parser.add_argument('--pdf-pages', default='1-5', help='page range sent to /extract_pdf_info')
+    parser.add_argument('--skip-routes', action='store_true', help='only run the in-process benchmarks')
+    parser.add_argument('--warm-cache', action='store_true', help='let the page cache serve repeated fetches')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/<commit>-<time>.json)')
+    parser.add_argument('--compare', nargs='+', metavar='RESULT', help='earlier result, optionally followed by a newer one')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change reported by --compare')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 on regressions')
+    args = parser.parse_args(argv)
+
+    if args.compare and len(args.compare) > 2:
+        parser.error('--compare takes one or two result files')
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare(old, new, args.threshold)
+        return 1 if regressions and args.fail_on_regression else 0
+
+    report = run(args)
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        name = f"{report['meta']['commit'] or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        output = os.path.join(RESULTS_DIR, name)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'wrote {output}')
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        return 1 if regressions and args.fail_on_regression else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Measure cold import time and per-worker memory of the app.
+
+    python -m benchmarks.startup                     # writes benchmarks/results/startup-<commit>-<time>.json
+    python -m benchmarks.startup --compare old.json  # run, then compare with an earlier result
+
+The gunicorn part starts the server the way nixpacks.toml does and reads RSS, PSS
+and private memory of each worker from /proc, so it only runs on Linux.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+from benchmarks.run import RESULTS_DIR, compare, _git_commit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only the browser, PDF or columnar export paths need
+HEAVY_MODULES = ('selenium', 'webdriver_manager', 'pdfplumber', 'pdfminer', 'numpy', 'pyarrow', 'httpx')
+
+IMPORT_SNIPPET = f'''
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = (time.perf_counter() - start) * 1000
+rss = next(int(line.split()[1]) for line in open('/proc/self/status') if line.startswith('VmRSS:'))
+print(json.dumps({{'import_ms': elapsed, 'rss_kb': rss, 'modules': len(sys.modules),
+                  'heavy': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+'''
+
+
+def _environment():
+    scratch = tempfile.mkdtemp(prefix='scrapper-startup-')
+    env = dict(os.environ)
+    env.setdefault('JOBS_DB', os.path.join(scratch, 'jobs.sqlite3'))
+    env.setdefault('CRAWL_DB', os.path.join(scratch, 'crawls.sqlite3'))
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    return env
+
+
+def bench_import(runs):
+    env = _environment()
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=ROOT, env=env, capture_output=True,
+                                text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'median_import_ms': round(statistics.median(s['import_ms'] for s in samples), 1),
+        'min_import_ms': round(min(s['import_ms'] for s in samples), 1),
+        'rss_kb': statistics.median(s['rss_kb'] for s in samples),
+        'modules': samples[-1]['modules'],
+        'heavy_modules': samples[-1]['heavy'],
+    }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _memory_kb(pid):
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {
+        'rss_kb': values.get('Rss', 0),
+        'pss_kb': values.get('Pss', 0),
+        'private_kb': values.get('Private_Clean', 0) + values.get('Private_Dirty', 0),
+    }
+
+
+def bench_gunicorn(workers, timeout=60):
+    port = _free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+    if os.path.exists(os.path.join(ROOT, 'gunicorn.conf.py')):
+        command += ['-c', 'gunicorn.conf.py']
+    command.append('app:app')
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=_environment(), stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    try:
+        first_response = None
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/http_stats', timeout=5) as response:
+                    response.read()
+                first_response = (time.perf_counter() - start) * 1000
+                break
+            except OSError:
+                time.sleep(0.05)
+        if first_response is None:
+            raise RuntimeError('gunicorn did not answer in time')
+        # Wait for every worker to finish booting before reading its memory
+        while len(_children(server.pid)) < workers and time.perf_counter() - start < timeout:
+            time.sleep(0.05)
+        time.sleep(1)
+        worker_memory = [_memory_kb(pid) for pid in _children(server.pid)]
+        return {
+            'workers': workers,
+            'first_response_ms': round(first_response, 1),
+            'master': _memory_kb(server.pid),
+            'worker_mean': {name: round(statistics.fmean(m[name] for m in worker_memory))
+                            for name in ('rss_kb', 'pss_kb', 'private_kb')},
+            'total_pss_kb': _memory_kb(server.pid)['pss_kb'] + sum(m['pss_kb'] for m in worker_memory),
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='cold imports to time')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers to start')
+    parser.add_argument('--skip-gunicorn', action='store_true')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/startup-<commit>-<time>.json)')
+    parser.add_argument('--compare', metavar='RESULT', help='earlier startup result to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change reported by --compare')
+    args = parser.parse_args(argv)
+
+    results = {'import': bench_import(args.runs)}
+    if not args.skip_gunicorn:
+        results['gunicorn'] = bench_gunicorn(args.workers)
+    report = {
+        'meta': {'commit': _git_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'python': sys.version.split()[0]},
+        'results': results,
+    }
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"startup-{report['meta']['commit'] or 'unknown'}-"
+                                           f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f'wrote {output}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report, args.threshold)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
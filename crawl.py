@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from urllib.parse import urljoin, urlsplit
+import requests
+import metrics
+from host_limiter import host_limiter
+from page_cache import page_cache, normalize_url
+from parsing import parse
+from extractors import STATIC_EXTRACTORS, extract_page
+from sqlite_util import connect, pid_alive
+
+logger = logging.getLogger(__name__)
+
+CRAWL_DB = os.environ.get('CRAWL_DB', 'crawls.sqlite3')
+CRAWL_MAX_DEPTH = int(os.environ.get('CRAWL_MAX_DEPTH', 2))
+CRAWL_MAX_PAGES = int(os.environ.get('CRAWL_MAX_PAGES', 1000))
+CRAWL_HARD_MAX_PAGES = int(os.environ.get('CRAWL_HARD_MAX_PAGES', 50000))
+CRAWL_WORKERS = int(os.environ.get('CRAWL_WORKERS', 4))
+
+# Links to files we never want to fetch as pages
+SKIP_EXTENSIONS = re.compile(
+    r'\.(pdf|jpe?g|png|gif|webp|svg|ico|mp4|webm|ogg|mp3|zip|gz|tar|rar|7z|exe|dmg|docx?|xlsx?|pptx?|css|js)$',
+    re.IGNORECASE,
+)
+
+
+class CrawlStore:
+    """Checkpoint of every crawl: its settings, URL frontier (which doubles as the
+    visited set) and extracted results."""
+
+    def __init__(self, path=CRAWL_DB):
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS crawls ('
+                'id TEXT PRIMARY KEY, config TEXT, status TEXT, owner_pid INTEGER, '
+                'created_at REAL, finished_at REAL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS frontier ('
+                'crawl_id TEXT, url TEXT, depth INTEGER, status TEXT, error TEXT, '
+                'PRIMARY KEY (crawl_id, url))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS frontier_queue ON frontier (crawl_id, status, depth)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, crawl_id TEXT, url TEXT, depth INTEGER, data TEXT)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS results_crawl ON results (crawl_id, id)')
+
+    def create(self, config):
+        crawl_id = uuid.uuid4().hex
+        with connect(self.path) as conn:
+            conn.execute("INSERT INTO crawls (id, config, status, created_at) VALUES (?, ?, 'running', ?)",
+                         (crawl_id, json.dumps(config), time.time()))
+            conn.execute("INSERT INTO frontier (crawl_id, url, depth, status) VALUES (?, ?, 0, 'queued')",
+                         (crawl_id, normalize_url(config['start_url'])))
+        return crawl_id
+
+    def claim_crawl(self, crawl_id):
+        with connect(self.path) as conn:
+            cursor = conn.execute(
+                "UPDATE crawls SET owner_pid = ? WHERE id = ? AND status = 'running' "
+                "AND (owner_pid IS NULL OR owner_pid = ?)",
+                (os.getpid(), crawl_id, os.getpid()),
+            )
+            if cursor.rowcount != 1:
+                return False
+            # Pages that were mid-fetch when the previous owner stopped are fetched again
+            conn.execute("UPDATE frontier SET status = 'queued' WHERE crawl_id = ? AND status = 'fetching'",
+                         (crawl_id,))
+        return True
+
+    def orphaned(self):
+        """Running crawls whose owning process is gone."""
+        conn = connect(self.path)
+        rows = conn.execute("SELECT id, owner_pid FROM crawls WHERE status = 'running'").fetchall()
+        orphans = [row['id'] for row in rows if row['owner_pid'] is None or not pid_alive(row['owner_pid'])]
+        with conn:
+            for crawl_id in orphans:
+                conn.execute('UPDATE crawls SET owner_pid = NULL WHERE id = ?', (crawl_id,))
+        return orphans
+
+    def get(self, crawl_id):
+        conn = connect(self.path)
+        row = conn.execute('SELECT * FROM crawls WHERE id = ?', (crawl_id,)).fetchone()
+        if row is None:
+            return None
+        crawl = dict(row)
+        crawl['config'] = json.loads(crawl['config'])
+        crawl['pages'] = {
+            status: count for status, count in conn.execute(
+                'SELECT status, COUNT(*) FROM frontier WHERE crawl_id = ? GROUP BY status', (crawl_id,))
+        }
+        crawl['results'] = conn.execute('SELECT COUNT(*) FROM results WHERE crawl_id = ?', (crawl_id,)).fetchone()[0]
+        return crawl
+
+    def claim_page(self, crawl_id, max_pages):
+        conn = connect(self.path)
+        with conn:
+            status = conn.execute('SELECT status FROM crawls WHERE id = ?', (crawl_id,)).fetchone()
+            if status is None or status[0] != 'running':
+                return None
+            started = conn.execute(
+                "SELECT COUNT(*) FROM frontier WHERE crawl_id = ? AND status != 'queued'", (crawl_id,)
+            ).fetchone()[0]
+            if started >= max_pages:
+                return None
+            row = conn.execute(
+                "SELECT url, depth FROM frontier WHERE crawl_id = ? AND status = 'queued' ORDER BY depth LIMIT 1",
+                (crawl_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE frontier SET status = 'fetching' WHERE crawl_id = ? AND url = ?",
+                         (crawl_id, row['url']))
+        return row['url'], row['depth']
+
+    def add_links(self, crawl_id, urls, depth):
+        with connect(self.path) as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO frontier (crawl_id, url, depth, status) VALUES (?, ?, ?, 'queued')",
+                [(crawl_id, url, depth) for url in urls],
+            )
+
+    def finish_page(self, crawl_id, url, depth, data=None, error=None):
+        with connect(self.path) as conn:
+            conn.execute('UPDATE frontier SET status = ?, error = ? WHERE crawl_id = ? AND url = ?',
+                         ('failed' if error else 'done', error, crawl_id, url))
+            if data:
+                conn.execute('INSERT INTO results (crawl_id, url, depth, data) VALUES (?, ?, ?, ?)',
+                             (crawl_id, url, depth, json.dumps(data)))
+
+    def finish_crawl(self, crawl_id, status):
+        with connect(self.path) as conn:
+            conn.execute("UPDATE crawls SET status = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                         (status, time.time(), crawl_id))
+
+    def iter_results(self, crawl_id, batch_size=500):
+        last_id = 0
+        conn = connect(self.path)
+        while True:
+            rows = conn.execute(
+                'SELECT id, url, depth, data FROM results WHERE crawl_id = ? AND id > ? ORDER BY id LIMIT ?',
+                (crawl_id, last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield {'url': row['url'], 'depth': row['depth'], 'data': json.loads(row['data'])}
+            last_id = rows[-1]['id']
+
+
+class Crawl:
+    """Crawls one site from a start URL, running a static extractor on every page."""
+
+    def __init__(self, crawl_id, config, store):
+        self.crawl_id = crawl_id
+        self.config = config
+        self.store = store
+        self.max_depth = config['max_depth']
+        self.max_pages = config['max_pages']
+        self.domains = set(config['allowed_domains'])
+        self.include = re.compile(config['include']) if config.get('include') else None
+        self._active = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def allowed(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or SKIP_EXTENSIONS.search(parts.path):
+            return False
+        host = (parts.hostname or '').lower()
+        if not any(host == domain or host.endswith('.' + domain) for domain in self.domains):
+            return False
+        if self.include is not None and not self.include.search(url):
+            return False
+        return host_limiter.allowed(url)
+
+    def _process(self, url, depth):
+        with metrics.scrape_scope(self.config['data_type'], url):
+            return self._process_page(url, depth)
+
+    def _process_page(self, url, depth):
+        # Fetches are paced per host by the host limiter, like every other scrape
+        page = page_cache.fetch(url)
+        if 'html' not in page.headers.get('Content-Type', 'text/html'):
+            return None
+        if depth < self.max_depth:
+            base = page.url or url
+            links = {
+                normalize_url(urljoin(base, link['href']))
+                for link in parse(page.content, only=('a',)).find_all('a', href=True)
+            }
+            self.store.add_links(self.crawl_id, [link for link in links if self.allowed(link)], depth + 1)
+        return extract_page(self.config['data_type'], page.content, url, self.config['options'])
+
+    def _worker(self):
+        while not self._stop.is_set():
+            with self._lock:
+                claimed = self.store.claim_page(self.crawl_id, self.max_pages)
+                if claimed is None:
+                    if self._active == 0:
+                        return
+                else:
+                    self._active += 1
+            if claimed is None:
+                time.sleep(0.2)
+                continue
+            url, depth = claimed
+            try:
+                data = self._process(url, depth)
+                self.store.finish_page(self.crawl_id, url, depth, data=data)
+            except requests.exceptions.RequestException as e:
+                self.store.finish_page(self.crawl_id, url, depth, error=str(e))
+            except Exception as e:
+                logger.error(f"Crawl {self.crawl_id} failed on {url}: {e}")
+                self.store.finish_page(self.crawl_id, url, depth, error=str(e))
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+    def run(self):
+        threads = [threading.Thread(target=self._worker, name=f'crawl-{self.crawl_id[:8]}-{i}', daemon=True)
+                   for i in range(self.config['workers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if not self._stop.is_set():
+            self.store.finish_crawl(self.crawl_id, 'done')
+            logger.info(f"Crawl {self.crawl_id} finished")
+
+    def stop(self):
+        self._stop.set()
+
+
+class CrawlManager:
+    def __init__(self, store=None):
+        self.store = store or CrawlStore()
+        self._crawls = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build_config(payload):
+        """Validate a crawl request and fill in defaults; raises ValueError."""
+        start_url = payload.get('url')
+        data_type = payload.get('data_type')
+        if not start_url or urlsplit(start_url).scheme not in ('http', 'https'):
+            raise ValueError('A http(s) start url is required')
+        if data_type not in STATIC_EXTRACTORS:
+            raise ValueError(f"data_type must be one of {', '.join(sorted(STATIC_EXTRACTORS))}")
+        host = urlsplit(start_url).hostname
+        if not host:
+            raise ValueError(f"Start url '{start_url}' has no host")
+        include = payload.get('include')
+        if include:
+            re.compile(include)
+        options = payload.get('options') or {}
+        if not isinstance(options, dict):
+            raise ValueError('options must be an object')
+        domains = payload.get('allowed_domains') or [host]
+        if not isinstance(domains, list) or not all(isinstance(domain, str) and domain for domain in domains):
+            raise ValueError('allowed_domains must be a list of host names')
+        return {
+            'start_url': start_url,
+            'data_type': data_type,
+            'options': options,
+            'max_depth': int(payload.get('max_depth', CRAWL_MAX_DEPTH)),
+            'max_pages': min(int(payload.get('max_pages', CRAWL_MAX_PAGES)), CRAWL_HARD_MAX_PAGES),
+            'allowed_domains': [domain.lower() for domain in domains],
+            'include': include,
+            'workers': max(1, min(int(payload.get('workers', CRAWL_WORKERS)), 16)),
+        }
+
+    def start(self, payload):
+        config = self.build_config(payload)
+        crawl_id = self.store.create(config)
+        self._launch(crawl_id, config)
+        return crawl_id
+
+    def _launch(self, crawl_id, config):
+        if not self.store.claim_crawl(crawl_id):
+            return
+        crawl = Crawl(crawl_id, config, self.store)
+        with self._lock:
+            self._crawls[crawl_id] = crawl
+        threading.Thread(target=crawl.run, name=f'crawl-{crawl_id[:8]}', daemon=True).start()
+
+    def resume(self):
+        """Pick up crawls whose process stopped; already visited pages are not fetched again."""
+        try:
+            for crawl_id in self.store.orphaned():
+                logger.info(f"Resuming crawl {crawl_id}")
+                self._launch(crawl_id, self.store.get(crawl_id)['config'])
+        except sqlite3.Error as e:
+            logger.error(f"Failed to resume crawls: {e}")
+
+    def cancel(self, crawl_id):
+        with self._lock:
+            crawl = self._crawls.pop(crawl_id, None)
+        if crawl is not None:
+            crawl.stop()
+        self.store.finish_crawl(crawl_id, 'cancelled')
+
+    def get(self, crawl_id):
+        return self.store.get(crawl_id)
+
+    def iter_results(self, crawl_id):
+        return self.store.iter_results(crawl_id)
@@ -0,0 +1,340 @@
+import os
+import gzip
+import json
+import time
+import uuid
+import random
+import sqlite3
+import logging
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import http_client
+from host_limiter import TokenBucket, retry_after
+import metrics
+from sqlite_util import connect, pid_alive
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_DB = os.environ.get('DELIVERY_DB', 'deliveries.sqlite3')
+DELIVERY_WORKERS = int(os.environ.get('DELIVERY_WORKERS', 4))
+DELIVERY_TIMEOUT = float(os.environ.get('DELIVERY_TIMEOUT', 10))
+DELIVERY_MAX_ATTEMPTS = int(os.environ.get('DELIVERY_MAX_ATTEMPTS', 8))
+DELIVERY_BACKOFF = float(os.environ.get('DELIVERY_BACKOFF', 2))
+DELIVERY_MAX_BACKOFF = float(os.environ.get('DELIVERY_MAX_BACKOFF', 600))
+# Results larger than this are split into several numbered parts
+DELIVERY_CHUNK_BYTES = int(os.environ.get('DELIVERY_CHUNK_BYTES', 1024 * 1024))
+# Bodies at least this large are sent gzip-compressed; 0 disables compression
+DELIVERY_GZIP_MIN_BYTES = int(os.environ.get('DELIVERY_GZIP_MIN_BYTES', 1024))
+# Sustained requests per second, and burst, to any one destination host
+DELIVERY_RATE = float(os.environ.get('DELIVERY_RATE', 2))
+DELIVERY_BURST = int(os.environ.get('DELIVERY_BURST', 5))
+DELIVERY_RETENTION_SECONDS = float(os.environ.get('DELIVERY_RETENTION_SECONDS', 7 * 86400))
+
+# Responses worth trying again; any other 4xx means the request itself is unacceptable
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+# Errors about the request itself, which no retry can fix
+PERMANENT_ERRORS = (
+    requests.exceptions.InvalidSchema, requests.exceptions.MissingSchema, requests.exceptions.InvalidURL,
+    requests.exceptions.InvalidHeader, requests.exceptions.URLRequired,
+)
+
+
+def _encode_chunks(payload, chunk_bytes):
+    """Serialize ``payload`` into JSON bodies of about ``chunk_bytes`` each.
+
+    Lists are split between items; a dict is split on its ``data`` list, every part
+    repeating the other keys. Each part of a split payload carries ``part`` and ``parts``.
+    Items are encoded once and the bodies are assembled from the encoded pieces.
+    """
+    items = payload if isinstance(payload, (list, tuple)) else None
+    if isinstance(payload, dict) and isinstance(payload.get('data'), (list, tuple)):
+        items = payload['data']
+    whole = json.dumps(payload).encode()
+    if items is None or len(whole) <= chunk_bytes:
+        return [whole]
+    groups = [[]]
+    size = 0
+    for item in items:
+        encoded = json.dumps(item).encode()
+        if groups[-1] and size + len(encoded) > chunk_bytes:
+            groups.append([])
+            size = 0
+        groups[-1].append(encoded)
+        size += len(encoded) + 1
+    if len(groups) == 1:
+        return [whole]
+    bodies = []
+    for part, group in enumerate(groups, 1):
+        data = b'[' + b','.join(group) + b']'
+        rest = {key: value for key, value in payload.items() if key != 'data'} if isinstance(payload, dict) else {}
+        head = json.dumps({**rest, 'part': part, 'parts': len(groups)}).encode()
+        bodies.append(head[:-1] + b', "data": ' + data + b'}')
+    return bodies
+
+
+class Outbox:
+    """SQLite outbox of pending webhook deliveries, shared by every worker process."""
+
+    def __init__(self, path=DELIVERY_DB):
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS deliveries ('
+                'id TEXT PRIMARY KEY, delivery_id TEXT, part INTEGER, parts INTEGER, url TEXT, host TEXT, '
+                'body BLOB, gzip INTEGER, status TEXT, attempts INTEGER DEFAULT 0, next_attempt_at REAL, '
+                'owner_pid INTEGER, last_status INTEGER, error TEXT, created_at REAL, finished_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS deliveries_due ON deliveries (status, next_attempt_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS deliveries_group ON deliveries (delivery_id, part)')
+
+    def add(self, url, bodies, compress_from):
+        delivery_id = uuid.uuid4().hex
+        now = time.time()
+        rows = []
+        for part, body in enumerate(bodies, 1):
+            compressed = 0 < compress_from <= len(body)
+            rows.append((uuid.uuid4().hex, delivery_id, part, len(bodies), url, urlsplit(url).netloc.lower(),
+                         gzip.compress(body, mtime=0) if compressed else body, int(compressed), now, now))
+        with connect(self.path) as conn:
+            conn.executemany(
+                'INSERT INTO deliveries (id, delivery_id, part, parts, url, host, body, gzip, status, '
+                "next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending', ?, ?)",
+                rows,
+            )
+        return delivery_id
+
+    @staticmethod
+    def _skip(hosts):
+        return f" AND host NOT IN ({', '.join('?' * len(hosts))})" if hosts else ''
+
+    def due(self, limit, skip_hosts=()):
+        """Pending parts whose next attempt is due, oldest first, leaving out ``skip_hosts``."""
+        return connect(self.path).execute(
+            "SELECT id, host FROM deliveries WHERE status = 'pending' AND next_attempt_at <= ?"
+            f'{self._skip(skip_hosts)} ORDER BY next_attempt_at LIMIT ?',
+            (time.time(), *skip_hosts, limit),
+        ).fetchall()
+
+    def next_due(self, skip_hosts=()):
+        return connect(self.path).execute(
+            f"SELECT MIN(next_attempt_at) FROM deliveries WHERE status = 'pending'{self._skip(skip_hosts)}",
+            tuple(skip_hosts),
+        ).fetchone()[0]
+
+    def claim(self, part_id):
+        """Atomically move a pending part to sending and return it; None if another process got it first."""
+        conn = connect(self.path)
+        with conn:
+            cursor = conn.execute(
+                "UPDATE deliveries SET status = 'sending', owner_pid = ?, attempts = attempts + 1 "
+                "WHERE id = ? AND status = 'pending'",
+                (os.getpid(), part_id),
+            )
+            if cursor.rowcount != 1:
+                return None
+            return conn.execute('SELECT * FROM deliveries WHERE id = ?', (part_id,)).fetchone()
+
+    def delivered(self, part_id, status_code):
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE deliveries SET status = 'delivered', last_status = ?, error = NULL, body = NULL, "
+                'finished_at = ? WHERE id = ?',
+                (status_code, time.time(), part_id),
+            )
+
+    def retry(self, part_id, at, status_code, error, body=None, compressed=None):
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE deliveries SET status = 'pending', owner_pid = NULL, next_attempt_at = ?, last_status = ?, "
+                'error = ?, body = COALESCE(?, body), gzip = COALESCE(?, gzip) WHERE id = ?',
+                (at, status_code, error, body, compressed, part_id),
+            )
+
+    def failed(self, part_id, status_code, error):
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE deliveries SET status = 'failed', last_status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status_code, error, time.time(), part_id),
+            )
+
+    def get(self, delivery_id):
+        rows = connect(self.path).execute(
+            'SELECT part, parts, url, status, attempts, next_attempt_at, last_status, error, created_at, finished_at '
+            'FROM deliveries WHERE delivery_id = ? ORDER BY part',
+            (delivery_id,),
+        ).fetchall()
+        if not rows:
+            return None
+        statuses = {row['status'] for row in rows}
+        if statuses == {'delivered'}:
+            status = 'delivered'
+        elif 'failed' in statuses:
+            status = 'failed'
+        else:
+            status = 'pending'
+        return {'delivery_id': delivery_id, 'url': rows[0]['url'], 'status': status,
+                'parts': [{key: row[key] for key in row.keys() if key not in ('url', 'parts')} for row in rows]}
+
+    def recover(self):
+        """Return parts left mid-send by a process that died to the pending queue."""
+        conn = connect(self.path)
+        sending = conn.execute("SELECT id, owner_pid FROM deliveries WHERE status = 'sending'").fetchall()
+        with conn:
+            for row in sending:
+                if row['owner_pid'] is None or not pid_alive(row['owner_pid']):
+                    conn.execute("UPDATE deliveries SET status = 'pending', owner_pid = NULL WHERE id = ?",
+                                 (row['id'],))
+
+    def purge(self, older_than):
+        with connect(self.path) as conn:
+            conn.execute("DELETE FROM deliveries WHERE status IN ('delivered', 'failed') AND finished_at < ?",
+                         (time.time() - older_than,))
+
+
+class Deliverer:
+    """Sends outbox entries from a background dispatcher thread.
+
+    At most ``workers`` parts are in flight per process, each destination host is held
+    to a token bucket, and failed sends are retried with exponential backoff (honouring
+    Retry-After) until ``max_attempts``. Rate limits apply per worker process.
+    """
+
+    def __init__(self, outbox=None, workers=DELIVERY_WORKERS, max_attempts=DELIVERY_MAX_ATTEMPTS,
+                 rate=DELIVERY_RATE, burst=DELIVERY_BURST):
+        self.outbox = outbox or Outbox()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        # host -> monotonic time its bucket has a token again
+        self._held = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = None
+        self._thread = None
+
+    def enqueue(self, url, payload, chunk_bytes=DELIVERY_CHUNK_BYTES, compress_from=DELIVERY_GZIP_MIN_BYTES):
+        """Store ``payload`` for delivery to ``url`` and return its delivery id."""
+        delivery_id = self.outbox.add(url, _encode_chunks(payload, chunk_bytes), compress_from)
+        self._wake.set()
+        return delivery_id
+
+    def get(self, delivery_id):
+        return self.outbox.get(delivery_id)
+
+    def start(self):
+        """Resume deliveries left by a previous run and start the dispatcher in this process."""
+        try:
+            self.outbox.purge(DELIVERY_RETENTION_SECONDS)
+            self.outbox.recover()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to resume deliveries: {e}")
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='delivery')
+        self._thread = threading.Thread(target=self._dispatch, name='delivery-dispatch', daemon=True)
+        self._thread.start()
+
+    def _dispatch(self):
+        while True:
+            self._wake.clear()
+            try:
+                wait = self._dispatch_due()
+            except sqlite3.Error as e:
+                logger.error(f"Delivery dispatch failed: {e}")
+                wait = 5
+            self._wake.wait(wait)
+
+    def _dispatch_due(self):
+        """Hand every due part that has a free worker and rate-limit token to the executor;
+        return how long to sleep before looking again."""
+        with self._lock:
+            free = self.workers - self._in_flight
+        if free <= 0:
+            return 30  # a finishing send wakes the dispatcher
+        now = time.monotonic()
+        held = {host: until for host, until in self._held.items() if until > now}
+        # Fetch some extra rows in case hosts run out of tokens during this pass
+        for row in self.outbox.due(free * 4, tuple(held)):
+            if free <= 0:
+                break
+            if row['host'] in held:
+                continue
+            bucket = self._buckets.get(row['host'])
+            if bucket is None:
+                bucket = self._buckets[row['host']] = TokenBucket(self.rate, self.burst)
+            delay = bucket.take()
+            if delay:
+                held[row['host']] = now + delay
+                continue
+            part = self.outbox.claim(row['id'])
+            if part is None:
+                continue
+            free -= 1
+            with self._lock:
+                self._in_flight += 1
+            self._executor.submit(self._send, part)
+        self._held = held
+        next_due = self.outbox.next_due(tuple(held))
+        wait = 30 if next_due is None else max(0.05, next_due - time.time())
+        return min([wait, *(until - now for until in held.values())])
+
+    def _send(self, part):
+        try:
+            self._attempt(part)
+        except Exception as e:
+            logger.error(f"Delivery {part['delivery_id']} part {part['part']} failed unexpectedly: {e}")
+            self.outbox.retry(part['id'], time.time() + self._backoff(part['attempts']), None, str(e))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._wake.set()
+
+    def _attempt(self, part):
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Delivery-Id': part['delivery_id'],
+            'X-Delivery-Part': f"{part['part']}/{part['parts']}",
+        }
+        if part['gzip']:
+            headers['Content-Encoding'] = 'gzip'
+        label = f"Delivery {part['delivery_id']} part {part['part']}/{part['parts']} to {part['url']}"
+        status_code = None
+        requested_delay = None
+        try:
+            with metrics.span('deliver', part['url'], 'delivery'):
+                # Deliveries keep their own per-host rate limit and retries
+                response = http_client.post(part['url'], data=part['body'], headers=headers,
+                                            timeout=DELIVERY_TIMEOUT, limit=False)
+            status_code = response.status_code
+            if response.ok:
+                self.outbox.delivered(part['id'], status_code)
+                metrics.DELIVERIES.inc('delivered')
+                return
+            if status_code == 415 and part['gzip']:
+                # The endpoint does not take compressed bodies; resend this part as plain JSON
+                logger.info(f"{label} rejected gzip, resending uncompressed")
+                self.outbox.retry(part['id'], time.time(), status_code, 'gzip rejected',
+                                  gzip.decompress(part['body']), 0)
+                return
+            error = f"HTTP {status_code}"
+            requested_delay = retry_after(response.headers.get('Retry-After'))
+            retryable = status_code in RETRY_STATUSES
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+            retryable = not isinstance(e, PERMANENT_ERRORS)
+        if not retryable or part['attempts'] >= self.max_attempts:
+            logger.error(f"{label} failed after {part['attempts']} attempts: {error}")
+            self.outbox.failed(part['id'], status_code, error)
+            metrics.DELIVERIES.inc('failed')
+            return
+        delay = max(requested_delay or 0, self._backoff(part['attempts']))
+        logger.warning(f"{label} failed ({error}), retrying in {delay:.0f}s")
+        self.outbox.retry(part['id'], time.time() + delay, status_code, error)
+        metrics.DELIVERIES.inc('retried')
+
+    @staticmethod
+    def _backoff(attempts):
+        return min(DELIVERY_MAX_BACKOFF, DELIVERY_BACKOFF * 2 ** (attempts - 1)) * random.uniform(0.5, 1.5)
@@ -0,0 +1,278 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pool settings (per gunicorn worker)
+CHROME_POOL_SIZE = int(os.environ.get('CHROME_POOL_SIZE', 2))
+CHROME_PREWARM = int(os.environ.get('CHROME_PREWARM', 0))
+CHROME_MAX_PAGES = int(os.environ.get('CHROME_MAX_PAGES', 50))
+CHROME_MAX_RSS_MB = int(os.environ.get('CHROME_MAX_RSS_MB', 1024))
+CHROME_CHECKOUT_TIMEOUT = float(os.environ.get('CHROME_CHECKOUT_TIMEOUT', 30))
+# Resource groups the browser never downloads; extractors only read the DOM
+BROWSER_BLOCK = tuple(name.strip() for name in os.environ.get('BROWSER_BLOCK', 'images,css,fonts,media,trackers').split(',')
+                      if name.strip())
+BROWSER_WAIT_TIMEOUT = float(os.environ.get('BROWSER_WAIT_TIMEOUT', 10))
+# Stop waiting once the page has loaded and the DOM has not changed for this long
+BROWSER_SETTLE_MS = int(os.environ.get('BROWSER_SETTLE_MS', 1000))
+
+# URL patterns for Network.setBlockedURLs; the trailing * also covers query strings
+BLOCKED_URL_PATTERNS = {
+    'images': ('*.png*', '*.jpg*', '*.jpeg*', '*.gif*', '*.webp*', '*.avif*', '*.svg*', '*.ico*'),
+    'css': ('*.css*',),
+    'fonts': ('*.woff*', '*.woff2*', '*.ttf*', '*.otf*', '*.eot*'),
+    'media': ('*.mp4*', '*.webm*', '*.ogg*', '*.mp3*', '*.m4a*', '*.m3u8*', '*.mpd*'),
+    'trackers': ('*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*',
+                 '*googlesyndication.com*', '*adservice.google.*', '*facebook.net*', '*hotjar.com*',
+                 '*scorecardresearch.com*', '*criteo.com*', '*taboola.com*', '*outbrain.com*'),
+}
+
+# Tracks the time of the last DOM mutation so waits can end once the page settles
+_SETTLE_JS = '''
+if (!window.__scraperObserver) {
+    window.__lastMutation = Date.now();
+    window.__scraperObserver = new MutationObserver(function () { window.__lastMutation = Date.now(); });
+    window.__scraperObserver.observe(document, {childList: true, subtree: true, attributes: true});
+}
+'''
+_READY_JS = '''
+return document.querySelector(arguments[0]) !== null ? 'match'
+    : (document.readyState === 'complete' && Date.now() - window.__lastMutation > arguments[1]) ? 'settled' : null;
+'''
+
+
+class DriverPoolTimeout(RuntimeError):
+    pass
+
+
+# selenium and webdriver_manager are imported on first use; most workers never launch Chrome
+def _webdriver_exception():
+    from selenium.common.exceptions import WebDriverException
+    return WebDriverException
+
+
+def wait_for_selector(driver, selector, timeout=BROWSER_WAIT_TIMEOUT, settle_ms=BROWSER_SETTLE_MS):
+    """Wait until ``selector`` matches, or until the page has loaded and stopped changing.
+
+    Returns True if the selector matched. Never raises on timeout; callers parse
+    whatever the page rendered.
+    """
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.support.ui import WebDriverWait
+    driver.execute_script(_SETTLE_JS)
+    try:
+        state = WebDriverWait(driver, timeout, poll_frequency=0.2).until(
+            lambda d: d.execute_script(_READY_JS, selector, settle_ms))
+    except TimeoutException:
+        return False
+    return state == 'match'
+
+
+def _process_tree_rss_mb(root_pid):
+    """Sum the RSS of a process and all of its descendants (Linux only)."""
+    try:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            # The command name may contain spaces, so split after the closing paren
+            ppid = int(stat.rsplit(')', 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        total_kb = 0
+        pending = [root_pid]
+        while pending:
+            pid = pending.pop()
+            pending.extend(children.get(pid, []))
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total_kb += int(line.split()[1])
+                            break
+            except OSError:
+                continue
+        return total_kb / 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.blocked = None
+
+    def block(self, groups):
+        """Block the given BLOCKED_URL_PATTERNS groups for the next page loads."""
+        groups = tuple(sorted(groups))
+        if groups == self.blocked:
+            return
+        patterns = [pattern for group in groups for pattern in BLOCKED_URL_PATTERNS.get(group, ())]
+        try:
+            if self.blocked is None:
+                self.driver.execute_cdp_cmd('Network.enable', {})
+            self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': patterns})
+            self.blocked = groups
+        except Exception as e:
+            logger.warning(f"Could not block resources in Chrome: {e}")
+
+    def rss_mb(self):
+        process = getattr(self.driver.service, 'process', None)
+        return _process_tree_rss_mb(process.pid) if process else None
+
+    def is_healthy(self):
+        try:
+            self.driver.execute_script('return 1')
+            return True
+        except _webdriver_exception():
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning(f"Error shutting down Chrome driver: {e}")
+
+
+class DriverPool:
+    """A bounded pool of long-lived headless Chrome drivers."""
+
+    def __init__(self, size=CHROME_POOL_SIZE, max_pages=CHROME_MAX_PAGES, max_rss_mb=CHROME_MAX_RSS_MB,
+                 checkout_timeout=CHROME_CHECKOUT_TIMEOUT):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._driver_path = None
+
+    def driver_path(self):
+        # Resolve the chromedriver binary once instead of on every launch
+        with self._lock:
+            if self._driver_path is None:
+                self._driver_path = os.environ.get('CHROMEDRIVER_PATH')
+            if self._driver_path is None:
+                from webdriver_manager.chrome import ChromeDriverManager
+                self._driver_path = ChromeDriverManager().install()
+            return self._driver_path
+
+    def _options(self):
+        from selenium.webdriver.chrome.options import Options
+        options = Options()
+        # Return from driver.get() at DOMContentLoaded; wait_for_selector decides when the page is ready
+        options.page_load_strategy = 'eager'
+        options.add_argument("--headless")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        return options
+
+    def _launch(self):
+        with self._lock:
+            self._count += 1
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        try:
+            driver = webdriver.Chrome(service=Service(self.driver_path()), options=self._options())
+        except Exception:
+            with self._lock:
+                self._count -= 1
+            raise
+        logger.info(f"Launched pooled Chrome driver ({self._count}/{self.size})")
+        return PooledDriver(driver)
+
+    def _discard(self, pooled):
+        with self._lock:
+            self._count -= 1
+        pooled.quit()
+
+    def start(self, prewarm=CHROME_PREWARM):
+        """Pre-launch ``prewarm`` drivers in the background. Without prewarming nothing is
+        started; the driver binary is resolved on the first checkout."""
+        if prewarm <= 0:
+            return
+
+        def warm():
+            try:
+                while self._count < min(prewarm, self.size):
+                    self._idle.put(self._launch())
+            except Exception as e:
+                logger.error(f"Failed to pre-warm Chrome driver pool: {e}")
+        threading.Thread(target=warm, name='driver-pool-warm', daemon=True).start()
+
+    def checkout(self):
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise DriverPoolTimeout(f"No Chrome driver available after {self.checkout_timeout}s")
+        try:
+            while True:
+                try:
+                    pooled = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._launch()
+                if pooled.is_healthy():
+                    return pooled
+                logger.warning("Discarding unhealthy pooled Chrome driver")
+                self._discard(pooled)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, pooled, broken=False):
+        try:
+            pooled.pages += 1
+            if broken or pooled.pages >= self.max_pages:
+                self._discard(pooled)
+                return
+            rss = pooled.rss_mb()
+            if rss is not None and rss > self.max_rss_mb:
+                logger.info(f"Recycling Chrome driver using {rss:.0f} MB")
+                self._discard(pooled)
+                return
+            try:
+                pooled.driver.delete_all_cookies()
+                pooled.driver.get('about:blank')
+            except _webdriver_exception():
+                self._discard(pooled)
+                return
+            self._idle.put(pooled)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def driver(self, block=BROWSER_BLOCK):
+        with metrics.span('browser'):
+            pooled = self.checkout()
+            broken = False
+            try:
+                pooled.block(block)
+                yield pooled.driver
+            except _webdriver_exception():
+                broken = not pooled.is_healthy()
+                raise
+            finally:
+                self.checkin(pooled, broken=broken)
+
+    def close(self):
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(pooled)
+
+
+driver_pool = DriverPool()
+atexit.register(driver_pool.close)
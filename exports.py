@@ -0,0 +1,363 @@
+import io
+import os
+import re
+import csv
+import json
+import math
+import logging
+import zipfile
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from importlib.util import find_spec
+from urllib.parse import urlsplit
+import http_client
+from host_limiter import asset_limiter
+
+# Optional, and only imported by the table export paths that use them
+HAS_NUMPY = find_spec('numpy') is not None
+HAS_PYARROW = find_spec('pyarrow') is not None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CONCURRENCY = int(os.environ.get('EXPORT_CONCURRENCY', 8))
+EXPORT_MAX_IMAGE_BYTES = int(os.environ.get('EXPORT_MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+EXPORT_IMAGE_TIMEOUT = float(os.environ.get('EXPORT_IMAGE_TIMEOUT', 5))
+# Rows serialized per chunk (and per Parquet row group) when streaming tables
+EXPORT_TABLE_BATCH_ROWS = int(os.environ.get('EXPORT_TABLE_BATCH_ROWS', 5000))
+
+# format -> (mimetype, file extension)
+TABLE_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'ndjson': ('application/x-ndjson', '.ndjson'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+IMAGE_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/svg+xml': '.svg',
+    'image/avif': '.avif',
+    'image/bmp': '.bmp',
+    'image/x-icon': '.ico',
+    'image/vnd.microsoft.icon': '.ico',
+}
+
+# Leading bytes of common image formats, used when the server sends no useful Content-Type
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'GIF87a', '.gif'),
+    (b'GIF89a', '.gif'),
+    (b'BM', '.bmp'),
+)
+
+
+class ChunkSink(io.RawIOBase):
+    """A write-only, non-seekable buffer that is drained after every write burst."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet writers record offsets, so report bytes written so far
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def image_extension(img_url, content_type, data):
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in IMAGE_EXTENSIONS:
+        return IMAGE_EXTENSIONS[content_type]
+    for signature, ext in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return ext
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    ext = os.path.splitext(urlsplit(img_url).path)[1].lower()
+    if ext:
+        return ext
+    return mimetypes.guess_extension(content_type) or '.img'
+
+
+def image_filename(caption, index, ext, used_names):
+    # Captions often fall back to the file name, so drop its extension first
+    caption = re.sub(r'\.(png|jpe?g|gif|webp|svg|avif|bmp|ico)$', '', caption or '', flags=re.IGNORECASE)
+    slug = re.sub(r'[^\w\- ]+', '', caption).strip().replace(' ', '_')[:80]
+    base = slug or f'image_{index + 1}'
+    name = f'{base}{ext}'
+    counter = 2
+    while name in used_names:
+        name = f'{base}_{counter}{ext}'
+        counter += 1
+    used_names.add(name)
+    return name
+
+
+def download_image(img_url, max_bytes=EXPORT_MAX_IMAGE_BYTES, timeout=EXPORT_IMAGE_TIMEOUT):
+    with http_client.get(img_url, timeout=timeout, stream=True, limiter=asset_limiter) as response:
+        response.raise_for_status()
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ValueError(f"Image is {declared} bytes, limit is {max_bytes}")
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(64 * 1024):
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"Image exceeds {max_bytes} bytes")
+            chunks.append(chunk)
+        return b''.join(chunks), response.headers.get('Content-Type', '')
+
+
+def stream_image_zip(images, concurrency=EXPORT_CONCURRENCY, max_bytes=EXPORT_MAX_IMAGE_BYTES):
+    """Download ``(url, caption)`` pairs concurrently and yield a ZIP archive in chunks.
+
+    At most ``2 * concurrency`` images are held in memory at once. A manifest.json
+    listing saved files and failed downloads is written as the last entry.
+    """
+    sink = ChunkSink()
+    saved = []
+    failed = []
+    used_names = set()
+    # Images are already compressed, so store them instead of deflating
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zip_file, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        queued = iter(enumerate(images))
+        pending = {}
+
+        def submit_next():
+            item = next(queued, None)
+            if item is not None:
+                index, (img_url, caption) = item
+                pending[pool.submit(download_image, img_url, max_bytes)] = (index, img_url, caption)
+
+        for _ in range(concurrency * 2):
+            submit_next()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, img_url, caption = pending.pop(future)
+                try:
+                    data, content_type = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to download {img_url}: {e}")
+                    failed.append({'url': img_url, 'error': str(e)})
+                else:
+                    name = image_filename(caption, index, image_extension(img_url, content_type, data), used_names)
+                    zip_file.writestr(name, data)
+                    saved.append({'url': img_url, 'file': name, 'bytes': len(data)})
+                submit_next()
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        manifest = {'saved': saved, 'failed': failed}
+        zip_file.writestr('manifest.json', json.dumps(manifest, indent=2))
+    yield sink.drain()
+
+
+def column_names(header, width):
+    """Names for ``width`` columns, taken from the header where present and made unique."""
+    names = []
+    used = set()
+    for i in range(width):
+        base = (header[i].strip() if header and i < len(header) else '') or f'column_{i + 1}'
+        name = base
+        counter = 2
+        while name in used:
+            name = f'{base}_{counter}'
+            counter += 1
+        used.add(name)
+        names.append(name)
+    return names
+
+
+def _infer_types_numpy(rows, width):
+    import numpy as np
+    grid = np.array([row + [''] * (width - len(row)) for row in rows], dtype=str).reshape(len(rows), width)
+    grid = np.char.replace(np.char.strip(grid), ',', '')
+    types = []
+    for column in grid.T:
+        present = column[column != '']
+        try:
+            numbers = present.astype(float)
+        except ValueError:
+            types.append('string')
+            continue
+        digits = np.char.lstrip(present, '+-')
+        if not present.size or not np.isfinite(numbers).all():
+            types.append('string')
+        elif np.char.isdigit(digits).all():
+            # Zero-padded codes (zip codes, ids) lose information as integers
+            padded = np.char.startswith(digits, '0') & (np.char.str_len(digits) > 1)
+            if padded.any():
+                types.append('string')
+            else:
+                types.append('integer' if np.abs(numbers).max() < 1e18 else 'number')
+        else:
+            types.append('number')
+    return types
+
+
+def _infer_type(cells):
+    present = [cell.strip().replace(',', '') for cell in cells]
+    present = [cell for cell in present if cell]
+    if not present:
+        return 'string'
+    try:
+        numbers = [float(cell) for cell in present]
+    except ValueError:
+        return 'string'
+    if not all(math.isfinite(number) for number in numbers):
+        return 'string'
+    digits = [cell.lstrip('+-') for cell in present]
+    if all(cell.isdigit() for cell in digits):
+        if any(len(cell) > 1 and cell.startswith('0') for cell in digits):
+            return 'string'
+        return 'integer' if max(abs(number) for number in numbers) < 1e18 else 'number'
+    return 'number'
+
+
+def infer_column_types(rows, width):
+    """Return ``'integer'``, ``'number'`` or ``'string'`` for each column.
+
+    Blank cells are treated as missing values and thousands separators are ignored.
+    Each column is parsed in one vectorized pass when numpy is installed.
+    """
+    if HAS_NUMPY:
+        return _infer_types_numpy(rows, width)
+    return [_infer_type([row[i] if i < len(row) else '' for row in rows]) for i in range(width)]
+
+
+def convert_cell(cell, column_type):
+    if column_type == 'string':
+        return cell
+    text = cell.strip().replace(',', '')
+    if not text:
+        return None
+    return int(text) if column_type == 'integer' else float(text)
+
+
+def table_schema(table):
+    """Return ``(names, types)`` for a table from ``extract_tables(soup, with_headers=True)``."""
+    width = max(len(row) for row in table['rows'])
+    return column_names(table['header'], width), infer_column_types(table['rows'], width)
+
+
+def _typed_rows(rows, types):
+    for row in rows:
+        yield [convert_cell(row[i] if i < len(row) else '', column_type) for i, column_type in enumerate(types)]
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_tables_csv(tables):
+    """Yield ``(number, table)`` pairs as CSV. With several tables each one gets a
+    "Table N" title row and a blank separator, as the original export did."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    labelled = len(tables) > 1
+    for number, table in tables:
+        names, types = table_schema(table)
+        if labelled:
+            writer.writerow([f'Table {number}'])
+        if table['header']:
+            writer.writerow(names)
+        for batch in _batched(_typed_rows(table['rows'], types), EXPORT_TABLE_BATCH_ROWS):
+            writer.writerows(['' if value is None else value for value in row] for row in batch)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+        if labelled:
+            writer.writerow([])
+    yield buffer.getvalue().encode('utf-8')
+
+
+def stream_tables_ndjson(tables):
+    """Yield one JSON object per row keyed by column name; ``_table`` is added when
+    several tables are exported together."""
+    labelled = len(tables) > 1
+    for number, table in tables:
+        names, types = table_schema(table)
+        for batch in _batched(_typed_rows(table['rows'], types), EXPORT_TABLE_BATCH_ROWS):
+            lines = []
+            for row in batch:
+                record = dict(zip(names, row))
+                if labelled:
+                    record = {'_table': number, **record}
+                lines.append(json.dumps(record, ensure_ascii=False))
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def _write_parquet(table, sink):
+    """Write one table to ``sink`` a row group at a time, yielding after each group."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    arrow_types = {'integer': pa.int64(), 'number': pa.float64(), 'string': pa.string()}
+    names, types = table_schema(table)
+    schema = pa.schema([(name, arrow_types[column_type]) for name, column_type in zip(names, types)])
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in _batched(_typed_rows(table['rows'], types), EXPORT_TABLE_BATCH_ROWS):
+            columns = [pa.array(column, type=field.type) for column, field in zip(zip(*batch), schema)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            yield
+
+
+def stream_tables_parquet(tables):
+    """Yield a Parquet file, or a ZIP of one Parquet file per table when several are
+    selected since their schemas differ."""
+    if len(tables) == 1:
+        sink = ChunkSink()
+        for _ in _write_parquet(tables[0][1], sink):
+            yield sink.drain()
+        yield sink.drain()
+        return
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as zip_file:
+        for number, table in tables:
+            table_sink = ChunkSink()
+            with zip_file.open(f'table_{number}.parquet', 'w', force_zip64=True) as entry:
+                for _ in _write_parquet(table, table_sink):
+                    entry.write(table_sink.drain())
+                    yield sink.drain()
+                entry.write(table_sink.drain())
+            yield sink.drain()
+    yield sink.drain()
+
+
+def table_export(export_format, tables):
+    """Return ``(chunks, mimetype, filename)`` for streaming ``(number, table)`` pairs."""
+    mimetype, ext = TABLE_FORMATS[export_format]
+    if export_format == 'parquet':
+        if not HAS_PYARROW:
+            raise ValueError('Parquet export requires pyarrow')
+        if len(tables) > 1:
+            return stream_tables_parquet(tables), 'application/zip', 'tables.zip'
+        return stream_tables_parquet(tables), mimetype, f'tables{ext}'
+    if export_format == 'ndjson':
+        return stream_tables_ndjson(tables), mimetype, f'tables{ext}'
+    return stream_tables_csv(tables), mimetype, f'tables{ext}'
@@ -0,0 +1,296 @@
+import os
+from itertools import islice
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+from bs4 import UnicodeDammit
+import metrics
+from headlines import HEADLINE_TAGS, iter_headlines
+from parsing import parse
+from tables import iter_tables, parse_indexes
+from batch import positive_int
+
+# Tags each extractor needs; everything else is skipped while parsing
+TABLE_TAGS = ('table',)
+IMAGE_TAGS = ('img', 'image', 'figure')
+VIDEO_TAGS = ('video', 'figure')
+PDF_LINK_TAGS = ('a',)
+
+IMAGE_FORMATS = {
+    'png': ['.png'],
+    'jpg': ['.jpg', '.jpeg'],
+    'webp': ['.webp'],
+    'gif': ['.gif'],
+    'all': ['.png', '.jpg', '.jpeg', '.webp', '.gif']
+}
+
+
+def _has_extension(img_url, image_format):
+    lowered = img_url.lower()
+    return any(lowered.endswith(ext) for ext in IMAGE_FORMATS[image_format])
+
+
+def iter_images(soup, url, image_format, include_unknown=False):
+    """Yield ``(image_url, caption)`` for each distinct image URL, in document order.
+
+    With ``include_unknown``, URLs without any image extension (CDN paths, query
+    strings) are yielded too, for a caller that checks the real content type.
+    """
+    seen = set()
+    # Include both <img> and <image> tags
+    for img in soup.find_all(['img', 'image']):
+        # Check multiple attributes for image source
+        img_url = img.get('src') or img.get('data-src') or img.get('data-lazy-src')
+        if img_url and (_has_extension(img_url, image_format)
+                        or include_unknown and not _has_extension(img_url, 'all')):
+            full_url = urljoin(url, img_url)
+            if full_url in seen:
+                continue
+            seen.add(full_url)
+            # Look for a parent figure tag and extract figcaption
+            caption = None
+            figure = img.find_parent('figure')
+            if figure:
+                figcaption = figure.find('figcaption')
+                if figcaption:
+                    caption = figcaption.get_text(strip=True)
+            # Fallback to alt attribute or filename
+            if not caption:
+                caption = img.get('alt') or os.path.basename(full_url)
+            yield full_url, caption
+
+
+def extract_images(soup, url, image_format):
+    return dict(iter_images(soup, url, image_format))
+
+
+def image_selector(image_format):
+    """CSS selector for the images extract_images would keep, used to wait for them in a browser."""
+    return ', '.join(f'img[{attr}$="{ext}" i]' for ext in IMAGE_FORMATS[image_format]
+                     for attr in ('src', 'data-src', 'data-lazy-src'))
+
+
+def iter_videos(soup, url, video_format):
+    """Yield ``(video_url, caption)`` for the first usable source of each <video>."""
+    seen = set()
+    for video in soup.find_all('video'):
+        video_sources = video.find_all('source')
+        caption = None
+        # Look for a parent figure tag and extract figcaption
+        figure = video.find_parent('figure')
+        if figure:
+            figcaption = figure.find('figcaption')
+            if figcaption:
+                caption = figcaption.get_text(strip=True)
+
+        # Take the first valid source per video tag
+        for source in video_sources:
+            video_url = source.get('src')
+            if video_url:
+                if video_format != 'all' and not video_url.endswith(video_format):
+                    continue
+                if not video_url.startswith('http'):
+                    base_url = url.rsplit('/', 1)[0]
+                    video_url = urljoin(base_url, video_url)  # Use urljoin for proper URL construction
+
+                # Use caption if found, else infer from URL or title attribute
+                if not caption:
+                    caption = source.get('title') or os.path.basename(video_url)
+
+                if video_url not in seen:
+                    seen.add(video_url)
+                    yield video_url, caption
+                break  # Stop after the first valid source for this video
+
+
+def extract_videos(soup, url, video_format):
+    return tuple(iter_videos(soup, url, video_format))
+
+
+def extract_headlines(soup):
+    return tuple(iter_headlines(soup)) or None
+
+
+def _pdf_link(href):
+    if href.lower().endswith('.pdf') and href.startswith(('http://', 'https://')):
+        return {'url': href, 'name': href.split('/')[-1].split('?')[0]}
+    return None
+
+
+class _PDFLinkScanner(HTMLParser):
+    """Collects absolute PDF links from <a> tags without building a tree."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.found = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            # Like BeautifulSoup, the last of repeated attributes wins
+            href = dict(attrs).get('href')
+            link = _pdf_link(href) if href is not None else None
+            if link:
+                self.found.append(link)
+
+
+def iter_pdf_links(content, encoding=None, chunk_size=64 * 1024):
+    """Scan raw page markup for distinct absolute PDF links, yielding each as soon as it is read.
+
+    The markup is fed to the scanner in chunks, so a consumer that stops early skips the
+    rest of the document.
+    """
+    if isinstance(content, bytes):
+        content = UnicodeDammit(content, [encoding] if encoding else []).unicode_markup or ''
+    scanner = _PDFLinkScanner()
+    seen = set()
+    for start in range(0, len(content) or 1, chunk_size):
+        scanner.feed(content[start:start + chunk_size])
+        if start + chunk_size >= len(content):
+            scanner.close()
+        for link in scanner.found:
+            if link['url'] not in seen:
+                seen.add(link['url'])
+                yield link
+        scanner.found.clear()
+
+
+def extract_pdf_links(soup):
+    seen_urls = set()
+    pdf_links = []
+    for link in soup.find_all('a', href=True):
+        pdf_link = _pdf_link(link['href'])
+        if pdf_link and pdf_link['url'] not in seen_urls:
+            seen_urls.add(pdf_link['url'])
+            pdf_links.append(pdf_link)
+    return pdf_links
+
+
+def movie_search_url(movie_name):
+    return f"https://www.imdb.com/find?q={movie_name.replace(' ', '+')}&ref_=nv_sr_sm"
+
+
+def extract_movie_link(soup):
+    first_result = soup.select_one('.ipc-metadata-list-summary-item a')
+    if not first_result:
+        return None
+    return "https://www.imdb.com" + first_result.get('href', '')
+
+
+def extract_movie_details(soup, movie_url):
+    # Extracting Title
+    title_elem = soup.select_one('h1')
+    title = title_elem.text.strip() if title_elem else "N/A"
+
+    # Extracting Poster URL
+    poster_elem = soup.select_one('img.ipc-image')
+    poster_url = poster_elem.get('src', "N/A") if poster_elem else "N/A"
+
+    # Extracting Year
+    year_elem = soup.select_one('a[href*="/releaseinfo"]')
+    year = year_elem.text.strip() if year_elem else "N/A"
+
+    # Extracting Rating
+    rating_elem = soup.select_one('div[data-testid="hero-rating-bar__aggregate-rating__score"] span')
+    rating = f"{rating_elem.text.strip()}/10" if rating_elem else "N/A"
+
+    # Extracting Plot (more specific and avoiding duplicates)
+    plot_elem = soup.select_one('span[data-testid="plot-xl"]')
+    plot = plot_elem.text.strip() if plot_elem else "N/A"
+
+    # Extracting Genresss (Multiple if available)
+    genre_elems = soup.select('.ipc-chip__text')
+    genres = [genre.text.strip() for genre in genre_elems] if genre_elems else ["N/A"]
+
+    return {
+        "name": title,
+        "poster_url": poster_url,
+        "year": year,
+        "rating": rating,
+        "plot": plot,
+        "genre": ', '.join(genres),
+        "movie_link": movie_url
+    }
+
+
+def book_search_url(book_name):
+    return f"https://openlibrary.org/search?q={book_name.replace(' ', '+')}&mode=everything"
+
+
+def extract_book_result(soup):
+    """Return the basic details of the first search result and its detail page URL."""
+    first_result = soup.select_one('li.searchResultItem')
+    if not first_result:
+        return None, None
+
+    # Extract basic details from search result
+    title_elem = first_result.select_one('h3.booktitle a')
+    title = title_elem.text.strip() if title_elem else "N/A"
+
+    cover_elem = first_result.select_one('span.bookcover img')
+    cover_url = "https:" + cover_elem['src'] if cover_elem else "N/A"
+
+    author_elem = first_result.select_one('span.bookauthor a')
+    author = author_elem.text.strip() if author_elem else "N/A"
+
+    year_elem = first_result.select_one('span.resultDetails span')
+    year = year_elem.text.strip().replace("First published in ", "") if year_elem else "N/A"
+
+    rating_elem = first_result.select_one('span.ratingsByline span[itemprop="ratingValue"]')
+    rating = rating_elem.text.strip() if rating_elem else "N/A"
+
+    book_link = first_result.select_one('h3.booktitle a')['href']
+    detail_url = f"https://openlibrary.org{book_link}"
+    return {
+        "name": title,
+        "cover_url": cover_url,
+        "author": author,
+        "year": year,
+        "rating": rating,
+    }, detail_url
+
+
+def extract_book_description(soup):
+    description_elem = soup.select_one('div.read-more__content')
+    if description_elem:
+        paragraphs = [p.text.strip() for p in description_elem.find_all('p') if not p.find('a')]
+        return " ".join(paragraphs) if paragraphs else "N/A"
+    return "N/A"
+
+
+def item_limit(options):
+    """The positive ``num_items`` option as an int, or None for no limit."""
+    return positive_int(options, 'num_items')
+
+
+def table_filters(options):
+    """``selector`` and ``indexes`` for the table extractors from the ``table_selector`` and
+    ``table_index`` options, taking every ``table_index`` of a form; ValueError for a
+    malformed index."""
+    indexes = options.getlist('table_index') if hasattr(options, 'getlist') else options.get('table_index')
+    return {'selector': options.get('table_selector') or None, 'indexes': parse_indexes(indexes)}
+
+
+# Single-page extractors: data_type -> (tags to parse, extract(soup, url, options))
+STATIC_EXTRACTORS = {
+    'table': (TABLE_TAGS, lambda soup, url, options: list(islice(iter_tables(soup, **table_filters(options)),
+                                                                 item_limit(options)))),
+    'image': (IMAGE_TAGS, lambda soup, url, options: extract_images(soup, url, options.get('image_format', 'all'))),
+    'video': (VIDEO_TAGS, lambda soup, url, options: extract_videos(soup, url, options.get('video_format', 'all'))),
+    'news': (HEADLINE_TAGS, lambda soup, url, options: extract_headlines(soup)),
+    'pdf': (PDF_LINK_TAGS, lambda soup, url, options: extract_pdf_links(soup)),
+}
+
+
+def extract_page(data_type, content, url, options):
+    """Parse raw page bytes and run one static extractor; safe to call in a worker process."""
+    only, extract = STATIC_EXTRACTORS[data_type]
+    if data_type == 'table' and options.get('table_selector'):
+        only = None  # the selector may name elements around the tables
+    with metrics.span('parse', url):
+        soup = parse(content, only=only)
+    with metrics.span('extract', url):
+        return extract(soup, url, options)
+
+
+def parse_and_call(name, content, *args):
+    """Parse a full page and call one of the movie/book helpers above by name."""
+    return globals()[name](parse(content), *args)
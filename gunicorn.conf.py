@@ -0,0 +1,9 @@
+# Import the app once in the master so workers share its parsed modules copy-on-write.
+# Bind address and worker count keep gunicorn's defaults ($PORT, $WEB_CONCURRENCY).
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Threads and executors do not survive fork, so each worker starts its own
+    from app import start_background_services
+    start_background_services()
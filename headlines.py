@@ -0,0 +1,162 @@
+import os
+import re
+import random
+from collections import defaultdict
+
+# Headlines sharing at least this fraction of their word pairs are treated as the same story
+HEADLINE_SIMILARITY = float(os.environ.get('HEADLINE_SIMILARITY', 0.6))
+NEWS_AGGREGATE_MAX_URLS = int(os.environ.get('NEWS_AGGREGATE_MAX_URLS', 50))
+
+HEADLINE_TAGS = ('h1', 'h2', 'h3', 'a')
+MIN_HEADLINE_LENGTH = 15
+BLACKLIST = ('home', 'about', 'contact', 'login', 'register')
+
+# Any blacklisted word anywhere in the text, matched like `phrase in text.lower()`
+_BLACKLIST_RE = re.compile('|'.join(map(re.escape, BLACKLIST)), re.IGNORECASE)
+_HINT_RE = re.compile('excerpt|title|headline', re.IGNORECASE)
+_WORD_RE = re.compile(r'\w+')
+
+# Base score of a candidate by where it was found; 'hinted' is a link with a headline-like class
+TAG_WEIGHTS = {'h1': 1.0, 'h2': 0.9, 'h3': 0.8, 'hinted': 0.7, 'a': 0.4}
+# Added to an aggregated headline's score for every other source carrying the same story
+SOURCE_BONUS = 0.5
+
+# MinHash over 16 hash functions, banded 8 x 2 so that pairs around the similarity
+# threshold almost always share a bucket; candidates are then checked exactly
+_MINHASH_ROWS = 2
+_MINHASH_BANDS = 8
+_MASKS = [random.Random(i).getrandbits(64) for i in range(_MINHASH_ROWS * _MINHASH_BANDS)]
+
+
+def is_valid_headline(text):
+    return len(text) >= MIN_HEADLINE_LENGTH and not _BLACKLIST_RE.search(text)
+
+
+def _shingles(words):
+    if len(words) < 2:
+        return {hash(word) for word in words}
+    return {hash((first, second)) for first, second in zip(words, words[1:])}
+
+
+def _bands(shingles):
+    signature = [min(map(mask.__xor__, shingles)) for mask in _MASKS]
+    return [(band, *signature[band * _MINHASH_ROWS:(band + 1) * _MINHASH_ROWS]) for band in range(_MINHASH_BANDS)]
+
+
+class Deduplicator:
+    """Assigns every headline to the first earlier headline it repeats or nearly repeats.
+
+    Exact repeats (ignoring case, whitespace and punctuation) are found by key;
+    near repeats through MinHash LSH buckets, confirmed on the Jaccard similarity of
+    word pairs. Each lookup only compares against headlines sharing a bucket.
+    """
+
+    def __init__(self, similarity=HEADLINE_SIMILARITY):
+        self.similarity = similarity
+        self._keys = {}
+        self._shingles = []
+        self._buckets = defaultdict(list)
+
+    def add(self, text):
+        """Return ``(index, new)``: the index of the headline ``text`` repeats, or its own new index."""
+        words = _WORD_RE.findall(text.lower())
+        key = ' '.join(words)
+        index = self._keys.get(key)
+        if index is not None:
+            return index, False
+        shingles = _shingles(words)
+        bands = _bands(shingles) if shingles and self.similarity < 1 else ()
+        checked = set()
+        for band in bands:
+            for other in self._buckets.get(band, ()):
+                if other in checked:
+                    continue
+                checked.add(other)
+                seen = self._shingles[other]
+                if len(shingles & seen) >= self.similarity * len(shingles | seen):
+                    self._keys[key] = other
+                    return other, False
+        index = len(self._shingles)
+        self._keys[key] = index
+        self._shingles.append(shingles)
+        for band in bands:
+            self._buckets[band].append(index)
+        return index, True
+
+
+def _candidates(soup):
+    """Return ``(tag, weight)`` pairs in document order from a single walk over the page:
+    h1-h3 when there are any, otherwise links with a headline-like class, otherwise every link."""
+    headings, hinted, links = [], [], []
+    for tag in soup.find_all(HEADLINE_TAGS):
+        if tag.name != 'a':
+            headings.append(tag)
+        elif not headings:
+            links.append(tag)
+            if _HINT_RE.search(' '.join(tag.get('class') or ())):
+                hinted.append(tag)
+    if headings:
+        return [(tag, TAG_WEIGHTS[tag.name]) for tag in headings]
+    if hinted:
+        return [(tag, TAG_WEIGHTS['hinted']) for tag in hinted]
+    return [(tag, TAG_WEIGHTS['a']) for tag in links]
+
+
+def iter_headlines(soup, similarity=HEADLINE_SIMILARITY):
+    """Yield distinct headline texts in document order."""
+    dedup = Deduplicator(similarity)
+    for tag, _ in _candidates(soup):
+        text = tag.get_text().strip()
+        if text and is_valid_headline(text) and dedup.add(text)[1]:
+            yield text
+
+
+def score_headline(text, weight, position, count):
+    """Score a candidate from its tag weight, its length in words (news headlines run
+    about 6-16 words) and how early it appears on the page."""
+    words = len(text.split())
+    if 6 <= words <= 16:
+        length = 0.5
+    elif 4 <= words <= 24:
+        length = 0.2
+    else:
+        length = 0.0
+    return round(weight + length + 0.3 * (1 - position / count), 3)
+
+
+def score_headlines(soup, similarity=HEADLINE_SIMILARITY):
+    """Return ``{'headline', 'score'}`` for each distinct headline on the page, in document order."""
+    candidates = _candidates(soup)
+    dedup = Deduplicator(similarity)
+    scored = []
+    for position, (tag, weight) in enumerate(candidates):
+        text = tag.get_text().strip()
+        if text and is_valid_headline(text) and dedup.add(text)[1]:
+            scored.append({'headline': text, 'score': score_headline(text, weight, position, len(candidates))})
+    return scored
+
+
+def aggregate(pages, limit=None, similarity=HEADLINE_SIMILARITY):
+    """Merge ``(url, scored_headlines)`` pairs into one feed ranked by score.
+
+    A story found on several pages is kept once, under its best-scored wording, with
+    every source listed and SOURCE_BONUS added per extra source.
+    """
+    dedup = Deduplicator(similarity)
+    feed = []
+    for url, headlines in pages:
+        for item in headlines:
+            index, new = dedup.add(item['headline'])
+            if new:
+                feed.append({'headline': item['headline'], 'score': item['score'], 'sources': [url]})
+                continue
+            entry = feed[index]
+            if url not in entry['sources']:
+                entry['sources'].append(url)
+            if item['score'] > entry['score']:
+                entry['headline'] = item['headline']
+                entry['score'] = item['score']
+    for entry in feed:
+        entry['score'] = round(entry['score'] + SOURCE_BONUS * (len(entry['sources']) - 1), 3)
+    feed.sort(key=lambda entry: entry['score'], reverse=True)
+    return feed[:limit] if limit else feed
@@ -0,0 +1,271 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+import requests
+import metrics
+
+logger = logging.getLogger(__name__)
+
+HOST_RATE = float(os.environ.get('HOST_RATE', 2))
+HOST_BURST = int(os.environ.get('HOST_BURST', 4))
+HOST_CONCURRENCY = int(os.environ.get('HOST_CONCURRENCY', 4))
+# Throttled hosts are slowed down to no less than this many requests per second
+HOST_MIN_RATE = float(os.environ.get('HOST_MIN_RATE', 0.1))
+HOST_MAX_BACKOFF = float(os.environ.get('HOST_MAX_BACKOFF', 300))
+# A request that would wait longer than this for its host fails instead
+HOST_MAX_WAIT = float(os.environ.get('HOST_MAX_WAIT', 60))
+HOST_ROBOTS = os.environ.get('HOST_ROBOTS', '1').lower() in ('1', 'true', 'yes', 'on')
+ROBOTS_TTL = float(os.environ.get('ROBOTS_TTL', 3600))
+ROBOTS_TIMEOUT = float(os.environ.get('ROBOTS_TIMEOUT', 5))
+# Images and PDFs are usually served from CDNs built for far more traffic than a page host
+ASSET_HOST_RATE = float(os.environ.get('ASSET_HOST_RATE', 50))
+ASSET_HOST_BURST = int(os.environ.get('ASSET_HOST_BURST', 50))
+ASSET_HOST_CONCURRENCY = int(os.environ.get('ASSET_HOST_CONCURRENCY', 16))
+
+# Responses that mean the host wants us to slow down
+THROTTLE_STATUSES = frozenset({429, 503})
+# How often a request waiting for a busy host checks again
+_POLL_SECONDS = 0.05
+
+
+class HostThrottled(requests.exceptions.RequestException):
+    """Raised when a host cannot take another request within HOST_MAX_WAIT."""
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+
+    def take(self):
+        """Take a token and return 0, or return the seconds until one is available."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate if self.rate > 0 else 1.0
+
+
+def retry_after(value):
+    """Seconds to wait from a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Host:
+    def __init__(self, rate, burst):
+        self.base_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.in_flight = 0
+        self.hold_until = 0.0
+        self.strikes = 0
+        self.throttled = 0
+        self.robots = None
+        self.robots_checked = None
+        self.robots_lock = threading.Lock()
+        self.crawl_delay = None
+
+
+class HostLimiter:
+    """Keeps every host under its own request rate and concurrency, so many hosts can be
+    scraped at full speed without hammering any one of them.
+
+    Each host gets a token bucket capped by the Crawl-delay or Request-rate in its
+    robots.txt, which is fetched once per ROBOTS_TTL. A 429 or 503 halves the host's
+    rate and pauses it for Retry-After (or an exponential backoff); later responses
+    raise the rate back a tenth at a time. Limits are kept per process.
+    """
+
+    def __init__(self, rate=HOST_RATE, burst=HOST_BURST, concurrency=HOST_CONCURRENCY,
+                 max_wait=HOST_MAX_WAIT, robots=HOST_ROBOTS):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_wait = max_wait
+        self.robots = robots
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url):
+        parts = urlsplit(url)
+        return f'{parts.scheme.lower()}://{parts.netloc.lower()}'
+
+    def _host(self, url):
+        key = self._key(url)
+        host = self._hosts.get(key)
+        if host is None:
+            with self._lock:
+                host = self._hosts.get(key)
+                if host is None:
+                    host = self._hosts[key] = _Host(self.rate, self.burst)
+        return host
+
+    def _robots_stale(self, host):
+        return self.robots and (host.robots_checked is None or time.monotonic() - host.robots_checked > ROBOTS_TTL)
+
+    def _ensure_robots(self, url, host, session=None):
+        """Load the host's robots.txt unless a fresh copy is cached; other requests to the
+        host wait for it, so none is sent before its Crawl-delay is known."""
+        if not self._robots_stale(host):
+            return
+        with host.robots_lock:
+            if self._robots_stale(host):
+                self._load_robots(url, host, session)
+
+    def _load_robots(self, url, host, session):
+        robots_url = self._key(url) + '/robots.txt'
+        try:
+            response = (session or requests).get(robots_url, timeout=ROBOTS_TIMEOUT)
+            # A missing or unreadable robots.txt places no restrictions
+            lines = response.text.splitlines() if response.ok else []
+        except requests.exceptions.RequestException as e:
+            logger.info(f"Could not fetch {robots_url}: {e}")
+            lines = []
+        parser = RobotFileParser(robots_url)
+        parser.parse(lines)
+        request_rate = parser.request_rate('*')
+        interval = max(float(parser.crawl_delay('*') or 0),
+                       request_rate.seconds / request_rate.requests if request_rate else 0)
+        with self._lock:
+            host.robots = parser
+            host.robots_checked = time.monotonic()
+            host.crawl_delay = interval or None
+            host.base_rate = min(self.rate, 1 / interval) if interval else self.rate
+            if interval:
+                host.bucket = TokenBucket(host.base_rate, 1)
+            else:
+                host.bucket.rate = min(host.bucket.rate, host.base_rate)
+        if interval:
+            logger.info(f"{self._key(url)} asks for {interval:g}s between requests")
+
+    def allowed(self, url, session=None):
+        """False when the host's robots.txt disallows ``url`` for all user agents."""
+        host = self._host(url)
+        self._ensure_robots(url, host, session)
+        return host.robots is None or host.robots.can_fetch('*', url)
+
+    def delay(self, url):
+        """Seconds until ``url``'s host may be sent anything after a throttling response."""
+        return max(0.0, self._host(url).hold_until - time.monotonic())
+
+    def _try_acquire(self, host):
+        """Take a concurrency slot and a token and return 0, or return how long to wait."""
+        with self._lock:
+            now = time.monotonic()
+            if host.hold_until > now:
+                return host.hold_until - now
+            if host.in_flight >= self.concurrency:
+                return _POLL_SECONDS
+            wait = host.bucket.take()
+            if wait:
+                return wait
+            host.in_flight += 1
+            return 0
+
+    def _release(self, host):
+        with self._lock:
+            host.in_flight -= 1
+
+    def _check_wait(self, url, wait, deadline):
+        if time.monotonic() + wait > deadline:
+            raise HostThrottled(f"{self._key(url)} cannot take another request for {wait:.1f}s")
+
+    @contextmanager
+    def slot(self, url, session=None):
+        """Wait until ``url``'s host has a free slot and a token; the slot is held inside the block."""
+        host = self._host(url)
+        self._ensure_robots(url, host, session)
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        while True:
+            wait = self._try_acquire(host)
+            if not wait:
+                break
+            self._check_wait(url, wait, deadline)
+            time.sleep(wait)
+        if time.monotonic() > start + _POLL_SECONDS:
+            metrics.record_wait(url, time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    @asynccontextmanager
+    async def aslot(self, url, session=None):
+        """``slot`` for the event loop."""
+        host = self._host(url)
+        if self._robots_stale(host):
+            await asyncio.to_thread(self._ensure_robots, url, host, session)
+        start = time.monotonic()
+        deadline = start + self.max_wait
+        while True:
+            wait = self._try_acquire(host)
+            if not wait:
+                break
+            self._check_wait(url, wait, deadline)
+            await asyncio.sleep(wait)
+        if time.monotonic() > start + _POLL_SECONDS:
+            metrics.record_wait(url, time.monotonic() - start)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def observe(self, url, response):
+        """Adapt the host's rate to a response's status code and Retry-After header."""
+        host = self._host(url)
+        throttled = response.status_code in THROTTLE_STATUSES
+        with self._lock:
+            if throttled:
+                host.strikes += 1
+                host.throttled += 1
+                host.bucket.rate = max(HOST_MIN_RATE, host.bucket.rate / 2)
+                pause = retry_after(response.headers.get('Retry-After'))
+                if pause is None:
+                    pause = min(HOST_MAX_BACKOFF, 2 ** host.strikes)
+                host.hold_until = max(host.hold_until, time.monotonic() + pause)
+            else:
+                host.strikes = 0
+                host.bucket.rate = min(host.base_rate, host.bucket.rate + host.base_rate / 10)
+        if throttled:
+            logger.warning(f"{self._key(url)} answered {response.status_code}, slowing to "
+                           f"{host.bucket.rate:.2f} requests/s and pausing {pause:.0f}s")
+            metrics.HOST_THROTTLES.inc(metrics.host_label(url))
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    'rate': round(host.bucket.rate, 3),
+                    'in_flight': host.in_flight,
+                    'throttled': host.throttled,
+                    'paused_for': round(max(0.0, host.hold_until - now), 1),
+                    'crawl_delay': host.crawl_delay,
+                }
+                for key, host in self._hosts.items()
+            }
+
+
+host_limiter = HostLimiter()
+# Image and PDF downloads: limits of their own and no robots.txt, which only governs pages
+asset_limiter = HostLimiter(ASSET_HOST_RATE, ASSET_HOST_BURST, ASSET_HOST_CONCURRENCY, robots=False)
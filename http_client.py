@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from host_limiter import THROTTLE_STATUSES, host_limiter
+
+logger = logging.getLogger(__name__)
+
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 10))
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 10))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 20))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 3))
+HTTP_BACKOFF_FACTOR = float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.5))
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# urllib3 only decodes brotli bodies when a brotli package is importable
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": ACCEPT_ENCODING,
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _build_session():
+    # urllib3 only retries connection errors; status retries happen in request() so the
+    # host limiter sees every attempt
+    retry = Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def session_for(url):
+    """Return the pooled session for the URL's scheme and host."""
+    parts = urlsplit(url)
+    key = (parts.scheme.lower(), parts.netloc.lower())
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _sessions[key] = _build_session()
+    return session
+
+
+def request(method, url, limit=True, limiter=None, **kwargs):
+    """Send a request through the pooled session for its host.
+
+    With ``limit`` the request waits for the host limiter (``limiter``, host_limiter by
+    default), and idempotent requests answered with a RETRY_STATUSES code are retried
+    up to HTTP_MAX_RETRIES times. A 429/503 response is returned as is once the host
+    asks for a longer pause than the limiter will wait.
+    """
+    kwargs.setdefault('timeout', HTTP_TIMEOUT)
+    session = session_for(url)
+    if not limit:
+        return session.request(method, url, **kwargs)
+    limiter = limiter or host_limiter
+    retryable = method.upper() in Retry.DEFAULT_ALLOWED_METHODS
+    attempt = 0
+    while True:
+        with limiter.slot(url, session):
+            response = session.request(method, url, **kwargs)
+        limiter.observe(url, response)
+        if not retryable or response.status_code not in RETRY_STATUSES or attempt >= HTTP_MAX_RETRIES:
+            return response
+        if limiter.delay(url) > limiter.max_wait:
+            return response
+        attempt += 1
+        response.close()
+        # The limiter already pauses hosts that answered 429/503
+        if response.status_code not in THROTTLE_STATUSES:
+            time.sleep(HTTP_BACKOFF_FACTOR * 2 ** (attempt - 1))
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault('allow_redirects', True)
+    return request('HEAD', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def stats():
+    """Per-host request and connection counters taken from the urllib3 pools."""
+    hosts = {}
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    for (scheme, host), session in sessions:
+        adapter = session.get_adapter(f'{scheme}://{host}')
+        pools = adapter.poolmanager.pools
+        requests_made = connections = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_made += pool.num_requests
+            connections += pool.num_connections
+        hosts[f'{scheme}://{host}'] = {
+            'requests': requests_made,
+            'connections_opened': connections,
+            'connections_reused': max(requests_made - connections, 0),
+        }
+    totals = {
+        name: sum(host[name] for host in hosts.values())
+        for name in ('requests', 'connections_opened', 'connections_reused')
+    }
+    return {'hosts': hosts, 'totals': totals}
@@ -0,0 +1,201 @@
+import os
+import struct
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import http_client
+from host_limiter import asset_limiter
+from page_cache import LRUTTLCache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PROBE_CONCURRENCY = int(os.environ.get('IMAGE_PROBE_CONCURRENCY', 16))
+IMAGE_PROBE_TIMEOUT = float(os.environ.get('IMAGE_PROBE_TIMEOUT', 5))
+# Most headers fit in the first few KB; JPEGs with large EXIF blocks may need more
+IMAGE_PROBE_MAX_BYTES = int(os.environ.get('IMAGE_PROBE_MAX_BYTES', 256 * 1024))
+IMAGE_PROBE_CACHE_SIZE = int(os.environ.get('IMAGE_PROBE_CACHE_SIZE', 10000))
+IMAGE_PROBE_TTL = float(os.environ.get('IMAGE_PROBE_TTL', 3600))
+
+# Content-Type -> the image_format name used by scrape_images
+CONTENT_TYPE_FORMATS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/pjpeg': 'jpg',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+}
+
+# JPEG start-of-frame markers, which carry the pixel size
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+_probes = LRUTTLCache(IMAGE_PROBE_CACHE_SIZE, IMAGE_PROBE_TTL)
+
+
+def _jpeg_size(data):
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in _JPEG_SOF:
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        if marker == 0xD8 or marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+
+def _webp_size(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30:
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and len(data) >= 25:
+        bits = int.from_bytes(data[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X' and len(data) >= 30:
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    return None
+
+
+def sniff_image(data):
+    """Return ``(format, width, height)`` read from the first bytes of an image.
+
+    ``format`` is None for unrecognised data; the size is ``(None, None)`` until enough
+    bytes are available.
+    """
+    size = None
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        image_format = 'png'
+        if len(data) >= 24:
+            size = struct.unpack('>II', data[16:24])
+    elif data[:6] in (b'GIF87a', b'GIF89a'):
+        image_format = 'gif'
+        if len(data) >= 10:
+            size = struct.unpack('<HH', data[6:10])
+    elif data.startswith(b'\xff\xd8'):
+        image_format = 'jpg'
+        size = _jpeg_size(data)
+    elif data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        image_format = 'webp'
+        size = _webp_size(data)
+    else:
+        return None, None, None
+    width, height = size or (None, None)
+    return image_format, width, height
+
+
+def _content_format(content_type):
+    return CONTENT_TYPE_FORMATS.get(content_type.split(';')[0].strip().lower())
+
+
+def _total_size(response):
+    content_range = response.headers.get('Content-Range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else None
+
+
+def _probe_head(url, timeout):
+    response = http_client.head(url, timeout=timeout, limiter=asset_limiter)
+    content_type = response.headers.get('Content-Type', '')
+    if not response.ok or not content_type.lower().startswith('image/') or _total_size(response) is None:
+        return None
+    return {'url': url, 'content_type': content_type, 'format': _content_format(content_type),
+            'bytes': _total_size(response), 'width': None, 'height': None}
+
+
+def _probe_range(url, timeout, max_bytes):
+    headers = {'Range': f'bytes=0-{max_bytes - 1}'}
+    with http_client.get(url, timeout=timeout, stream=True, headers=headers, limiter=asset_limiter) as response:
+        response.raise_for_status()
+        data = b''
+        image_format = width = height = None
+        # Servers that ignore Range send the whole image; stop reading once the header is parsed
+        for chunk in response.iter_content(8192):
+            data += chunk
+            image_format, width, height = sniff_image(data)
+            if width is not None or image_format is None and len(data) >= 16 or len(data) >= max_bytes:
+                break
+        content_type = response.headers.get('Content-Type', '')
+        return {'url': url, 'content_type': content_type,
+                'format': image_format or _content_format(content_type),
+                'bytes': _total_size(response), 'width': width, 'height': height if width is not None else None}
+
+
+def probe(url, need_dimensions=True, timeout=IMAGE_PROBE_TIMEOUT, max_bytes=IMAGE_PROBE_MAX_BYTES):
+    """Read an image's real format, byte size and (when ``need_dimensions``) pixel size.
+
+    A HEAD request is enough when dimensions are not needed; otherwise, or when HEAD
+    is unsupported, only the start of the image is fetched with a Range request.
+    Results are cached per URL; failed probes return None.
+    """
+    if not url.startswith(('http://', 'https://')):
+        return None
+    cached = _probes.get(url)
+    if cached is not None and (cached['width'] is not None or not need_dimensions):
+        return cached
+    try:
+        result = None if need_dimensions else _probe_head(url, timeout)
+        if result is None:
+            result = _probe_range(url, timeout, max_bytes)
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.info(f"Could not probe image {url}: {e}")
+        return None
+    _probes.set(url, result)
+    return result
+
+
+def probe_formats(image_format):
+    """The probed formats an ``image_format`` option accepts."""
+    return set(CONTENT_TYPE_FORMATS.values()) if image_format == 'all' else {image_format}
+
+
+def matches(info, formats=None, min_width=None, min_height=None, min_size=None):
+    """True if a probe result is one of ``formats`` and at least as large as every given minimum."""
+    if info is None or (formats is not None and info['format'] not in formats):
+        return False
+    if min_width and (info['width'] is None or info['width'] < min_width):
+        return False
+    if min_height and (info['height'] is None or info['height'] < min_height):
+        return False
+    if min_size and (info['bytes'] is None or info['bytes'] < min_size):
+        return False
+    return True
+
+
+def filter_images(images, formats=None, min_width=None, min_height=None, min_size=None,
+                  concurrency=IMAGE_PROBE_CONCURRENCY):
+    """Probe ``(url, caption)`` pairs concurrently and yield, in their original order, those
+    that pass ``matches``. Only ``2 * concurrency`` probes run ahead of the consumer, so
+    stopping early leaves the rest of the images untouched."""
+    need_dimensions = bool(min_width or min_height)
+    pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='image-probe')
+    queued = iter(images)
+    pending = deque()
+
+    def submit_next():
+        item = next(queued, None)
+        if item is not None:
+            pending.append((item, pool.submit(probe, item[0], need_dimensions)))
+
+    try:
+        for _ in range(concurrency * 2):
+            submit_next()
+        while pending:
+            item, future = pending.popleft()
+            info = future.result()
+            submit_next()
+            if matches(info, formats, min_width, min_height, min_size):
+                yield item
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import http_client
+from batch import run_job
+from sqlite_util import connect, pid_alive
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = os.environ.get('JOBS_DB', 'jobs.sqlite3')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+JOB_BROWSER_WORKERS = int(os.environ.get('JOB_BROWSER_WORKERS', os.environ.get('CHROME_POOL_SIZE', 2)))
+JOB_MAX_QUEUED = int(os.environ.get('JOB_MAX_QUEUED', 200))
+JOB_RETENTION_SECONDS = float(os.environ.get('JOB_RETENTION_SECONDS', 7 * 86400))
+JOB_WEBHOOK_TIMEOUT = float(os.environ.get('JOB_WEBHOOK_TIMEOUT', 10))
+
+# Data types that need (or may fall back to) a Chrome driver
+BROWSER_TYPES = frozenset({'ebay', 'image', 'pdf'})
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class JobStore:
+    """SQLite-backed job records, shared by every worker process."""
+
+    def __init__(self, path=JOBS_DB):
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, data_type TEXT, url TEXT, options TEXT, webhook TEXT, '
+                'status TEXT, result TEXT, error TEXT, owner_pid INTEGER, '
+                'created_at REAL, started_at REAL, finished_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+
+    def create(self, data_type, url, options, webhook):
+        job_id = uuid.uuid4().hex
+        with connect(self.path) as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, data_type, url, options, webhook, status, created_at) '
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+                (job_id, data_type, url, json.dumps(options or {}), webhook, time.time()),
+            )
+        return job_id
+
+    def claim(self, job_id):
+        """Atomically move a queued job to running; False if another process got it first."""
+        with connect(self.path) as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'running', owner_pid = ?, started_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (os.getpid(), time.time(), job_id),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, result):
+        status = 'done' if result.get('success') else 'failed'
+        with connect(self.path) as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?',
+                (status, json.dumps(result), result.get('error'), time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        row = connect(self.path).execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['options'] = json.loads(job['options'] or '{}')
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def count_queued(self):
+        return connect(self.path).execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+    def recover(self):
+        """Requeue jobs whose owning process died and return every queued job id."""
+        conn = connect(self.path)
+        running = conn.execute("SELECT id, owner_pid FROM jobs WHERE status = 'running'").fetchall()
+        with conn:
+            for row in running:
+                if row['owner_pid'] is None or not pid_alive(row['owner_pid']):
+                    conn.execute("UPDATE jobs SET status = 'queued', owner_pid = NULL WHERE id = ?", (row['id'],))
+        return [row['id'] for row in conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at")]
+
+    def purge(self, older_than):
+        with connect(self.path) as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                         (time.time() - older_than,))
+
+
+class JobQueue:
+    """Runs scrape jobs off the request path.
+
+    Jobs that may need Chrome go to a separate executor sized to the driver pool,
+    so slow browser scrapes cannot starve plain HTTP jobs.
+    """
+
+    def __init__(self, runner, store=None, workers=JOB_WORKERS, browser_workers=JOB_BROWSER_WORKERS,
+                 max_queued=JOB_MAX_QUEUED, deliver=None):
+        self.runner = runner
+        # deliver(url, payload) hands webhooks to an outbox; without one they are posted inline
+        self.deliver = deliver
+        self.store = store or JobStore()
+        self.max_queued = max_queued
+        self._workers = workers
+        self._browser_workers = browser_workers
+        self._executor = None
+        self._browser_executor = None
+        self._lock = threading.Lock()
+
+    def _executors(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='job')
+                self._browser_executor = ThreadPoolExecutor(max_workers=self._browser_workers,
+                                                            thread_name_prefix='browser-job')
+            return self._executor, self._browser_executor
+
+    def _dispatch(self, job_id, data_type):
+        executor, browser_executor = self._executors()
+        (browser_executor if data_type in BROWSER_TYPES else executor).submit(self._run, job_id)
+
+    def start(self):
+        """Resume jobs left unfinished by a previous run."""
+        try:
+            self.store.purge(JOB_RETENTION_SECONDS)
+            for job_id in self.store.recover():
+                job = self.store.get(job_id)
+                self._dispatch(job_id, job['data_type'])
+        except sqlite3.Error as e:
+            logger.error(f"Failed to resume jobs: {e}")
+
+    def submit(self, data_type, url, options=None, webhook=None):
+        if self.store.count_queued() >= self.max_queued:
+            raise QueueFull(f"More than {self.max_queued} jobs are queued")
+        job_id = self.store.create(data_type, url, options, webhook)
+        self._dispatch(job_id, data_type)
+        return job_id
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def _run(self, job_id):
+        if not self.store.claim(job_id):
+            return
+        job = self.store.get(job_id)
+        result = run_job(job, self.runner)
+        self.store.finish(job_id, result)
+        if job['webhook']:
+            self._notify(job['webhook'], {'job_id': job_id, **result})
+
+    def _notify(self, webhook, payload):
+        if self.deliver is not None:
+            try:
+                self.deliver(webhook, payload)
+            except Exception as e:
+                logger.error(f"Failed to queue webhook {webhook} for job {payload['job_id']}: {e}")
+            return
+        try:
+            response = http_client.post(webhook, json=payload, timeout=JOB_WEBHOOK_TIMEOUT)
+            response.raise_for_status()
+        except Exception as e:
+            logger.error(f"Webhook {webhook} failed for job {payload['job_id']}: {e}")
@@ -0,0 +1,101 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from page_cache import LRUTTLCache
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_TTL = float(os.environ.get('LOOKUP_TTL', 6 * 3600))
+# How long past LOOKUP_TTL a record may still be served while it is refreshed
+LOOKUP_STALE_TTL = float(os.environ.get('LOOKUP_STALE_TTL', 7 * 86400))
+LOOKUP_CACHE_SIZE = int(os.environ.get('LOOKUP_CACHE_SIZE', 1000))
+LOOKUP_WORKERS = int(os.environ.get('LOOKUP_WORKERS', 8))
+LOOKUP_MAX_NAMES = int(os.environ.get('LOOKUP_MAX_NAMES', 50))
+
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='lookup-refresh')
+
+
+def normalize_query(name):
+    return ' '.join((name or '').lower().split())
+
+
+def is_enabled(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class LookupCache:
+    """Caches title lookups (search + detail page) by normalized query.
+
+    ``fetch(name, detail_url)`` performs the lookup; when a previous lookup already
+    resolved the detail page URL it is passed back in so the search step can be skipped.
+    Records carrying an ``error`` key are never cached.
+    """
+
+    def __init__(self, fetch, link_field, ttl=LOOKUP_TTL, stale_ttl=LOOKUP_STALE_TTL, maxsize=LOOKUP_CACHE_SIZE):
+        self.fetch = fetch
+        self.link_field = link_field
+        self.ttl = ttl
+        self._entries = LRUTTLCache(maxsize, ttl + stale_ttl)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_cached(self, name, stale_while_revalidate=False):
+        """Return a cached record if it is fresh, or stale and ``stale_while_revalidate`` is set."""
+        entry = self._entries.get(normalize_query(name))
+        if entry is None:
+            return None
+        if time.time() - entry['stored_at'] < self.ttl:
+            return entry['record']
+        if stale_while_revalidate:
+            self._refresh_in_background(name, entry['detail_url'])
+            return entry['record']
+        return None
+
+    def put(self, name, record):
+        if not record or 'error' in record:
+            return
+        self._entries.set(normalize_query(name), {
+            'record': record,
+            'detail_url': record.get(self.link_field),
+            'stored_at': time.time(),
+        })
+
+    def get(self, name, stale_while_revalidate=False):
+        record = self.get_cached(name, stale_while_revalidate)
+        if record is not None:
+            return record
+        entry = self._entries.get(normalize_query(name))
+        record = self.fetch(name, entry['detail_url'] if entry else None)
+        self.put(name, record)
+        return record
+
+    def get_many(self, names, stale_while_revalidate=False, workers=LOOKUP_WORKERS):
+        """Look up several titles at once; each worker runs its own search then detail fetch,
+        so searches for later titles overlap with detail fetches for earlier ones."""
+        unique = {}
+        for name in names:
+            unique.setdefault(normalize_query(name), name)
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unique)))) as pool:
+            records = dict(zip(unique, pool.map(lambda name: self.get(name, stale_while_revalidate), unique.values())))
+        return [(name, records[normalize_query(name)]) for name in names]
+
+    def _refresh_in_background(self, name, detail_url):
+        key = normalize_query(name)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.put(name, self.fetch(name, detail_url))
+            except Exception as e:
+                logger.error(f"Background refresh of '{name}' failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+        _refresh_executor.submit(refresh)
@@ -0,0 +1,308 @@
+import os
+import io
+import time
+import pstats
+import logging
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Distinct host label values kept before the rest are reported as "other"
+METRICS_MAX_HOSTS = int(os.environ.get('METRICS_MAX_HOSTS', 200))
+# Run every scrape under cProfile and keep reports for the slow ones (or those sent with profile=1)
+SCRAPE_PROFILE = os.environ.get('SCRAPE_PROFILE', '0').lower() in ('1', 'true', 'yes', 'on')
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 2000))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_ON_REQUEST = os.environ.get('PROFILE_ON_REQUEST', '0').lower() in ('1', 'true', 'yes', 'on')
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 100))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(8))  # 1 KB .. 16 MB
+
+_lock = threading.Lock()
+_registry = []
+_hosts = set()
+
+# (data_type, host) of the scrape running in this thread or task
+_scope = contextvars.ContextVar('metrics_scope', default=('', ''))
+# Spans of the current HTTP request, reported in the Server-Timing header
+_trace = contextvars.ContextVar('metrics_trace', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with _lock:
+            items = sorted(self._values.items())
+        lines += [f'{self.name}{_format_labels(self.labels, key)} {value}' for key, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        with _lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with _lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, [("le", bound)])} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {count}')
+        return lines
+
+
+STAGE_SECONDS = Histogram('scraper_stage_seconds', 'Time spent in each scrape stage',
+                          ('stage', 'data_type', 'host'))
+SCRAPE_SECONDS = Histogram('scraper_scrape_seconds', 'End-to-end scrape time', ('data_type', 'host'))
+SCRAPE_ERRORS = Counter('scraper_scrape_errors_total', 'Scrapes that raised an exception', ('data_type', 'host'))
+PAGE_BYTES = Histogram('scraper_page_bytes', 'Size of fetched page bodies', ('data_type', 'host'), SIZE_BUCKETS)
+PAGE_CACHE = Counter('scraper_page_cache_total', 'Page cache lookups by result', ('result', 'data_type'))
+BROWSER_FALLBACKS = Counter('scraper_browser_fallbacks_total', 'Scrapes that fell back to Selenium',
+                            ('data_type', 'host'))
+DELIVERIES = Counter('scraper_deliveries_total', 'Webhook delivery attempts by outcome', ('result',))
+HOST_THROTTLES = Counter('scraper_host_throttles_total', '429/503 responses that slowed a host down', ('host',))
+
+
+def host_label(url):
+    """Host of ``url`` for use as a label, capped at METRICS_MAX_HOSTS distinct values."""
+    host = (urlsplit(url).hostname or '') if url and '://' in url else ''
+    if not host or host in _hosts:
+        return host
+    with _lock:
+        if len(_hosts) >= METRICS_MAX_HOSTS:
+            return 'other'
+        _hosts.add(host)
+    return host
+
+
+@contextmanager
+def scrape_scope(data_type, url):
+    """Label every span and counter recorded inside with ``data_type`` and the target host."""
+    scope = (data_type or '', host_label(url))
+    token = _scope.set(scope)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SCRAPE_ERRORS.inc(*scope)
+        raise
+    finally:
+        SCRAPE_SECONDS.observe(time.perf_counter() - start, *scope)
+        _scope.reset(token)
+
+
+def _stage_labels(url, data_type):
+    scope_type, host = _scope.get()
+    return data_type or scope_type, host_label(url) if url else host
+
+
+def _observe(stage, labels, elapsed, trace):
+    STAGE_SECONDS.observe(elapsed, stage, *labels)
+    if trace is not None:
+        trace.append((stage, elapsed))
+
+
+@contextmanager
+def span(stage, url=None, data_type=None):
+    """Time one stage; ``url`` and ``data_type`` override the labels of the surrounding scrape."""
+    labels = _stage_labels(url, data_type)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe(stage, labels, time.perf_counter() - start, _trace.get())
+
+
+def timed_iter(stage, iterable, url=None, data_type=None):
+    """Like ``span`` for an iterable consumed lazily: only the time spent producing items counts,
+    and the stage is recorded once the consumer finishes or stops early."""
+    labels = _stage_labels(url, data_type)
+    trace = _trace.get()
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        _observe(stage, labels, elapsed, trace)
+
+
+def scoped_iter(data_type, url, iterable):
+    """``scrape_scope`` for a generator that may be resumed from other frames, e.g. a streamed response.
+
+    Every step runs in a private copy of the current context, so the scope never leaks
+    into the consumer and does not need to be reset from the context that set it.
+    """
+    scope = (data_type or '', host_label(url))
+    context = contextvars.copy_context()
+    context.run(_scope.set, scope)
+    iterator = iter(iterable)
+    start = time.perf_counter()
+    try:
+        while True:
+            try:
+                item = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield item
+    except GeneratorExit:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            context.run(close)
+        raise
+    except Exception:
+        SCRAPE_ERRORS.inc(*scope)
+        raise
+    finally:
+        SCRAPE_SECONDS.observe(time.perf_counter() - start, *scope)
+
+
+def record_page(url, size):
+    PAGE_BYTES.observe(size, _scope.get()[0], host_label(url))
+
+
+def record_cache(result):
+    PAGE_CACHE.inc(result, _scope.get()[0])
+
+
+def record_browser_fallback():
+    BROWSER_FALLBACKS.inc(*_scope.get())
+
+
+def record_wait(url, seconds):
+    """Record time spent waiting for a host's rate limit as the ``throttle`` stage."""
+    _observe('throttle', _stage_labels(url, None), seconds, _trace.get())
+
+
+def start_trace():
+    return _trace.set([])
+
+
+def finish_trace(token):
+    """Return the spans recorded since ``start_trace`` as a Server-Timing header value."""
+    spans = _trace.get() or []
+    _trace.reset(token)
+    totals = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0) + elapsed
+    return ', '.join(f'{stage};dur={elapsed * 1000:.1f}' for stage, elapsed in totals.items())
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    return '\n'.join(lines) + '\n'
+
+
+def _dump_profile(profiler, elapsed_ms):
+    data_type, host = _scope.get()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{data_type or 'scrape'}-{host or 'local'}"
+                                     f"-{int(elapsed_ms)}ms")
+    profiler.dump_stats(base + '.prof')
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(40)
+    with open(base + '.txt', 'w') as f:
+        f.write(report.getvalue())
+    logger.info(f"Wrote profile of {elapsed_ms:.0f} ms {data_type} scrape to {base}.txt")
+    _prune_profiles()
+
+
+def _prune_profiles():
+    """Delete the oldest reports in PROFILE_DIR beyond the newest PROFILE_MAX_FILES."""
+    if PROFILE_MAX_FILES <= 0:
+        return
+    paths = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.is_file() and entry.name.endswith(('.prof', '.txt')):
+            try:
+                paths.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue
+    paths.sort(reverse=True)
+    # Each report is a .prof and a .txt file
+    for _, path in paths[PROFILE_MAX_FILES * 2:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def profiled(force=False):
+    """Profile the block when ``force`` is set or SCRAPE_PROFILE is on; the report is kept
+    when ``force`` is set or the block was slow."""
+    if not SCRAPE_PROFILE and not force:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active on this thread
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if force or elapsed_ms >= PROFILE_SLOW_MS:
+            try:
+                _dump_profile(profiler, elapsed_ms)
+            except OSError as e:
+                logger.error(f"Failed to write profile: {e}")
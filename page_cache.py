@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.structures import CaseInsensitiveDict
+import http_client
+import metrics
+from parsing import parse, resolve_backend
+from sqlite_util import connect
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+PAGE_CACHE_PATH = os.environ.get('PAGE_CACHE_PATH', 'page_cache.sqlite3')
+PAGE_CACHE_TTL = float(os.environ.get('PAGE_CACHE_TTL', 300))
+PAGE_CACHE_MAX_AGE = float(os.environ.get('PAGE_CACHE_MAX_AGE', 86400))
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 256))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 10 * 1024 * 1024))
+PAGE_CACHE_PARSED_SIZE = int(os.environ.get('PAGE_CACHE_PARSED_SIZE', 32))
+# Memory the parsed documents may take per worker, going by PARSED_BYTES_PER_BYTE
+PAGE_CACHE_PARSED_MAX_BYTES = int(os.environ.get('PAGE_CACHE_PARSED_MAX_BYTES', 128 * 1024 * 1024))
+# A parsed tree takes 10-65x its page's size (measured on the benchmark fixtures); the high end is assumed
+PARSED_BYTES_PER_BYTE = 64
+
+# Response headers kept alongside the cached body
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control')
+
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url):
+    """Canonical form of a URL used as the cache key."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+class LRUTTLCache:
+    """A thread-safe, size-bounded LRU mapping whose entries expire after ``ttl`` seconds.
+
+    With ``max_bytes``, the ``size`` given to each ``set`` also counts against that
+    budget, and a value bigger than the whole budget is not kept.
+    """
+
+    def __init__(self, maxsize, ttl, max_bytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+        return item
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            stored_at, value, _ = item
+            if time.monotonic() - stored_at > self.ttl:
+                self._remove(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, size=0):
+        with self._lock:
+            self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._data[key] = (time.monotonic(), value, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._remove(key)
+            return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MemoryBackend:
+    def __init__(self, maxsize=PAGE_CACHE_SIZE, max_age=PAGE_CACHE_MAX_AGE):
+        self._entries = LRUTTLCache(maxsize, max_age)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def put(self, key, entry):
+        self._entries.set(key, entry)
+
+    def delete(self, key):
+        self._entries.pop(key)
+
+
+class SQLiteBackend:
+    """Stores pages in a SQLite file so every gunicorn worker shares one cache."""
+
+    def __init__(self, path=PAGE_CACHE_PATH, maxsize=PAGE_CACHE_SIZE, max_age=PAGE_CACHE_MAX_AGE):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_age = max_age
+        with connect(self.path) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS pages ('
+                'key TEXT PRIMARY KEY, url TEXT, status INTEGER, headers TEXT, '
+                'content BLOB, fetched_at REAL, last_access REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS pages_last_access ON pages (last_access)')
+
+    def get(self, key):
+        conn = connect(self.path)
+        row = conn.execute(
+            'SELECT url, status, headers, content, fetched_at FROM pages WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, content, fetched_at = row
+        if time.time() - fetched_at > self.max_age:
+            self.delete(key)
+            return None
+        with conn:
+            conn.execute('UPDATE pages SET last_access = ? WHERE key = ?', (time.time(), key))
+        return {'url': url, 'status': status, 'headers': json.loads(headers), 'content': content,
+                'fetched_at': fetched_at}
+
+    def put(self, key, entry):
+        conn = connect(self.path)
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO pages (key, url, status, headers, content, fetched_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, entry['url'], entry['status'], json.dumps(entry['headers']), entry['content'],
+                 entry['fetched_at'], time.time()),
+            )
+            conn.execute(
+                'DELETE FROM pages WHERE key IN (SELECT key FROM pages ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.maxsize,),
+            )
+
+    def delete(self, key):
+        conn = connect(self.path)
+        with conn:
+            conn.execute('DELETE FROM pages WHERE key = ?', (key,))
+
+
+class CachedPage:
+    """Response-like view of a cached page shared by all extractors."""
+
+    def __init__(self, key, entry, from_cache=False, not_modified=False, cached=True):
+        self.key = key
+        self.url = entry['url']
+        self.status_code = entry['status']
+        self.headers = CaseInsensitiveDict(entry['headers'])
+        self.content = entry['content']
+        self.fetched_at = entry['fetched_at']
+        self.from_cache = from_cache
+        self.not_modified = not_modified
+        # Pages the cache did not keep (no-store, too big) are not kept parsed either
+        self.cached = cached
+
+    def raise_for_status(self):
+        # Only successful responses are ever turned into pages
+        pass
+
+    def soup(self, only=None, backend=None):
+        backend = resolve_backend(backend)
+        cache_key = (self.key, hash(self.content), backend, only)
+        soup = _parsed.get(cache_key) if self.cached else None
+        if soup is None:
+            with metrics.span('parse', self.url):
+                soup = parse(self.content, only=only, backend=backend)
+            if self.cached:
+                _parsed.set(cache_key, soup, len(self.content) * PARSED_BYTES_PER_BYTE)
+        return soup
+
+
+class PageCache:
+    def __init__(self, backend, ttl=PAGE_CACHE_TTL, max_bytes=PAGE_CACHE_MAX_BYTES):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._stats = {'hits': 0, 'misses': 0, 'revalidated': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+        metrics.record_cache(name)
+
+    def lookup(self, url, revalidate=False):
+        """Return ``(key, entry, fresh)`` for ``url`` without touching the network."""
+        if not url:
+            # What requests raises for a missing URL, so callers handle it as a failed fetch
+            raise requests.exceptions.MissingSchema(f"Invalid URL {url!r}: No scheme supplied")
+        key = normalize_url(url)
+        entry = self.backend.get(key)
+        fresh = entry is not None and not revalidate and time.time() - entry['fetched_at'] < self.ttl
+        if fresh:
+            self._count('hits')
+        return key, entry, fresh
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry is not None:
+            if entry['headers'].get('ETag'):
+                headers['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+        return headers
+
+    def mark_revalidated(self, key, entry):
+        """Record a 304 for a stored entry and return it as a fresh page."""
+        self._count('revalidated')
+        entry['fetched_at'] = time.time()
+        self.backend.put(key, entry)
+        return CachedPage(key, entry, from_cache=True, not_modified=True)
+
+    def store(self, key, url, status, headers, content):
+        """Turn a successful response into a page, caching it unless it is marked no-store or too big."""
+        self._count('misses')
+        metrics.record_page(url, len(content))
+        entry = {
+            'url': url,
+            'status': status,
+            'headers': {name: headers[name] for name in STORED_HEADERS if name in headers},
+            'content': content,
+            'fetched_at': time.time(),
+        }
+        cache_control = headers.get('Cache-Control', '').lower()
+        cached = 'no-store' not in cache_control and len(content) <= self.max_bytes
+        if cached:
+            self.backend.put(key, entry)
+        return CachedPage(key, entry, cached=cached)
+
+    def fetch(self, url, revalidate=False, **kwargs):
+        """Return a CachedPage for ``url``, fetching or revalidating it if needed.
+
+        Network and HTTP errors propagate as ``requests`` exceptions and are never cached.
+        """
+        key, entry, fresh = self.lookup(url, revalidate)
+        if fresh:
+            return CachedPage(key, entry, from_cache=True)
+
+        headers = {**(kwargs.pop('headers', None) or {}), **self.conditional_headers(entry)}
+        with metrics.span('fetch', url):
+            response = http_client.get(url, headers=headers, **kwargs)
+        if entry is not None and response.status_code == 304:
+            return self.mark_revalidated(key, entry)
+
+        response.raise_for_status()
+        return self.store(key, response.url, response.status_code, response.headers, response.content)
+
+    def invalidate(self, url):
+        self.backend.delete(normalize_url(url))
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+
+def _build_backend():
+    if PAGE_CACHE_BACKEND == 'sqlite':
+        return SQLiteBackend()
+    return MemoryBackend()
+
+
+_parsed = LRUTTLCache(PAGE_CACHE_PARSED_SIZE, PAGE_CACHE_TTL, PAGE_CACHE_PARSED_MAX_BYTES)
+page_cache = PageCache(_build_backend())
@@ -0,0 +1,68 @@
+import os
+import logging
+from functools import lru_cache
+from bs4 import BeautifulSoup, SoupStrainer
+
+logger = logging.getLogger(__name__)
+
+# One of: html.parser, lxml, selectolax
+HTML_PARSER = os.environ.get('HTML_PARSER', 'html.parser')
+
+try:
+    import lxml  # noqa: F401
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+    HAS_SELECTOLAX = True
+except ImportError:
+    HAS_SELECTOLAX = False
+
+
+@lru_cache(maxsize=None)
+def resolve_backend(backend=None):
+    """Return the configured parser backend, falling back to html.parser if it is not installed."""
+    backend = backend or HTML_PARSER
+    if backend == 'lxml' and not HAS_LXML:
+        logger.warning("lxml is not installed, using html.parser")
+        return 'html.parser'
+    if backend == 'selectolax' and not HAS_SELECTOLAX:
+        logger.warning("selectolax is not installed, using html.parser")
+        return 'html.parser'
+    if backend not in ('html.parser', 'lxml', 'selectolax'):
+        logger.warning(f"Unknown HTML parser '{backend}', using html.parser")
+        return 'html.parser'
+    return backend
+
+
+def _outermost_html(markup, only):
+    # Let selectolax find the wanted elements and hand only those fragments to BeautifulSoup.
+    # Matches nested inside another match are already part of its outer HTML.
+    tree = LexborHTMLParser(markup)
+    nodes = tree.css(', '.join(only))
+    matched = {node.mem_id for node in nodes}
+    fragments = []
+    for node in nodes:
+        parent = node.parent
+        while parent is not None and parent.mem_id not in matched:
+            parent = parent.parent
+        if parent is None:
+            fragments.append(node.html)
+    return ''.join(fragments)
+
+
+def parse(markup, only=None, backend=None):
+    """Parse HTML into a BeautifulSoup tree.
+
+    ``only`` is a tuple of tag names the caller needs; everything outside those
+    elements is skipped while parsing.
+    """
+    backend = resolve_backend(backend)
+    if backend == 'selectolax':
+        if only:
+            return BeautifulSoup(_outermost_html(markup, only), 'html.parser')
+        backend = 'lxml' if HAS_LXML else 'html.parser'
+    parse_only = SoupStrainer(list(only)) if only else None
+    return BeautifulSoup(markup, backend, parse_only=parse_only)
@@ -0,0 +1,135 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import http_client
+from host_limiter import asset_limiter
+
+logger = logging.getLogger(__name__)
+
+PDF_MAX_BYTES = int(os.environ.get('PDF_MAX_BYTES', 50 * 1024 * 1024))
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+# Documents with at least this many selected pages are split across the process pool
+PDF_PARALLEL_PAGES = int(os.environ.get('PDF_PARALLEL_PAGES', 40))
+PDF_CHUNK_PAGES = int(os.environ.get('PDF_CHUNK_PAGES', 10))
+
+# pdfplumber pulls in pdfminer, so it is imported inside the functions that open a PDF
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+        return _pool
+
+
+def download_pdf(pdf_url, max_bytes=PDF_MAX_BYTES):
+    """Stream a PDF into a private temp file and return its path."""
+    fd, path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f, http_client.get(pdf_url, stream=True, limiter=asset_limiter) as response:
+            response.raise_for_status()
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise ValueError(f"PDF is {declared} bytes, limit is {max_bytes}")
+            size = 0
+            for chunk in response.iter_content(256 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"PDF exceeds {max_bytes} bytes")
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def parse_page_ranges(spec, page_count):
+    """Turn a spec like ``"1-3,7,10-"`` into sorted 0-based page indexes."""
+    if not spec:
+        return list(range(page_count))
+    pages = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            start = int(start) if start.strip() else 1
+            end = int(end) if end.strip() else page_count
+        else:
+            start = end = int(part)
+        if start < 1 or end < start:
+            raise ValueError(f"Invalid page range '{part}'")
+        pages.update(range(start - 1, min(end, page_count)))
+    return sorted(pages)
+
+
+def read_pdf_info(path):
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        metadata = pdf.metadata or {}
+        return {
+            'title': metadata.get('Title', 'N/A'),
+            'author': metadata.get('Author', 'N/A'),
+            'page_count': len(pdf.pages),
+        }
+
+
+def _extract_pages(path, page_indexes):
+    # Runs in worker processes as well, so it reopens the file itself
+    import pdfplumber
+    results = []
+    with pdfplumber.open(path) as pdf:
+        for index in page_indexes:
+            page = pdf.pages[index]
+            results.append((index + 1, page.extract_text() or ""))
+            page.close()
+    return results
+
+
+def iter_page_text(path, page_indexes, workers=PDF_WORKERS):
+    """Yield ``(page_number, text)`` in page order without keeping earlier pages around."""
+    if workers > 1 and len(page_indexes) >= PDF_PARALLEL_PAGES:
+        chunks = [page_indexes[i:i + PDF_CHUNK_PAGES] for i in range(0, len(page_indexes), PDF_CHUNK_PAGES)]
+        for results in _process_pool().map(_extract_pages, [path] * len(chunks), chunks):
+            yield from results
+        return
+    import pdfplumber
+    with pdfplumber.open(path) as pdf:
+        for index in page_indexes:
+            page = pdf.pages[index]
+            yield index + 1, page.extract_text() or ""
+            # Drop the parsed layout of pages we are done with
+            page.close()
+
+
+def remove_pdf(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def stream_pdf_ndjson(path, page_spec=None):
+    """Yield NDJSON lines: one metadata line, one line per page, then a final status line.
+
+    The caller removes ``path`` afterwards, since a response closed before streaming
+    starts never runs this generator's cleanup.
+    """
+    try:
+        info = read_pdf_info(path)
+        page_indexes = parse_page_ranges(page_spec, info['page_count'])
+        yield json.dumps({'type': 'meta', **info, 'pages': [i + 1 for i in page_indexes]}) + '\n'
+        for number, text in iter_page_text(path, page_indexes):
+            yield json.dumps({'type': 'page', 'page': number, 'text': text}) + '\n'
+        yield json.dumps({'type': 'end', 'success': True}) + '\n'
+    except Exception as e:
+        logger.error(f"Error extracting PDF text: {e}")
+        yield json.dumps({'type': 'end', 'success': False, 'error': str(e)}) + '\n'
@@ -0,0 +1,79 @@
+import os
+import time
+import sqlite3
+import logging
+from urllib.parse import urlsplit
+from page_cache import LRUTTLCache
+from sqlite_util import connect
+
+logger = logging.getLogger(__name__)
+
+RENDER_MEMORY_DB = os.environ.get('RENDER_MEMORY_DB', 'render_memory.sqlite3')
+# How long a verdict is trusted before a host gets a browser again
+RENDER_MEMORY_TTL = float(os.environ.get('RENDER_MEMORY_TTL', 7 * 86400))
+
+STATIC = 'static'
+DYNAMIC = 'dynamic'
+
+
+class RenderMemory:
+    """Remembers, per host and data type, whether a browser ever found more than a plain fetch.
+
+    A host is ``dynamic`` once the browser fallback returned data the static page lacked,
+    and ``static`` when static scrapes succeed or the browser found nothing extra. A
+    ``dynamic`` verdict is only replaced once it expires, so hosts that render some
+    pages with JavaScript keep their browser fallback.
+    """
+
+    def __init__(self, path=RENDER_MEMORY_DB, ttl=RENDER_MEMORY_TTL):
+        self.path = path
+        self.ttl = ttl
+        # Verdicts change rarely, so most lookups never reach SQLite
+        self._cache = LRUTTLCache(4096, 60)
+        with connect(self.path) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS render_modes ('
+                'host TEXT, data_type TEXT, mode TEXT, checked_at REAL, PRIMARY KEY (host, data_type))'
+            )
+
+    @staticmethod
+    def _key(url, data_type):
+        return ((urlsplit(url).hostname or '').lower(), data_type)
+
+    def mode(self, url, data_type):
+        """Return ``'static'``, ``'dynamic'`` or None when the host is unknown or its verdict expired."""
+        key = self._key(url, data_type)
+        cached = self._cache.get(key)
+        if cached is None:
+            try:
+                row = connect(self.path).execute(
+                    'SELECT mode, checked_at FROM render_modes WHERE host = ? AND data_type = ?', key).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Failed to read render mode for {key[0]}: {e}")
+                return None
+            cached = (row[0], row[1]) if row else (None, 0)
+            self._cache.set(key, cached)
+        mode, checked_at = cached
+        if mode is None or time.time() - checked_at > self.ttl:
+            return None
+        return mode
+
+    def record(self, url, data_type, mode):
+        current = self.mode(url, data_type)
+        if current == mode or (mode == STATIC and current == DYNAMIC):
+            return
+        key = self._key(url, data_type)
+        now = time.time()
+        try:
+            with connect(self.path) as conn:
+                conn.execute('INSERT OR REPLACE INTO render_modes (host, data_type, mode, checked_at) VALUES (?, ?, ?, ?)',
+                             (*key, mode, now))
+        except sqlite3.Error as e:
+            logger.error(f"Failed to record render mode for {key[0]}: {e}")
+            return
+        self._cache.set(key, (mode, now))
+        logger.info(f"{key[0]} marked {mode} for {data_type} scrapes")
+
+    def needs_browser(self, url, data_type):
+        """False when the host is known to serve everything statically."""
+        return self.mode(url, data_type) != STATIC
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import sqlite3
+import logging
+import threading
+from sqlite_util import connect
+
+logger = logging.getLogger(__name__)
+
+RESULT_DB = os.environ.get('RESULT_DB', 'results.sqlite3')
+RESULT_RETENTION_SECONDS = float(os.environ.get('RESULT_RETENTION_SECONDS', 30 * 86400))
+# Oldest results beyond this many are dropped, whatever their age (0 for no cap)
+RESULT_MAX_ROWS = int(os.environ.get('RESULT_MAX_ROWS', 10000))
+# Retention is enforced again after this many saves, not only at startup
+RESULT_PURGE_EVERY = int(os.environ.get('RESULT_PURGE_EVERY', 100))
+
+_SUMMARY_COLUMNS = 'id, url, data_type, options, success, total, raw_bytes, stored_bytes, created_at'
+
+
+def new_result_id():
+    return uuid.uuid4().hex
+
+
+def encode_cursor(row):
+    return f"{row['created_at']!r}:{row['id']}"
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, id)`` from a cursor made by encode_cursor; ValueError if malformed."""
+    created_at, _, result_id = cursor.partition(':')
+    if not result_id:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return float(created_at), result_id
+
+
+class ResultStore:
+    """Scrape results kept server-side as zlib-compressed JSON.
+
+    Rows are indexed by URL, data type and time, so history queries and re-exports
+    never touch the result blobs until one is asked for. Results older than
+    ``retention`` seconds, and the oldest beyond ``max_rows``, are purged.
+    """
+
+    def __init__(self, path=RESULT_DB, retention=RESULT_RETENTION_SECONDS, max_rows=RESULT_MAX_ROWS,
+                 purge_every=RESULT_PURGE_EVERY):
+        self.path = path
+        self.retention = retention
+        self.max_rows = max_rows
+        self.purge_every = purge_every
+        self._saves = 0
+        self._lock = threading.Lock()
+        with connect(self.path) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'id TEXT PRIMARY KEY, url TEXT, data_type TEXT, options TEXT, success INTEGER, '
+                'total INTEGER, result BLOB, raw_bytes INTEGER, stored_bytes INTEGER, created_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS results_created ON results (created_at, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_url ON results (url, created_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_data_type ON results (data_type, created_at)')
+
+    def save(self, url, data_type, options, result, result_id=None):
+        """Store a /scrape payload and return its id."""
+        result_id = result_id or new_result_id()
+        raw = json.dumps(result, separators=(',', ':')).encode()
+        blob = zlib.compress(raw, 6)
+        total = result.get('total')
+        if total is None and result.get('success'):
+            total = len(result.get('tables') or ()) or 1
+        with connect(self.path) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO results (id, url, data_type, options, success, total, result, '
+                'raw_bytes, stored_bytes, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (result_id, url, data_type, json.dumps(options or {}), int(bool(result.get('success'))),
+                 total or 0, blob, len(raw), len(blob), time.time()),
+            )
+        with self._lock:
+            self._saves += 1
+            due = self.purge_every and self._saves % self.purge_every == 0
+        if due:
+            self.purge()
+        return result_id
+
+    @staticmethod
+    def _decode(row):
+        entry = dict(row)
+        entry['success'] = bool(entry['success'])
+        entry['options'] = json.loads(entry['options'] or '{}')
+        if 'result' in entry:
+            entry['result'] = json.loads(zlib.decompress(entry['result']))
+        return entry
+
+    def get(self, result_id):
+        row = connect(self.path).execute('SELECT * FROM results WHERE id = ?', (result_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def query(self, url=None, data_type=None, since=None, until=None, cursor=None, limit=50, ids=None):
+        """Return ``(summaries, next_cursor)``, newest first and without the result bodies.
+
+        Pages are keyed on ``(created_at, id)``, so a page stays stable while new
+        results are stored; ``next_cursor`` is None on the last page. ``ids``, when
+        given, limits the results to those ids.
+        """
+        clauses, params = [], []
+        if ids is not None:
+            ids = list(ids)
+            if not ids:
+                return [], None
+            clauses.append(f"id IN ({', '.join('?' * len(ids))})")
+            params += ids
+        for column, value in (('url', url), ('data_type', data_type)):
+            if value:
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if since is not None:
+            clauses.append('created_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('created_at < ?')
+            params.append(until)
+        if cursor:
+            created_at, result_id = decode_cursor(cursor)
+            clauses.append('(created_at < ? OR (created_at = ? AND id < ?))')
+            params += [created_at, created_at, result_id]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = connect(self.path).execute(
+            f'SELECT {_SUMMARY_COLUMNS} FROM results {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+            (*params, limit + 1)).fetchall()
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return [self._decode(row) for row in rows[:limit]], next_cursor
+
+    def delete(self, result_id):
+        with connect(self.path) as conn:
+            return conn.execute('DELETE FROM results WHERE id = ?', (result_id,)).rowcount == 1
+
+    def purge(self):
+        try:
+            with connect(self.path) as conn:
+                if self.retention:
+                    conn.execute('DELETE FROM results WHERE created_at < ?', (time.time() - self.retention,))
+                if self.max_rows:
+                    conn.execute(
+                        'DELETE FROM results WHERE created_at < ('
+                        'SELECT created_at FROM results ORDER BY created_at DESC LIMIT 1 OFFSET ?)',
+                        (self.max_rows - 1,))
+        except sqlite3.Error as e:
+            logger.error(f"Failed to purge stored results: {e}")
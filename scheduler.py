@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from page_cache import page_cache
+from extractors import STATIC_EXTRACTORS, extract_page
+from sqlite_util import connect
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_DB = os.environ.get('SCHEDULE_DB', 'schedules.sqlite3')
+SCHEDULE_WORKERS = int(os.environ.get('SCHEDULE_WORKERS', 4))
+SCHEDULE_MIN_INTERVAL = float(os.environ.get('SCHEDULE_MIN_INTERVAL', 60))
+SCHEDULE_CHANGE_RETENTION_SECONDS = float(os.environ.get('SCHEDULE_CHANGE_RETENTION_SECONDS', 30 * 86400))
+
+# Static extractors that find nothing on these pages are retried through the browser-backed scraper
+BROWSER_FALLBACK_TYPES = frozenset({'image', 'pdf'})
+
+# How items of each list result are matched between runs
+ITEM_KEYS = {
+    'news': lambda item: item,
+    'image': lambda item: item[0],
+    'video': lambda item: item[0],
+    'pdf': lambda item: item['url'],
+    # Listing links carry tracking parameters that change on every search
+    'ebay': lambda item: item['link'].split('?')[0],
+}
+
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def normalize_result(data_type, data):
+    """Turn a scraper result into the plain JSON structure snapshots are stored and compared as."""
+    if not data:
+        return {} if data_type in ('movie', 'book') else []
+    if isinstance(data, dict) and data_type == 'image':
+        data = list(data.items())
+    return json.loads(json.dumps(data))
+
+
+def _diff_rows(before, after):
+    old_rows = Counter(map(tuple, before))
+    new_rows = Counter(map(tuple, after))
+    added = list((new_rows - old_rows).elements())
+    removed_by_key = {}
+    for row in (old_rows - new_rows).elements():
+        removed_by_key.setdefault(row[:1], []).append(row)
+    # An added and a removed row with the same first cell are one changed row
+    changed = []
+    new = []
+    for row in added:
+        match = removed_by_key.get(row[:1])
+        if match:
+            changed.append({'before': list(match.pop(0)), 'after': list(row)})
+        else:
+            new.append(list(row))
+    removed = [list(row) for rows in removed_by_key.values() for row in rows]
+    return {name: value for name, value in (('added', new), ('removed', removed), ('changed', changed)) if value}
+
+
+def diff_results(data_type, old, new):
+    """Describe what changed between two normalized results; an empty dict means nothing did."""
+    if data_type == 'table':
+        old, new = old or [], new or []
+        tables = []
+        for index in range(max(len(old), len(new))):
+            rows = _diff_rows(old[index] if index < len(old) else [], new[index] if index < len(new) else [])
+            if rows:
+                tables.append({'table': index, **rows})
+        return {'tables': tables} if tables else {}
+    if data_type in ('movie', 'book'):
+        old, new = old or {}, new or {}
+        changed = {field: {'before': old.get(field), 'after': new.get(field)}
+                   for field in dict.fromkeys([*old, *new]) if old.get(field) != new.get(field)}
+        return {'changed': changed} if changed else {}
+    key = ITEM_KEYS[data_type]
+    old_items = {key(item): item for item in old or []}
+    new_items = {key(item): item for item in new or []}
+    added = [item for item_key, item in new_items.items() if item_key not in old_items]
+    removed = [item for item_key, item in old_items.items() if item_key not in new_items]
+    changed = [{'before': old_items[item_key], 'after': item} for item_key, item in new_items.items()
+               if item_key in old_items and old_items[item_key] != item]
+    return {name: value for name, value in (('added', added), ('removed', removed), ('changed', changed)) if value}
+
+
+class ScheduleStore:
+    """Recurring scrapes with the last result of each, and the changes found between runs."""
+
+    def __init__(self, path=SCHEDULE_DB):
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS schedules ('
+                'id TEXT PRIMARY KEY, data_type TEXT, url TEXT, options TEXT, interval REAL, webhook TEXT, '
+                'next_run_at REAL, last_run_at REAL, last_status TEXT, last_error TEXT, page_hash TEXT, '
+                'result_hash TEXT, snapshot TEXT, runs INTEGER DEFAULT 0, changes INTEGER DEFAULT 0, '
+                'created_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS schedules_due ON schedules (next_run_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS changes ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, schedule_id TEXT, detected_at REAL, initial INTEGER, '
+                'diff TEXT)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS changes_schedule ON changes (schedule_id, id)')
+
+    def create(self, config):
+        schedule_id = uuid.uuid4().hex
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute(
+                'INSERT INTO schedules (id, data_type, url, options, interval, webhook, next_run_at, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (schedule_id, config['data_type'], config['url'], json.dumps(config['options']),
+                 config['interval'], config['webhook'], now, now),
+            )
+        return schedule_id
+
+    def claim_due(self, limit):
+        """Push the next run of up to ``limit`` due schedules one interval ahead and return them.
+
+        Moving ``next_run_at`` is the claim, so each run is taken by one process only.
+        """
+        conn = connect(self.path)
+        now = time.time()
+        rows = conn.execute('SELECT * FROM schedules WHERE next_run_at <= ? ORDER BY next_run_at LIMIT ?',
+                            (now, limit)).fetchall()
+        claimed = []
+        with conn:
+            for row in rows:
+                cursor = conn.execute('UPDATE schedules SET next_run_at = ? WHERE id = ? AND next_run_at = ?',
+                                      (now + row['interval'], row['id'], row['next_run_at']))
+                if cursor.rowcount == 1:
+                    claimed.append(self._decode(row))
+        return claimed
+
+    def next_due(self):
+        return connect(self.path).execute('SELECT MIN(next_run_at) FROM schedules').fetchone()[0]
+
+    def record_run(self, schedule_id, status, page_hash=None, result_hash=None, snapshot=None, error=None):
+        """Store the outcome of a run; hashes and snapshot are only replaced when given."""
+        with connect(self.path) as conn:
+            conn.execute(
+                'UPDATE schedules SET last_run_at = ?, last_status = ?, last_error = ?, runs = runs + 1, '
+                'page_hash = COALESCE(?, page_hash), result_hash = COALESCE(?, result_hash), '
+                'snapshot = COALESCE(?, snapshot) WHERE id = ?',
+                (time.time(), status, error, page_hash, result_hash,
+                 json.dumps(snapshot) if snapshot is not None else None, schedule_id),
+            )
+
+    def add_change(self, schedule_id, diff, initial):
+        now = time.time()
+        with connect(self.path) as conn:
+            cursor = conn.execute('INSERT INTO changes (schedule_id, detected_at, initial, diff) VALUES (?, ?, ?, ?)',
+                                  (schedule_id, now, int(initial), json.dumps(diff)))
+            conn.execute('UPDATE schedules SET changes = changes + 1 WHERE id = ?', (schedule_id,))
+        return {'change_id': cursor.lastrowid, 'detected_at': now, 'initial': initial, 'diff': diff}
+
+    @staticmethod
+    def _decode(row):
+        schedule = dict(row)
+        schedule['options'] = json.loads(schedule['options'] or '{}')
+        schedule['snapshot'] = json.loads(schedule['snapshot']) if schedule['snapshot'] else None
+        return schedule
+
+    def get(self, schedule_id):
+        row = connect(self.path).execute('SELECT * FROM schedules WHERE id = ?', (schedule_id,)).fetchone()
+        return self._decode(row) if row is not None else None
+
+    def list(self):
+        rows = connect(self.path).execute(
+            'SELECT id, data_type, url, interval, webhook, next_run_at, last_run_at, last_status, runs, changes '
+            'FROM schedules ORDER BY created_at').fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, schedule_id):
+        with connect(self.path) as conn:
+            cursor = conn.execute('DELETE FROM schedules WHERE id = ?', (schedule_id,))
+            conn.execute('DELETE FROM changes WHERE schedule_id = ?', (schedule_id,))
+        return cursor.rowcount == 1
+
+    def changes(self, schedule_id, after=0, limit=100):
+        rows = connect(self.path).execute(
+            'SELECT id, detected_at, initial, diff FROM changes WHERE schedule_id = ? AND id > ? ORDER BY id LIMIT ?',
+            (schedule_id, after, limit),
+        ).fetchall()
+        return [{'change_id': row['id'], 'detected_at': row['detected_at'], 'initial': bool(row['initial']),
+                 'diff': json.loads(row['diff'])} for row in rows]
+
+    def purge(self, older_than):
+        with connect(self.path) as conn:
+            conn.execute('DELETE FROM changes WHERE detected_at < ?', (time.time() - older_than,))
+
+
+class Scheduler:
+    """Runs recurring scrapes and reports only what changed since the previous run.
+
+    Page-based data types are fetched with a conditional request through the page cache;
+    a body hashing the same as last time (usually after a 304) ends the run before parsing. Otherwise
+    the result is hashed and, when it differs, diffed against the stored snapshot. Each
+    change is stored and, if the schedule has a webhook, handed to ``deliver(url, payload)``.
+    """
+
+    def __init__(self, runner, data_types, deliver=None, store=None, workers=SCHEDULE_WORKERS):
+        self.runner = runner
+        self.data_types = data_types
+        self.deliver = deliver
+        self.store = store or ScheduleStore()
+        self.workers = workers
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._executor = None
+
+    def build_config(self, payload):
+        """Validate a schedule request and fill in defaults; raises ValueError."""
+        data_type = payload.get('data_type')
+        url = payload.get('url')
+        if data_type not in self.data_types:
+            raise ValueError(f"data_type must be one of {', '.join(sorted(self.data_types))}")
+        if not isinstance(url, str) or not url.strip():
+            raise ValueError('A url (or search term) is required')
+        if data_type in STATIC_EXTRACTORS and urlsplit(url).scheme not in ('http', 'https'):
+            raise ValueError('A http(s) url is required')
+        webhook = payload.get('webhook') or None
+        if webhook is not None:
+            parts = urlsplit(webhook) if isinstance(webhook, str) else None
+            if parts is None or parts.scheme not in ('http', 'https') or not parts.hostname:
+                raise ValueError('webhook must be a http(s) URL')
+        options = payload.get('options') or {}
+        if not isinstance(options, dict):
+            raise ValueError('options must be an object')
+        return {
+            'data_type': data_type,
+            'url': url.strip(),
+            'options': options,
+            'interval': max(float(payload.get('interval', SCHEDULE_MIN_INTERVAL)), SCHEDULE_MIN_INTERVAL),
+            'webhook': webhook,
+        }
+
+    def add(self, payload):
+        schedule_id = self.store.create(self.build_config(payload))
+        self._wake.set()
+        return schedule_id
+
+    def start(self):
+        try:
+            self.store.purge(SCHEDULE_CHANGE_RETENTION_SECONDS)
+        except sqlite3.Error as e:
+            logger.error(f"Failed to purge schedule changes: {e}")
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='schedule')
+        threading.Thread(target=self._dispatch, name='schedule-dispatch', daemon=True).start()
+
+    def _dispatch(self):
+        while True:
+            self._wake.clear()
+            try:
+                wait = self._dispatch_due()
+            except sqlite3.Error as e:
+                logger.error(f"Schedule dispatch failed: {e}")
+                wait = 5
+            self._wake.wait(wait)
+
+    def _dispatch_due(self):
+        with self._lock:
+            free = self.workers - self._in_flight
+        if free > 0:
+            for schedule in self.store.claim_due(free):
+                with self._lock:
+                    self._in_flight += 1
+                self._executor.submit(self._run, schedule)
+        next_due = self.store.next_due()
+        return 30 if next_due is None else min(30, max(0.05, next_due - time.time()))
+
+    def _run(self, schedule):
+        try:
+            with metrics.scrape_scope(schedule['data_type'], schedule['url']):
+                self.run(schedule)
+        except Exception as e:
+            logger.error(f"Scheduled {schedule['data_type']} scrape of {schedule['url']} failed: {e}")
+            try:
+                self.store.record_run(schedule['id'], 'failed', error=str(e))
+            except sqlite3.Error:
+                pass
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._wake.set()
+
+    def run(self, schedule):
+        """Check one schedule now and return ``(status, change)``; ``change`` is None unless
+        the result differs from the previous run."""
+        data_type, url, options = schedule['data_type'], schedule['url'], schedule['options']
+        previous = schedule['snapshot']
+        page_hash = None
+        if data_type in STATIC_EXTRACTORS:
+            page = page_cache.fetch(url, revalidate=True)
+            # A 304 only says the cached copy is current; another schedule may have refreshed
+            # that copy since this one last ran, so the body hash decides
+            page_hash = _hash(page.content)
+            if previous is not None and page_hash == schedule['page_hash']:
+                status = 'not_modified' if page.not_modified else 'unchanged'
+                self.store.record_run(schedule['id'], status)
+                return status, None
+            data = extract_page(data_type, page.content, page.url or url, options)
+            if not data and data_type in BROWSER_FALLBACK_TYPES:
+                data = self.runner(data_type, url, options)
+        else:
+            data = self.runner(data_type, url, options)
+            if isinstance(data, dict) and 'error' in data:
+                raise LookupError(data['error'])
+
+        snapshot = normalize_result(data_type, data)
+        result_hash = _hash(json.dumps(snapshot, sort_keys=True).encode())
+        if previous is not None and result_hash == schedule['result_hash']:
+            self.store.record_run(schedule['id'], 'unchanged', page_hash=page_hash)
+            return 'unchanged', None
+        diff = diff_results(data_type, previous, snapshot)
+        # A result that only changed order is stored, but is not reported as a change
+        self.store.record_run(schedule['id'], 'changed' if diff else 'unchanged', page_hash, result_hash, snapshot)
+        if not diff:
+            return 'unchanged', None
+        change = self.store.add_change(schedule['id'], diff, previous is None)
+        if schedule['webhook'] and self.deliver is not None:
+            self.deliver(schedule['webhook'], {'schedule_id': schedule['id'], 'data_type': data_type, 'url': url,
+                                               **change})
+        return 'changed', change
+
+    def get(self, schedule_id):
+        schedule = self.store.get(schedule_id)
+        if schedule is not None:
+            schedule.pop('snapshot')
+        return schedule
+
+    def list(self):
+        return self.store.list()
+
+    def delete(self, schedule_id):
+        return self.store.delete(schedule_id)
+
+    def changes(self, schedule_id, after=0, limit=100):
+        return self.store.changes(schedule_id, after, limit)
@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import threading
+
+_local = threading.local()
+
+
+def connect(path):
+    """Return this thread's connection to the SQLite file at ``path``.
+
+    Connections are opened in WAL mode with sqlite3.Row rows and kept per thread and
+    path. A connection opened before a fork (e.g. by a preloading gunicorn master) is
+    never reused by the child.
+    """
+    if getattr(_local, 'pid', None) != os.getpid():
+        _local.conns = {}
+        _local.pid = os.getpid()
+    conn = _local.conns.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.row_factory = sqlite3.Row
+        _local.conns[path] = conn
+    return conn
+
+
+def pid_alive(pid):
+    """False once no process with ``pid`` exists, e.g. a worker that died holding a lease."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,179 @@
+CELL_TAGS = ('td', 'th')
+# The largest spans browsers honour; also bounds the grid a malicious page can request
+MAX_COLSPAN = 1000
+MAX_ROWSPAN = 65534
+
+
+def _span(cell, name, limit):
+    try:
+        value = int(cell.get(name, 1))
+    except (TypeError, ValueError):
+        return 1
+    # rowspan="0" spans the rest of the table
+    if value == 0 and name == 'rowspan':
+        return limit
+    return min(max(value, 1), limit)
+
+
+def _own_rows(table):
+    """Yield ``(row, cells)`` for the table's <tr> elements in a single walk over its tree.
+
+    Tables nested in its cells are skipped, and cells are found at any depth under
+    their row, since html.parser nests unclosed <td> tags inside each other.
+    """
+    row = None
+    cells = []
+    stack = [iter(table.contents)]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            continue
+        name = node.name
+        if name is None or name == 'table':
+            continue
+        if name == 'tr':
+            if row is not None:
+                yield row, cells
+            row, cells = node, []
+        elif name in CELL_TAGS and row is not None:
+            cells.append(node)
+        if node.contents:
+            stack.append(iter(node.contents))
+    if row is not None:
+        yield row, cells
+
+
+def iter_grid(table):
+    """Yield ``(is_header, cells)`` for each row of a table, one pass per row.
+
+    Cells spanning several columns are repeated in each of them and cells spanning
+    several rows are carried down into the rows below, so every value sits in the
+    column it belongs to. A row is a header row when it sits in <thead> or holds
+    only <th> cells.
+    """
+    # column -> [rows left, text] for cells spanning down from earlier rows
+    carried = {}
+    for row, cells in _own_rows(table):
+        values = []
+        started = {}
+        header = bool(cells) and all(cell.name == 'th' for cell in cells)
+        for cell in cells:
+            while len(values) in carried:
+                values.append(carried[len(values)][1])
+            text = cell.text.strip()
+            rowspan = _span(cell, 'rowspan', MAX_ROWSPAN)
+            for _ in range(_span(cell, 'colspan', MAX_COLSPAN)):
+                if rowspan > 1:
+                    started[len(values)] = [rowspan - 1, text]
+                values.append(text)
+        for column in sorted(column for column in carried if column >= len(values)):
+            values.extend([''] * (column - len(values)))
+            values.append(carried[column][1])
+        for column in list(carried):
+            carried[column][0] -= 1
+            if not carried[column][0]:
+                del carried[column]
+        carried.update(started)
+        if cells:
+            yield header or row.parent.name == 'thead', values
+
+
+def read_table(table):
+    """Return ``{'header', 'rows'}`` for a table, or None when it has no data rows.
+
+    ``header`` is the last header row before the first data row, as in the old
+    <th>-only detection; header rows repeated further down are skipped.
+    """
+    header = None
+    rows = []
+    for is_header, values in iter_grid(table):
+        if not is_header:
+            rows.append(values)
+        elif not rows:
+            header = values
+    return {'header': header, 'rows': rows} if rows else None
+
+
+def _has_data(table):
+    return any(not is_header for is_header, _ in iter_grid(table))
+
+
+def _candidates(soup, selector=None):
+    if selector is None:
+        yield from soup.find_all('table')
+        return
+    seen = set()
+    for element in soup.select(selector):
+        for table in [element] if element.name == 'table' else element.find_all('table'):
+            if id(table) not in seen:
+                seen.add(id(table))
+                yield table
+
+
+def iter_tables(soup, with_headers=False, selector=None, indexes=None):
+    """Yield each table with data rows; with ``with_headers`` each table is a dict with
+    ``header`` (or None) and ``rows``.
+
+    ``selector`` keeps the tables matching a CSS selector, or inside an element that
+    does. ``indexes`` keeps the tables at those 0-based positions among the tables
+    with data; the rest are only read up to their first data row, and the walk stops
+    after the last wanted index.
+    """
+    wanted = None if indexes is None else set(indexes)
+    last = max(wanted) if wanted else -1
+    index = 0
+    for tag in _candidates(soup, selector):
+        if wanted is not None:
+            if index > last:
+                return
+            if index not in wanted:
+                index += _has_data(tag)
+                continue
+        table = read_table(tag)
+        if table is None:
+            continue
+        index += 1
+        yield table if with_headers else table['rows']
+
+
+def extract_tables(soup, with_headers=False, selector=None, indexes=None):
+    return list(iter_tables(soup, with_headers, selector, indexes))
+
+
+def parse_indexes(value):
+    """Table indexes from ``"0,2"``, an int or a list of either; None when ``value`` is empty."""
+    if value is None or value == '' or value == []:
+        return None
+    parts = value if isinstance(value, (list, tuple)) else [value]
+    indexes = set()
+    for part in parts:
+        for item in str(part).split(','):
+            item = item.strip()
+            if not item:
+                continue
+            if not item.isdigit():
+                raise ValueError(f"Invalid table index '{item}'")
+            indexes.add(int(item))
+    return indexes
+
+
+def to_dataframe(table):
+    """Return a pandas DataFrame for a ``{'header', 'rows'}`` table.
+
+    Columns are named and typed as in the table exports: integer columns become
+    nullable Int64, number columns float64 and blank cells missing values.
+    """
+    # Imported here so pandas stays optional and unloaded unless a DataFrame is asked for
+    import pandas as pd
+    from exports import table_schema
+    names, types = table_schema(table)
+    width = len(names)
+    frame = pd.DataFrame([row + [''] * (width - len(row)) for row in table['rows']], columns=names, dtype=object)
+    for name, column_type in zip(names, types):
+        if column_type == 'string':
+            continue
+        column = frame[name].str.strip().str.replace(',', '', regex=False).replace('', None)
+        column = pd.to_numeric(column, errors='coerce')
+        frame[name] = column.astype('Int64') if column_type == 'integer' else column.astype('float64')
+    return frame